@@ -0,0 +1,7 @@
+'''
+benchmarks for the database and api layers.
+
+run them from the repository root, i.e.
+
+    python -m benchmarks.ranked_stats
+'''
@@ -0,0 +1,61 @@
+'''shared setup for the benchmarks'''
+import time
+
+from sqlalchemy import event
+
+from config import Config
+from ogpp import create_app, db
+
+
+class BenchmarkConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    WTF_CSRF_ENABLED = False
+
+
+def make_app(database_uri='sqlite://'):
+    '''an app with a fresh schema, use it inside app.app_context()'''
+    config = type('Config', (BenchmarkConfig,), {'SQLALCHEMY_DATABASE_URI': database_uri})
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+class QueryCounter:
+    '''counts the sql statements sent to the database while active'''
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+
+def measure(fn, *args, repeat=5):
+    '''
+    run fn a few times in the current app context.
+    returns (result, statements per run, best wall time in seconds)
+    '''
+    best = None
+    for _ in range(repeat):
+        db.session.expire_all()
+        with QueryCounter(db.engine) as counter:
+            start = time.perf_counter()
+            result = fn(*args)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, counter.count, best
+
+
+def report(title, rows):
+    '''rows are (label, statements, seconds)'''
+    print(title)
+    for label, statements, seconds in rows:
+        print('  {:<28} {:>7} statements {:>10.2f} ms'.format(label, statements, seconds * 1000))
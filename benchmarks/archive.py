@@ -0,0 +1,89 @@
+'''
+match archive throughput: appending payloads, random reads by match id
+(memory mapped and plain file reads) and streaming the whole archive back.
+
+payloads are synthetic matches padded out to roughly the size of the real ones.
+
+    python -m benchmarks.archive [matches]
+'''
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from ogpp.game.archive import MatchArchive
+
+from .ingest import make_match
+
+# stats a real participant carries on top of what we store
+EXTRA_STATS = ['totalDamageDealt', 'magicDamageDealt', 'physicalDamageDealt', 'trueDamageDealt',
+               'largestCriticalStrike', 'totalDamageDealtToChampions', 'totalHeal',
+               'damageSelfMitigated', 'visionScore', 'timeCCingOthers', 'totalDamageTaken',
+               'wardsPlaced', 'wardsKilled', 'totalMinionsKilled', 'neutralMinionsKilled',
+               'champLevel', 'turretKills', 'inhibitorKills', 'longestTimeSpentLiving'] + \
+              ['perk%d%s' % (perk, var) for perk in range(6) for var in ('', 'Var1', 'Var2', 'Var3')]
+
+
+def make_payload(rng, match_id):
+    match = make_match(rng, match_id)
+    match.update(gameDuration=rng.randint(900, 2700), gameVersion='9.8.270.9450',
+                 platformId='NA1', seasonId=13, mapId=11, gameMode='CLASSIC')
+    for participant in match['participants']:
+        participant['stats'].update((stat, rng.randint(0, 50000)) for stat in EXTRA_STATS)
+        participant['timeline'] = {
+            delta: {'0-10': rng.random() * 10, '10-20': rng.random() * 10}
+            for delta in ('creepsPerMinDeltas', 'xpPerMinDeltas', 'goldPerMinDeltas',
+                          'damageTakenPerMinDeltas', 'csDiffPerMinDeltas')
+        }
+    return match
+
+
+def rate(count, seconds):
+    return count / seconds
+
+
+def main(matches=5000):
+    rng = random.Random(17)
+    payloads = [make_payload(rng, 3000000000 + i) for i in range(matches)]
+    raw_bytes = sum(len(json.dumps(p, separators=(',', ':'))) for p in payloads)
+
+    with tempfile.TemporaryDirectory() as directory:
+        archive = MatchArchive(directory)
+        start = time.perf_counter()
+        for payload in payloads:
+            archive.put(payload['gameId'], payload)
+        write_time = time.perf_counter() - start
+        stored_bytes = sum(os.path.getsize(os.path.join(directory, name))
+                           for name in os.listdir(directory))
+
+        lookups = [rng.choice(payloads)['gameId'] for _ in range(matches)]
+        read_times = {}
+        for label, use_mmap in (('random reads, mmap', True), ('random reads, file', False)):
+            reader = MatchArchive(directory, use_mmap=use_mmap)
+            start = time.perf_counter()
+            for match_id in lookups:
+                reader.get(match_id)
+            read_times[label] = time.perf_counter() - start
+            reader.close()
+
+        start = time.perf_counter()
+        streamed = sum(1 for _ in MatchArchive(directory).items())
+        stream_time = time.perf_counter() - start
+        assert streamed == matches
+
+    print('match archive, {} matches, {:.1f} KB of json each'.format(
+        matches, raw_bytes / matches / 1024))
+    print('  {:<24} {:>9.1f} MB on disk, {:.1f}x smaller'.format(
+        'compressed', stored_bytes / 2 ** 20, raw_bytes / stored_bytes))
+    print('  {:<24} {:>9.0f} matches/sec {:>7.1f} MB/sec of json'.format(
+        'writes', rate(matches, write_time), rate(raw_bytes, write_time) / 2 ** 20))
+    for label, seconds in read_times.items():
+        print('  {:<24} {:>9.0f} matches/sec'.format(label, rate(matches, seconds)))
+    print('  {:<24} {:>9.0f} matches/sec {:>7.1f} MB/sec of json'.format(
+        'sequential, decoded', rate(matches, stream_time), rate(raw_bytes, stream_time) / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
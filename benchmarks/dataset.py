@@ -0,0 +1,479 @@
+'''
+a production shaped database to measure the database layer on.
+
+fills Summoner, ByReferenceMatch, Match, Player and SummonerChampionStats
+the way ingest would have after a season of traffic:
+    - champions are picked by popularity, everyone mains a handful of them
+    - queues are mixed like the ones of _QUEUE_TYPE are played, mostly ranked solo
+    - every stored match has a tracked summoner in it, some have several
+      (duo partners, the same high elo players meeting again)
+    - a share of every match history points at matches that were never fetched
+    - tracked summoners play anywhere from a few games to thousands
+summoners and the players they meet are the same ones benchmarks/fake_riot.py
+serves, so the app can be run against both at once(start it with --tracked
+set to the amount of summoners, so it knows whose games it serves).
+
+rows are generated in chunks and written through the database driver
+directly(COPY on postgres), indexes are dropped during the load and
+built again afterwards. the same seed always builds the same data, only
+the summoners' sync times are relative to when it is generated.
+
+    python -m benchmarks.dataset sqlite:////tmp/ogpp.db --summoners 10000 --matches 1000000
+    DATABASE_URL=sqlite:////tmp/ogpp.db flask run
+
+or from a benchmark, into the app's database:
+
+    generate(summoners=1000, matches=20000)
+'''
+import argparse
+import bisect
+import csv
+import io
+import itertools
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from ogpp import db
+from ogpp.game import CHAMPIONS, _QUEUE_TYPE
+from ogpp.models import Summoner, ByReferenceMatch, Match, Player
+from ogpp.helpers.stats import SUMMARY_FIELDS, kda
+from ogpp.helpers.storage import matchref_row
+
+from ._common import make_app
+from .fake_riot import FakeRiot, NEWEST_GAME
+
+# queue -> share of games played in it
+QUEUE_MIX = {
+    'RANKED_SOLO': 45, 'DRAFT_PICK_SR': 15, 'RANKED_FLEX': 12, 'ARAM_HOWLING_ABYSS': 15,
+    'SR_BLIND': 4, 'ARURF': 3, 'AI_INTERMEDIATE': 2, 'COOP AI INTRO': 2,
+    'TWISTED_TREELINE_RANKED': 1, 'TWISTED_TREELINE_BLIND': 1
+}
+QUEUES = [_QUEUE_TYPE[queue] for queue in QUEUE_MIX]
+QUEUE_WEIGHTS = list(itertools.accumulate(QUEUE_MIX.values()))
+ARAM = _QUEUE_TYPE['ARAM_HOWLING_ABYSS']
+
+# a season
+SPAN = 270 * 24 * 60 * 60
+
+LANES = ['TOP', 'JUNGLE', 'MID', 'BOTTOM', 'BOTTOM']
+FLASH, SMITE, SNOWBALL = 4, 11, 32
+SECOND_SPELLS = [14, 12, 7, 3, 21, 6]
+BOOTS = [3006, 3009, 3020, 3047, 3111, 3117, 3158]
+LEGENDARY = [3026, 3031, 3065, 3068, 3071, 3072, 3074, 3078, 3083, 3085, 3087, 3089, 3094,
+             3100, 3115, 3135, 3142, 3143, 3147, 3153, 3157, 3165, 3190, 3222, 3742, 3748]
+TRINKETS = [3340, 3363, 3364]
+
+PLAYER_COLUMNS = ['id', 'game_id', 'name', 'indexed_name', 'current_rank', 'champion_id',
+                  'champion_level', 'win', 'team_id', 'participant_id', 'spell1_id', 'spell2_id',
+                  'item1', 'item2', 'item3', 'item4', 'item5', 'item6', 'item7',
+                  'kills', 'deaths', 'assists', 'damage_dealt', 'damage_healed',
+                  'gold_earned', 'gold_spent']
+MATCH_COLUMNS = ['id', 'match_id', 'game_mode', 'timestamp', 'duration']
+REF_COLUMNS = ['summoner_id', 'match_id', 'lane_played', 'champion_played', 'game_mode',
+               'timestamp'] + SUMMARY_FIELDS + ['duration']
+SUMMONER_COLUMNS = ['id', 'name', 'indexed_name', 'level', 'profile_icon', 'account_id',
+                    'summoner_id', 'highest_rank', 'rank_division', 'position', 'points',
+                    'wins', 'losses', 'ranked_mode',
+                    'profile_synced_at', 'ranks_synced_at', 'matches_synced_at']
+# average age of a summoner's last sync when the data is generated
+SYNC_AGE = 3 * 24 * 3600
+STATS_COLUMNS = ['summoner_id', 'champion_played', 'game_mode', 'games', 'wins',
+                 'kills', 'deaths', 'assists', 'kda_total']
+
+
+class Writer:
+    '''
+    inserts rows(tuples in the order of columns) through the driver's own
+    cursor, skipping the orm and sqlalchemy's per row parameter handling
+    '''
+    def __init__(self, engine):
+        self.dialect = engine.dialect.name
+        self.paramstyle = engine.dialect.paramstyle
+        self.connection = engine.raw_connection()
+        if self.dialect == 'sqlite':
+            # a crash halfway through a load is a reload anyway
+            self.connection.execute('PRAGMA synchronous = OFF')
+
+    def insert(self, table, columns, rows):
+        if not rows:
+            return
+        cursor = self.connection.cursor()
+        if self.dialect == 'postgresql':
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(
+                [r'\N' if value is None else value for value in row] for row in rows
+            )
+            buffer.seek(0)
+            cursor.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL '\\N')".format(
+                table, ', '.join(columns)), buffer)
+        else:
+            cursor.executemany('INSERT INTO {} ({}) VALUES ({})'.format(
+                table, ', '.join(columns), ', '.join(self._placeholders(len(columns)))
+            ), rows)
+        cursor.close()
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        if self.dialect == 'postgresql':
+            # ids were handed out by us, move the sequences past them
+            cursor = self.connection.cursor()
+            for table in ('summoner', 'match', 'player'):
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                    "COALESCE(MAX(id), 1)) FROM {0}".format(table)
+                )
+            cursor.close()
+            self.connection.commit()
+        self.connection.close()
+
+    def _placeholders(self, amount):
+        if self.paramstyle == 'qmark':
+            return ['?'] * amount
+        if self.paramstyle == 'numeric':
+            return [':{}'.format(i + 1) for i in range(amount)]
+        return ['%s'] * amount
+
+
+class Season:
+    '''the summoners, who they play with and what, to build matches out of'''
+    def __init__(self, rng, first_id, summoners, population, duo_partners=3):
+        self.rng = rng
+        self.population = population
+        self.ids = list(range(first_id, first_id + summoners))
+        self.names = {summoner_id: 'summoner{}'.format(summoner_id) for summoner_id in self.ids}
+        # summoner id -> their rank as shown on players, filled in by generate()
+        self.ranks = {}
+        self.stats = StatBank(rng)
+
+        # a few champions are in every other game, most are rare
+        champions = list(CHAMPIONS)
+        rng.shuffle(champions)
+        self.champions = champions
+        self.champion_weights = list(itertools.accumulate(
+            1 / (rank + 1) ** 0.9 for rank in range(len(champions))
+        ))
+
+        self.pools = {}
+        self.activity = []
+        self.friends = {}
+        for summoner_id in self.ids:
+            mains = set()
+            amount = rng.randint(3, 8)
+            while len(mains) < amount:
+                mains.add(self.popular_champion())
+            self.pools[summoner_id] = list(mains)
+            # most play casually, some play all day
+            self.activity.append(rng.lognormvariate(0, 1.2))
+            self.friends[summoner_id] = rng.sample(self.ids, min(len(self.ids), duo_partners))
+        self.activity = list(itertools.accumulate(self.activity))
+
+    def popular_champion(self):
+        return self.champions[self._pick(self.champion_weights)]
+
+    def champion_of(self, summoner_id):
+        if summoner_id is not None and self.rng.random() < 0.7:
+            return self.rng.choice(self.pools[summoner_id])
+        return self.popular_champion()
+
+    def active_summoner(self):
+        return self.ids[self._pick(self.activity)]
+
+    def _pick(self, cum_weights):
+        # what rng.choices(cum_weights=) does, without building a list every time
+        return bisect.bisect(cum_weights, self.rng.random() * cum_weights[-1])
+
+    def stranger(self):
+        return 'player{}'.format(int(self.rng.random() * self.population))
+
+
+class StatBank:
+    '''
+    pre-rolled stat lines and item builds, a player draws one of each with
+    a single random number instead of rolling a dozen distributions
+    '''
+    size = 4096
+
+    def __init__(self, rng):
+        self.rng = rng
+        # (win, support) -> [(kills, deaths, assists, gold, damage, heal per minute, spent, level)]
+        self.lines = {
+            (win, support): [self._line(rng, win, support) for _ in range(self.size)]
+            for win in (True, False) for support in (True, False)
+        }
+        # legendary items finished -> builds of 7 items, the last one a trinket
+        self.builds = {
+            legendary: [self._build(rng, legendary) for _ in range(self.size)]
+            for legendary in range(6)
+        }
+
+    @staticmethod
+    def _line(rng, win, support):
+        return (
+            max(0, int(rng.gauss(7 if win else 4, 4) * (0.4 if support else 1))),
+            max(0, int(rng.gauss(4 if win else 6, 3))),
+            max(0, int(rng.gauss(9 if win else 6, 5) * (1.6 if support else 1))),
+            rng.gauss(380 if win else 340, 60) * (0.7 if support else 1),
+            rng.gauss(700, 200) * (0.5 if support else 1),
+            rng.expovariate(1 / 150),
+            rng.uniform(0.85, 1.0),
+            rng.gauss(0, 1.5)
+        )
+
+    @staticmethod
+    def _build(rng, legendary):
+        items = [rng.choice(BOOTS)] + rng.sample(LEGENDARY, legendary)
+        items += [0] * (6 - len(items))
+        rng.shuffle(items)
+        return tuple(items) + (rng.choice(TRINKETS),)
+
+    def draw(self, minutes, win, support):
+        '''(champion level, items, kills, deaths, assists, damage, heal, gold earned, spent)'''
+        pick = int(self.rng.random() * self.size)
+        kills, deaths, assists, gold, damage, heal, spent, level = self.lines[win, support][pick]
+        gold = int(minutes * gold)
+        return (
+            min(18, max(6, int(minutes / 2.1 + level))),
+            self.builds[min(5, int(minutes / 7))][pick],
+            kills, deaths, assists, int(minutes * damage), int(minutes * heal),
+            gold, int(gold * spent)
+        )
+
+
+def build_match(season, game_id, match_id, timestamp, shared, duo):
+    '''
+    a match with at least one tracked summoner in it.
+    returns (match row, player rows, {tracked summoner id: player row})
+    '''
+    rng = season.rng
+    queue = rng.choices(QUEUES, cum_weights=QUEUE_WEIGHTS)[0]
+    aram = queue == ARAM
+    duration = int(rng.gauss(19 if aram else 29, 4) * 60)
+    minutes = duration / 60
+    blue_wins = rng.random() < 0.5
+
+    # slot -> tracked summoner
+    tracked = {}
+    first = season.active_summoner()
+    first_slot = rng.randrange(10)
+    tracked[first_slot] = first
+    if rng.random() < duo:
+        # queued up with a friend, on the same team
+        friend = rng.choice(season.friends[first])
+        team = range(0, 5) if first_slot < 5 else range(5, 10)
+        free = [slot for slot in team if slot not in tracked]
+        if friend != first:
+            tracked[rng.choice(free)] = friend
+    for slot in range(10):
+        if slot not in tracked and rng.random() < shared:
+            summoner_id = season.active_summoner()
+            if summoner_id not in tracked.values():
+                tracked[slot] = summoner_id
+
+    players = []
+    mine = {}
+    picked = set()
+    names = set(season.names[summoner_id] for summoner_id in tracked.values())
+    for slot in range(10):
+        summoner_id = tracked.get(slot)
+        if summoner_id is not None:
+            name = season.names[summoner_id]
+        else:
+            name = season.stranger()
+            while name in names:
+                name = season.stranger()
+            names.add(name)
+
+        champion = season.champion_of(summoner_id)
+        while champion in picked:
+            champion = season.popular_champion()
+        picked.add(champion)
+
+        team_id = 100 if slot < 5 else 200
+        win = (team_id == 100) == blue_wins
+        lane = LANES[slot % 5]
+        level, items, kills, deaths, assists, damage, heal, gold, spent = season.stats.draw(
+            minutes, win, slot % 5 == 4
+        )
+        if aram:
+            spells = (FLASH, SNOWBALL)
+        elif lane == 'JUNGLE':
+            spells = (FLASH, SMITE)
+        else:
+            spells = (FLASH, SECOND_SPELLS[int(rng.random() * len(SECOND_SPELLS))])
+        rank = season.ranks.get(summoner_id, 'unranked')
+        row = (None, game_id, name, name.lower(), rank, champion, level, win, team_id,
+               slot + 1, spells[0], spells[1], *items, kills, deaths, assists,
+               damage, heal, gold, spent)
+        players.append(row)
+        if summoner_id is not None:
+            mine[summoner_id] = (row, lane)
+
+    match = (game_id, match_id, queue, timestamp, duration)
+    return match, players, mine
+
+
+def generate(summoners=1000, matches=20000, population=None, unfetched=0.3,
+             shared=0.03, duo=0.25, seed=0, chunk=5000, progress=print):
+    '''
+    add a season of data to the app's database, see the module's docstring.
+
+    population is the amount of other players tracked summoners meet(50 per summoner).
+    unfetched is the share of match references pointing at matches that aren't stored.
+    shared is the chance any other player of a match is tracked too,
+    duo the chance a tracked summoner queued up with a tracked friend.
+    '''
+    rng = random.Random(seed)
+    riot = FakeRiot(seed)
+    population = population or summoners * 50
+    started = time.perf_counter()
+
+    first_summoner = (db.session.query(func.max(Summoner.id)).scalar() or 0) + 1
+    first_game = (db.session.query(func.max(Match.id)).scalar() or 0) + 1
+    first_player = (db.session.query(func.max(Player.id)).scalar() or 0) + 1
+    # above the ids of the matches fake_riot.py serves
+    first_match_id = max(4000000000, (db.session.query(func.max(Match.match_id)).scalar() or 0) + 1)
+    db.session.commit()
+
+    season = Season(rng, first_summoner, summoners, population)
+    # apart from rng so the rest comes out the same as before sync times were kept
+    sync_rng = random.Random('{}:synced'.format(seed))
+    generated_at = datetime.utcnow()
+    summoner_rows = []
+    for summoner_id in season.ids:
+        name = season.names[summoner_id]
+        account = riot.summoner(name)
+        rank = (riot.ranks(name) or [None])[0]
+        if rank is None:
+            rank = dict(tier='unranked', rank='', leaguePoints=0, wins=0, losses=0,
+                        queueType='none', position='none')
+        season.ranks[summoner_id] = '{} {}'.format(rank['tier'], rank['rank'])
+        # every part was fetched by the same refresh, some a while ago
+        synced_at = str(generated_at - timedelta(seconds=sync_rng.expovariate(1 / SYNC_AGE)))
+        summoner_rows.append((
+            summoner_id, name, name, str(account['summonerLevel']), str(account['profileIconId']),
+            account['accountId'], account['id'], rank['tier'], rank['rank'], rank['position'],
+            rank['leaguePoints'], rank['wins'], rank['losses'], rank['queueType'],
+            synced_at, synced_at, synced_at
+        ))
+
+    writer = Writer(db.engine)
+    indexes = [index for model in (ByReferenceMatch, Match, Player)
+               for index in model.__table__.indexes]
+    for index in indexes:
+        index.drop(db.engine)
+    # (summoner id, champion, queue) -> [games, wins, kills, deaths, assists, kda total]
+    totals = defaultdict(lambda: [0, 0, 0, 0, 0, 0.0])
+    # summoner id -> stored games
+    played = Counter()
+    written = 0
+    try:
+        writer.insert('summoner', SUMMONER_COLUMNS, summoner_rows)
+        writer.commit()
+
+        season_start = NEWEST_GAME / 1000 - SPAN
+        match_id = first_match_id
+        player_id = first_player
+        for start in range(0, matches, chunk):
+            match_rows, player_rows, ref_rows = [], [], []
+            for game in range(start, min(matches, start + chunk)):
+                # match ids grow with time, like riot's
+                match_id += rng.randint(1, 20)
+                timestamp = season_start + SPAN * game / matches + rng.random() * 60
+                match, players, mine = build_match(season, first_game + game, match_id,
+                                                   timestamp, shared, duo)
+                match_rows.append(match)
+                for row in players:
+                    player_rows.append((player_id,) + row[1:])
+                    player_id += 1
+                for summoner_id, (row, lane) in mine.items():
+                    ref_rows.append(_reference(summoner_id, match, row, lane))
+                    played[summoner_id] += 1
+                    champion, win, kills, deaths, assists = row[5], row[7], row[19], row[20], row[21]
+                    total = totals[summoner_id, CHAMPIONS[champion], match[2]]
+                    total[0] += 1
+                    total[1] += int(win)
+                    total[2] += kills
+                    total[3] += deaths
+                    total[4] += assists
+                    total[5] += kda(kills, deaths, assists)
+
+            writer.insert('match', MATCH_COLUMNS, match_rows)
+            writer.insert('player', PLAYER_COLUMNS, player_rows)
+            writer.insert('by_reference_match', REF_COLUMNS, ref_rows)
+            writer.commit()
+            written += len(match_rows) + len(player_rows) + len(ref_rows)
+            progress('{:>9} matches {:>12} rows {:>9.0f} rows/sec'.format(
+                start + len(match_rows), written, written / (time.perf_counter() - started)))
+
+        # references to games nobody looked at yet, the newest of every
+        # match history as fake_riot.py serves it so it can fetch them later
+        ref_rows = []
+        share = unfetched / (1 - unfetched) if unfetched < 1 else 0
+        for summoner_id in season.ids:
+            history = riot.match_history(season.names[summoner_id])['matches']
+            for game in history[:round(played[summoner_id] * share)]:
+                ref_rows.append(matchref_row(game, summoner_id))
+        amount = len(ref_rows)
+        for start in range(0, amount, chunk * 10):
+            writer.insert('by_reference_match', REF_COLUMNS, [
+                tuple(row.get(column) for column in REF_COLUMNS)
+                for row in ref_rows[start:start + chunk * 10]
+            ])
+
+        writer.insert('summoner_champion_stats', STATS_COLUMNS, [
+            key + tuple(total) for key, total in totals.items()
+        ])
+        writer.commit()
+        progress('{} unfetched match references, {} champion stats'.format(amount, len(totals)))
+    finally:
+        writer.close()
+        index_started = time.perf_counter()
+        for index in indexes:
+            index.create(db.engine)
+        progress('indexes built in {:.1f}s'.format(time.perf_counter() - index_started))
+
+    progress('{} summoners, {} matches, {} players in {:.1f}s'.format(
+        summoners, matches, player_id - first_player, time.perf_counter() - started))
+
+
+def _reference(summoner_id, match, player, lane):
+    '''a ByReferenceMatch row of a tracked summoner's stored game, summarized'''
+    game_id, match_id, queue, timestamp, duration = match
+    summary = dict(zip(PLAYER_COLUMNS, player))
+    return (summoner_id, match_id, 'NONE' if queue == ARAM else lane,
+            CHAMPIONS[summary['champion_id']], queue, timestamp
+            ) + tuple(summary[field] for field in SUMMARY_FIELDS) + (duration,)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('database', help="i.e. sqlite:////tmp/ogpp.db, a new schema if it's empty")
+    parser.add_argument('--summoners', type=int, default=10000)
+    parser.add_argument('--matches', type=int, default=1000000)
+    parser.add_argument('--population', type=int, default=None,
+                        help='other players met in matches, defaults to 50 per summoner')
+    parser.add_argument('--unfetched', type=float, default=0.3,
+                        help='share of match references to matches that are not stored')
+    parser.add_argument('--shared', type=float, default=0.03,
+                        help='chance any other player of a match is tracked too')
+    parser.add_argument('--duo', type=float, default=0.25,
+                        help='chance a tracked summoner queued with a tracked friend')
+    parser.add_argument('--seed', type=int, default=0,
+                        help="the same as fake_riot.py's to run the app against both")
+    parser.add_argument('--chunk', type=int, default=5000, help='matches per transaction')
+    args = parser.parse_args()
+
+    app = make_app(args.database)
+    with app.app_context():
+        generate(args.summoners, args.matches, args.population, args.unfetched,
+                 args.shared, args.duo, args.seed, args.chunk)
+
+
+if __name__ == '__main__':
+    main()
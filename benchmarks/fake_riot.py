@@ -0,0 +1,560 @@
+'''
+a stand-in for riot's api to benchmark and try the app against offline,
+without a daily api key or its quota.
+
+every route of URL in ogpp/game/api.py is served with synthetic but
+consistent data. a summoner exists under any name(except names starting
+with "missing", those 404), their match history points at matches they
+played in, and leaderboards are made of the same pool of players.
+the same seed always serves the same data.
+
+faults can be injected on top of it:
+    --latency/--jitter    seconds every response is held back, give or take the jitter
+    --app-limit           riot's application rate limits, once spent requests get
+                          a 429 with the same headers and Retry-After riot sends
+    --method-limit        the same for every api method on its own
+    --throttle-rate       share of requests answered with a service 429(no Retry-After)
+    --error-rate          share of requests answered with a 500, 502, 503 or 504
+
+    python -m benchmarks.fake_riot --port 8001 --latency 0.05 --jitter 0.02
+    RIOT_API_BASE_URL='http://127.0.0.1:8001/lol/{api_url}' RIOT_API_KEY=fake flask run
+
+or in process, i.e. from a benchmark:
+
+    with FakeRiotServer(port=0).start() as server:
+        api = RiotAPI('fake', base_url=server.base_url)
+
+GET /_stats returns the requests served per route and the faults injected so far.
+'''
+import argparse
+import json
+import math
+import random
+import re
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from ogpp.game.api import URL
+from ogpp.game.consts import CHAMPIONS
+from ogpp.game.ratelimit import parse_limits
+
+MISSING_PREFIX = 'missing'
+
+# newest game of every match history, histories go back in time from here
+NEWEST_GAME = 1555000000000
+
+# queue id -> how often it is played
+QUEUES = {420: 50, 440: 15, 450: 15, 400: 15, 430: 5}
+LANES = ['TOP', 'JUNGLE', 'MID', 'BOTTOM', 'BOTTOM']
+ROLES = ['SOLO', 'NONE', 'SOLO', 'DUO_CARRY', 'DUO_SUPPORT']
+SPELLS = [4, 14, 12, 7, 3, 11, 6, 21, 1]
+ITEMS = [0, 1001, 1055, 1056, 2003, 2055, 3006, 3020, 3031, 3047, 3065, 3071,
+         3089, 3111, 3153, 3157, 3340, 3363, 3364]
+# tier -> share of ranked players, master and above are the leaderboards
+TIERS = {'IRON': 5, 'BRONZE': 20, 'SILVER': 35, 'GOLD': 25, 'PLATINUM': 10, 'DIAMOND': 5}
+DIVISIONS = ['IV', 'III', 'II', 'I']
+LEADERBOARDS = {'masters': 'MASTER', 'grandmasters': 'GRANDMASTER', 'challengers': 'CHALLENGER'}
+# how many of leaderboard_size each leaderboard has
+LEADERBOARD_SHARE = {'masters': 1.0, 'grandmasters': 0.4, 'challengers': 0.15}
+
+ERROR_CODES = [500, 502, 503, 504]
+
+
+class NotFound(Exception):
+    pass
+
+
+def _encode(name):
+    # reversible, so every id leads back to the summoner's name
+    return name.encode().hex()
+
+
+def _decode(ident):
+    try:
+        return bytes.fromhex(ident.split('-', 1)[1]).decode()
+    except (IndexError, ValueError):
+        raise NotFound(ident)
+
+
+def _weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+class FakeRiot:
+    '''the synthetic data, every method returns what riot would for a route'''
+    def __init__(self, seed=0, history_size=100, population=5000, leaderboard_size=200):
+        self.seed = seed
+        self.history_size = history_size
+        self.population = population
+        self.leaderboard_size = leaderboard_size
+        # match id -> (name, champion, queue, timestamp) of the summoner
+        # whose history it was served in, so the match has them in it
+        self._owners = {}
+        self._lock = threading.Lock()
+
+    def register(self, names):
+        '''
+        serve the matches of these summoners' histories with them in it
+        without their history being asked for first, i.e. after a restart
+        '''
+        for name in names:
+            self.match_history(name)
+
+    def _rng(self, *parts):
+        return random.Random(':'.join(str(part) for part in (self.seed,) + parts))
+
+    def _player_names(self, rng, amount):
+        return ['player{}'.format(n) for n in rng.sample(range(self.population), amount)]
+
+    def summoner(self, name):
+        if name.lower().startswith(MISSING_PREFIX):
+            raise NotFound(name)
+        rng = self._rng('summoner', name)
+        ident = _encode(name)
+        return {
+            'id': 'S-' + ident, 'accountId': 'A-' + ident, 'puuid': 'P-' + ident,
+            'name': name, 'profileIconId': rng.randrange(4000),
+            'revisionDate': NEWEST_GAME, 'summonerLevel': rng.randint(30, 500)
+        }
+
+    def champion_pool(self, name):
+        '''champion id -> weight, everyone mains a handful of champions'''
+        rng = self._rng('pool', name)
+        return {champion: rng.randint(1, 10) for champion in rng.sample(list(CHAMPIONS), 8)}
+
+    def match_history(self, name, queue=None, champion=None, begin_index=0, end_index=None):
+        rng = self._rng('history', name)
+        pool = self.champion_pool(name)
+        timestamp = NEWEST_GAME
+        games = []
+        for _ in range(self.history_size):
+            game = {
+                'platformId': 'NA1', 'gameId': 3000000000 + rng.randrange(10 ** 9),
+                'champion': _weighted(rng, pool), 'queue': _weighted(rng, QUEUES),
+                'season': 13, 'timestamp': timestamp,
+                'role': rng.choice(ROLES), 'lane': rng.choice(LANES)
+            }
+            games.append(game)
+            # 20 minutes to two days between games
+            timestamp -= rng.randint(20 * 60, 48 * 60 * 60) * 1000
+
+        with self._lock:
+            for game in games:
+                self._owners[game['gameId']] = (name, game['champion'], game['queue'],
+                                                game['timestamp'])
+
+        if queue is not None:
+            games = [game for game in games if game['queue'] == queue]
+        if champion is not None:
+            games = [game for game in games if game['champion'] == champion]
+        total = len(games)
+        # riot hands out at most 100 games a request
+        end_index = min(total, end_index or begin_index + 100, begin_index + 100)
+        return {'matches': games[begin_index:end_index], 'startIndex': begin_index,
+                'endIndex': end_index, 'totalGames': total}
+
+    def match(self, match_id):
+        rng = self._rng('match', match_id)
+        with self._lock:
+            owner = self._owners.get(match_id)
+        if owner is None:
+            owner = (None, rng.choice(list(CHAMPIONS)), _weighted(rng, QUEUES),
+                     NEWEST_GAME - rng.randrange(10 ** 10))
+        owner_name, owner_champion, queue, timestamp = owner
+
+        duration = rng.randint(15 * 60, 45 * 60)
+        minutes = duration / 60
+        blue_wins = rng.random() < 0.5
+        owner_slot = rng.randrange(10)
+
+        champions = rng.sample([c for c in CHAMPIONS if c != owner_champion], 10)
+        names = [name for name in self._player_names(rng, 11) if name != owner_name][:10]
+        participants = []
+        identities = []
+        for slot in range(10):
+            participant_id = slot + 1
+            team_id = 100 if slot < 5 else 200
+            name = owner_name if slot == owner_slot and owner_name else names[slot]
+            champion = owner_champion if slot == owner_slot else champions[slot]
+            participants.append(self._participant(rng, participant_id, team_id, champion,
+                                                  win=(team_id == 100) == blue_wins,
+                                                  minutes=minutes, lane=LANES[slot % 5]))
+            identities.append({'participantId': participant_id, 'player': {
+                'platformId': 'NA1', 'currentPlatformId': 'NA1',
+                'accountId': 'A-' + _encode(name), 'currentAccountId': 'A-' + _encode(name),
+                'summonerId': 'S-' + _encode(name), 'summonerName': name,
+                'matchHistoryUri': '/v1/stats/player_history/NA1/' + _encode(name),
+                'profileIcon': rng.randrange(4000)
+            }})
+
+        teams = [{
+            'teamId': team_id, 'win': 'Win' if (team_id == 100) == blue_wins else 'Fail',
+            'firstBlood': rng.random() < 0.5, 'firstTower': rng.random() < 0.5,
+            'towerKills': rng.randint(0, 11), 'inhibitorKills': rng.randint(0, 3),
+            'baronKills': rng.randint(0, 2), 'dragonKills': rng.randint(0, 5),
+            'riftHeraldKills': rng.randint(0, 1),
+            'bans': [{'championId': rng.choice(list(CHAMPIONS)), 'pickTurn': turn}
+                     for turn in range(1, 6)]
+        } for team_id in (100, 200)]
+
+        return {
+            'gameId': match_id, 'platformId': 'NA1', 'gameCreation': int(timestamp),
+            'gameDuration': duration, 'queueId': queue, 'mapId': 12 if queue != 450 else 11,
+            'seasonId': 13, 'gameVersion': '9.8.270.9450', 'gameMode': 'CLASSIC',
+            'gameType': 'MATCHED_GAME', 'teams': teams,
+            'participants': participants, 'participantIdentities': identities
+        }
+
+    def _participant(self, rng, participant_id, team_id, champion, win, minutes, lane):
+        kills, deaths, assists = rng.randint(0, 15), rng.randint(0, 12), rng.randint(0, 20)
+        gold = int(minutes * rng.randint(300, 500))
+        stats = {'item%d' % slot: rng.choice(ITEMS) for slot in range(7)}
+        stats.update(
+            participantId=participant_id, win=win, champLevel=rng.randint(9, 18),
+            kills=kills, deaths=deaths, assists=assists,
+            largestKillingSpree=rng.randint(0, kills), largestMultiKill=min(kills, rng.randint(0, 3)),
+            doubleKills=rng.randint(0, kills // 3), tripleKills=0, quadraKills=0, pentaKills=0,
+            totalDamageDealt=rng.randint(20000, 250000),
+            totalDamageDealtToChampions=rng.randint(3000, 60000),
+            magicDamageDealtToChampions=rng.randint(0, 30000),
+            physicalDamageDealtToChampions=rng.randint(0, 30000),
+            trueDamageDealtToChampions=rng.randint(0, 5000),
+            totalHeal=rng.randint(0, 20000), totalUnitsHealed=rng.randint(1, 5),
+            damageSelfMitigated=rng.randint(0, 60000),
+            damageDealtToObjectives=rng.randint(0, 30000),
+            damageDealtToTurrets=rng.randint(0, 10000),
+            visionScore=rng.randint(5, 80), timeCCingOthers=rng.randint(0, 60),
+            totalDamageTaken=rng.randint(5000, 50000),
+            goldEarned=gold, goldSpent=int(gold * rng.uniform(0.8, 1.0)),
+            turretKills=rng.randint(0, 4), inhibitorKills=rng.randint(0, 1),
+            totalMinionsKilled=int(minutes * rng.randint(0, 9)),
+            neutralMinionsKilled=int(minutes * rng.randint(0, 5)),
+            wardsPlaced=rng.randint(0, 40), wardsKilled=rng.randint(0, 15),
+            firstBloodKill=False, firstTowerKill=False
+        )
+        per_ten = {'0-10': rng.uniform(0, 10), '10-20': rng.uniform(0, 10)}
+        return {
+            'participantId': participant_id, 'teamId': team_id, 'championId': champion,
+            'spell1Id': rng.choice(SPELLS), 'spell2Id': 4, 'stats': stats,
+            'timeline': {'participantId': participant_id, 'lane': lane, 'role': 'SOLO',
+                         'creepsPerMinDeltas': per_ten, 'xpPerMinDeltas': per_ten,
+                         'goldPerMinDeltas': per_ten, 'damageTakenPerMinDeltas': per_ten}
+        }
+
+    def ranks(self, name):
+        rng = self._rng('rank', name)
+        if rng.random() < 0.2:
+            return []
+        tier = _weighted(rng, TIERS)
+        return [self._rank_entry(rng, name, tier, rng.choice(DIVISIONS), rng.randrange(100))]
+
+    def _rank_entry(self, rng, name, tier, division, points):
+        wins = rng.randint(10, 400)
+        return {
+            'leagueId': 'L-' + tier.lower(), 'queueType': 'RANKED_SOLO_5x5', 'position': 'NONE',
+            'tier': tier, 'rank': division, 'leaguePoints': points,
+            'wins': wins, 'losses': int(wins * rng.uniform(0.8, 1.2)),
+            'summonerId': 'S-' + _encode(name), 'summonerName': name,
+            'veteran': False, 'inactive': False, 'freshBlood': False, 'hotStreak': False
+        }
+
+    def masteries(self, name):
+        rng = self._rng('mastery', name)
+        pool = self.champion_pool(name)
+        champions = list(pool) + rng.sample(list(CHAMPIONS), 30)
+        masteries = []
+        for champion in dict.fromkeys(champions):
+            points = pool.get(champion, 0) * rng.randint(10000, 50000) + rng.randint(100, 20000)
+            masteries.append({
+                'championId': champion, 'championPoints': points,
+                'championLevel': min(7, 1 + points // 12000), 'chestGranted': rng.random() < 0.3,
+                'tokensEarned': 0, 'lastPlayTime': NEWEST_GAME - rng.randrange(10 ** 10),
+                'summonerId': 'S-' + _encode(name)
+            })
+        return sorted(masteries, key=lambda m: m['championPoints'], reverse=True)
+
+    def leaderboard(self, kind, queue):
+        rng = self._rng('leaderboard', kind, queue)
+        tier = LEADERBOARDS[kind]
+        size = max(1, int(self.leaderboard_size * LEADERBOARD_SHARE[kind]))
+        # every leaderboard has its own players out of the same pool
+        offset = {'challengers': 0, 'grandmasters': 1, 'masters': 2}[kind] * self.population // 3
+        names = ['player{}'.format((offset + n) % self.population) for n in range(size)]
+        return {
+            'tier': tier, 'leagueId': 'L-' + tier.lower(), 'queue': queue,
+            'name': "Fake's Legends",
+            'entries': [self._rank_entry(rng, name, tier, 'I', rng.randint(0, 1500))
+                        for name in names]
+        }
+
+
+class Faults:
+    '''latency, rate limits and errors put on top of every response'''
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 app_limits=None, method_limits=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.app_limits = app_limits
+        self.method_limits = method_limits
+        self.injected = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        # (key, window) -> [window start, count], the same fixed windows riot uses
+        self._windows = {}
+
+    def delay(self):
+        with self._lock:
+            jitter = self._rng.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, self.latency + jitter))
+
+    def check(self, method):
+        '''
+        (status code, headers) of the response, a 200 unless a fault is injected.
+        every response carries the rate limit headers of its limits.
+        '''
+        now = time.time()
+        headers = {}
+        with self._lock:
+            buckets = []
+            if self.app_limits:
+                buckets.append(('application', 'app', self.app_limits, 'X-App-Rate-Limit'))
+            if self.method_limits:
+                buckets.append(('method', method, self.method_limits, 'X-Method-Rate-Limit'))
+
+            retry_after, limit_type = 0, None
+            for kind, key, limits, _ in buckets:
+                for count, window in limits:
+                    start, used = self._window(key, window, now)
+                    if used >= count:
+                        wait = start + window - now
+                        if wait > retry_after:
+                            retry_after, limit_type = wait, kind
+            if limit_type is None:
+                for _, key, limits, _ in buckets:
+                    for count, window in limits:
+                        self._windows[key, window][1] += 1
+
+            for _, key, limits, header in buckets:
+                headers[header] = ','.join('{}:{}'.format(c, w) for c, w in limits)
+                headers[header + '-Count'] = ','.join(
+                    '{}:{}'.format(self._windows[key, w][1], w) for c, w in limits)
+
+            roll = self._rng.random()
+            error = self._rng.choice(ERROR_CODES)
+
+        if limit_type is not None:
+            self.injected['429 ' + limit_type] += 1
+            headers.update({'Retry-After': str(math.ceil(retry_after)),
+                            'X-Rate-Limit-Type': limit_type})
+            return 429, headers
+        if roll < self.throttle_rate:
+            self.injected['429 service'] += 1
+            headers['X-Rate-Limit-Type'] = 'service'
+            return 429, headers
+        if roll < self.throttle_rate + self.error_rate:
+            self.injected[str(error)] += 1
+            return error, headers
+        return 200, headers
+
+    def _window(self, key, window, now):
+        counter = self._windows.get((key, window))
+        if counter is None or now >= counter[0] + window:
+            counter = self._windows[key, window] = [now, 0]
+        return counter
+
+
+def routes():
+    '''(route name, regex of its path) for every api url in URL'''
+    for group, urls in URL.items():
+        if group == 'base_url':
+            continue
+        if isinstance(urls, str):
+            urls = {None: urls}
+        for method, template in urls.items():
+            name = group if method is None else '{}.{}'.format(group, method)
+            parts = re.split(r'\{(\w+)\}', template)
+            pattern = ''.join(
+                re.escape(part) if i % 2 == 0 else '(?P<{}>[^/]+)'.format(part)
+                for i, part in enumerate(parts)
+            )
+            yield name, re.compile('^/lol/' + pattern + '$')
+
+
+def respond(riot, route, args, query):
+    '''the body of a successful response to a route'''
+    if route.startswith('summoner.'):
+        ident = unquote(args['arg'])
+        name = ident if route == 'summoner.by_name' else _decode(ident)
+        return riot.summoner(name)
+    if route == 'match.history':
+        name = _decode(args['encrypted_account_id'])
+        return riot.match_history(
+            name,
+            queue=int(query['queue']) if 'queue' in query else None,
+            champion=int(query['champion']) if 'champion' in query else None,
+            begin_index=int(query.get('beginIndex', 0)),
+            end_index=int(query['endIndex']) if 'endIndex' in query else None
+        )
+    if route == 'match.by_id':
+        try:
+            return riot.match(int(args['match_id']))
+        except ValueError:
+            raise NotFound(args['match_id'])
+    if route == 'league.summoner_rank':
+        return riot.ranks(_decode(args['encrypted_summoner_id']))
+    if route == 'champion_mastery':
+        return riot.masteries(_decode(args['encrypted_summoner_id']))
+    kind = route.split('.', 1)[1]
+    return riot.leaderboard(kind, args['queue'])
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, RiotAPI reuses its connections
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        query = dict(parse_qsl(url.query))
+
+        if url.path == '/_stats':
+            return self._send(200, {'requests': server.requests,
+                                    'faults': server.faults.injected})
+
+        for route, pattern in server.routes:
+            match = pattern.match(url.path)
+            if match is not None:
+                break
+        else:
+            return self._error(404, 'Data not found')
+
+        server.requests[route] += 1
+        server.faults.delay()
+        if server.api_key is not None and query.get('api_key') != server.api_key:
+            return self._error(403, 'Forbidden')
+
+        status, headers = server.faults.check(route)
+        if status != 200:
+            return self._error(status, 'Injected fault', headers)
+        try:
+            body = respond(server.riot, route, match.groupdict(), query)
+        except NotFound:
+            return self._error(404, 'Data not found', headers)
+        self._send(200, body, headers)
+
+    def _error(self, status, message, headers=None):
+        self._send(status, {'status': {'message': message, 'status_code': status}}, headers)
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json;charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class FakeRiotServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=8001, riot=None, faults=None,
+                 api_key=None, verbose=False):
+        super().__init__((host, port), _Handler)
+        self.riot = riot or FakeRiot()
+        self.faults = faults or Faults()
+        # only requests with this key are answered if set, like riot does
+        self.api_key = api_key
+        self.verbose = verbose
+        self.routes = list(routes())
+        self.requests = Counter()
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handle_error(self, request, client_address):
+        # clients hanging up on a keep-alive connection is business as usual
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        '''for RiotAPI(base_url=) or RIOT_API_BASE_URL'''
+        host, port = self.server_address[:2]
+        return 'http://{}:{}/lol/{{api_url}}'.format(host, port)
+
+    def start(self):
+        '''serve from a daemon thread, returns the server'''
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True,
+                                        name='fake-riot-api')
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self.shutdown()
+            self._thread = None
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--history-size', type=int, default=100,
+                        help='games in every match history')
+    parser.add_argument('--population', type=int, default=5000,
+                        help='players the other participants of matches are drawn from')
+    parser.add_argument('--leaderboard-size', type=int, default=200)
+    parser.add_argument('--tracked', type=int, default=0,
+                        help='register the histories of summoner1 to summonerN, '
+                             'the summoners of benchmarks/dataset.py')
+    parser.add_argument('--api-key', help='only answer requests made with this key')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--app-limit', type=parse_limits, default=None,
+                        help="i.e. '20:1,100:120', riot's development key limits")
+    parser.add_argument('--method-limit', type=parse_limits, default=None,
+                        help="i.e. '2000:60'")
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args()
+
+    riot = FakeRiot(args.seed, args.history_size, args.population, args.leaderboard_size)
+    riot.register('summoner{}'.format(n) for n in range(1, args.tracked + 1))
+    faults = Faults(args.latency, args.jitter, args.error_rate, args.throttle_rate,
+                    args.app_limit, args.method_limit, args.seed)
+    server = FakeRiotServer(args.host, args.port, riot, faults, args.api_key, args.verbose)
+    # stopped like any other service, not only from a terminal
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print('serving a fake riot api on', server.base_url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print('requests:', dict(server.requests))
+        print('faults:', dict(server.faults.injected))
+
+
+if __name__ == '__main__':
+    main()
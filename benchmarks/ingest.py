@@ -0,0 +1,120 @@
+'''
+ingest throughput: one ORM object and one commit at a time(the old
+add_matchref_to_db/add_match_to_db path) versus the batched inserts of
+add_matchrefs_to_db/add_matches_to_db. the batched path still inserts
+every Match with a statement of its own(see add_matches_to_db), only
+players and match references go in with one executemany per table.
+
+runs against a sqlite file so that every commit pays for its sync to disk.
+
+    python -m benchmarks.ingest [matches]
+'''
+import os
+import random
+import sys
+import tempfile
+import time
+
+from ogpp import db
+from ogpp.game import CHAMPIONS, SUMMONER_SPELLS
+from ogpp.helpers.storage import (add_matchrefs_to_db, add_matches_to_db,
+                                  serialize_matchref_to_db, serialize_player_to_db,
+                                  match_participants)
+from ogpp.models import Summoner, ByReferenceMatch, Match, Player
+
+from ._common import make_app
+
+
+def make_match(rng, match_id):
+    '''a match as the api returns it, trimmed to what we store'''
+    participants = []
+    identities = []
+    for participant_id in range(1, 11):
+        stats = {'item%d' % i: rng.choice([0, 1001, 3006, 3031, 3071, 3153]) for i in range(7)}
+        stats.update(champLevel=rng.randint(6, 18), win=(participant_id <= 5) == (match_id % 2 == 0),
+                     kills=rng.randint(0, 15), deaths=rng.randint(0, 12), assists=rng.randint(0, 20),
+                     goldEarned=rng.randint(5000, 20000), goldSpent=rng.randint(5000, 20000))
+        participants.append({
+            'participantId': participant_id,
+            'teamId': 100 if participant_id <= 5 else 200,
+            'championId': rng.choice(list(CHAMPIONS)),
+            'spell1Id': rng.choice([4, 14]), 'spell2Id': rng.choice(list(SUMMONER_SPELLS)),
+            'stats': stats
+        })
+        identities.append({'participantId': participant_id,
+                           'player': {'summonerName': 'player{}'.format(rng.randint(0, 50000))}})
+    return {'gameId': match_id, 'queueId': 420, 'participants': participants,
+            'participantIdentities': identities}
+
+
+def make_matchref(rng, match_id):
+    return {'gameId': match_id, 'lane': 'MID', 'queue': 420,
+            'timestamp': 1555000000000 - match_id, 'champion': rng.choice(list(CHAMPIONS))}
+
+
+def legacy_add_matchrefs(summoner, references):
+    for match in references:
+        db.session.add(serialize_matchref_to_db(match, summoner))
+        db.session.commit()
+
+
+def legacy_add_matches(matches):
+    for match, timestamp in matches:
+        m = Match(match_id=match['gameId'], game_mode=match['queueId'], timestamp=timestamp)
+        db.session.add(m)
+        for player in match_participants(match):
+            db.session.add(serialize_player_to_db(player, m, 'unranked'))
+        db.session.commit()
+
+
+def clear():
+    for model in (Player, Match, ByReferenceMatch):
+        model.query.delete()
+    db.session.commit()
+
+
+def throughput(fn, *args, rows):
+    start = time.perf_counter()
+    fn(*args)
+    return rows / (time.perf_counter() - start)
+
+
+def main(matches=200):
+    rng = random.Random(10)
+    references = [make_matchref(rng, i) for i in range(matches)]
+    payloads = [(make_match(rng, i), 1555000000 - i) for i in range(matches)]
+    # every match row comes with ten player rows
+    match_rows = matches * 11
+
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    try:
+        app = make_app('sqlite:///' + path)
+        with app.app_context():
+            summoner = Summoner(name='benchmark', indexed_name='benchmark')
+            db.session.add(summoner)
+            db.session.commit()
+
+            results = [
+                ('match list, per row', throughput(legacy_add_matchrefs, summoner, references,
+                                                   rows=matches)),
+            ]
+            clear()
+            results.append(('match list, batched', throughput(add_matchrefs_to_db, summoner,
+                                                              references, rows=matches)))
+            clear()
+            results.append(('matches, per match', throughput(legacy_add_matches, payloads,
+                                                             rows=match_rows)))
+            clear()
+            results.append(('matches, batched', throughput(add_matches_to_db, payloads,
+                                                           rows=match_rows)))
+    finally:
+        os.remove(path)
+
+    print('ingest of {} matches({} match + player rows)'.format(matches, match_rows))
+    for label, rows_per_second in results:
+        print('  {:<24} {:>12.0f} rows/sec'.format(label, rows_per_second))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,60 @@
+'''
+deep pages of a long match history: flask-sqlalchemy's paginate(OFFSET plus
+a COUNT(*) on every request) versus following a cursor with the count cached.
+
+    python -m benchmarks.pagination [games] [page]
+'''
+import sys
+
+from ogpp import db
+from ogpp.helpers.pagination import count_history, format_cursor, paginate_history
+from ogpp.models import Summoner, ByReferenceMatch
+
+from ._common import make_app, measure, report
+
+
+def seed(games):
+    summoner = Summoner(name='benchmark', indexed_name='benchmark', level='100')
+    db.session.add(summoner)
+    db.session.flush()
+    db.session.bulk_insert_mappings(ByReferenceMatch, [
+        dict(summoner_id=summoner.id, match_id=3000000000 + game, champion_played='Annie',
+             game_mode=420, timestamp=1555000000 - game * 600, lane_played='MID')
+        for game in range(games)
+    ])
+    db.session.commit()
+    return summoner
+
+
+def offset_page(summoner, page, per_page):
+    return summoner.match_history.order_by(
+        ByReferenceMatch.timestamp.desc()
+    ).paginate(page, per_page).items
+
+
+def cursor_page(summoner, page, per_page, cursor):
+    total = count_history(summoner.match_history, (summoner.id, 'all', 'all'))
+    return paginate_history(summoner.match_history, page, per_page, total, after=cursor).items
+
+
+def main(games=100000, page=5000):
+    app = make_app()
+    with app.app_context(), app.test_request_context():
+        summoner = seed(games)
+        per_page = app.config['POSTS_PER_PAGE']
+        # the cursor the previous page's next link carries
+        previous = offset_page(summoner, page - 1, per_page)
+        cursor = format_cursor(previous[-1])
+
+        old, old_statements, old_time = measure(offset_page, summoner, page, per_page)
+        new, new_statements, new_time = measure(cursor_page, summoner, page, per_page, cursor)
+
+        report('page {} of {} games'.format(page, games), [
+            ('offset + count(old)', old_statements, old_time),
+            ('cursor, cached count', new_statements, new_time),
+        ])
+        assert [m.id for m in old] == [m.id for m in new]
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,113 @@
+'''
+size and scan speed of the player table with champions, spells and items
+stored as text(the old columns) versus as their ids, seeded with a million rows.
+
+runs against sqlite files, each holding nothing but the player table.
+
+    python -m benchmarks.player_encoding [rows]
+'''
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import Column, MetaData, String, Table, create_engine, func, select
+
+from ogpp.game import CHAMPIONS, SUMMONER_SPELLS
+from ogpp.models import Player
+
+ITEMS = ['item%d' % slot for slot in range(1, 8)]
+ITEM_IDS = [0, 1001, 1055, 2003, 3006, 3031, 3071, 3089, 3153, 3340]
+# the old text columns and the id columns they became
+LEGACY_COLUMNS = {'champion_played': ('champion_id', 20), 'spell1': ('spell1_id', 10),
+                  'spell2': ('spell2_id', 10)}
+
+
+def player_table(legacy):
+    '''the player table as it is now, or as it was with legacy set'''
+    replaced = {new: (old, length) for old, (new, length) in LEGACY_COLUMNS.items()}
+    columns = []
+    for column in Player.__table__.columns:
+        if legacy and column.name in replaced:
+            old, length = replaced[column.name]
+            columns.append(Column(old, String(length)))
+        elif legacy and column.name in ITEMS:
+            columns.append(Column(column.name, String(5)))
+        else:
+            columns.append(Column(column.name, column.type, primary_key=column.primary_key))
+    return Table('player', MetaData(), *columns)
+
+
+def make_rows(rng, count, legacy):
+    champions = list(CHAMPIONS)
+    spells = [4, 14, 12, 11, 7, 3, 6, 21, 1]
+    for row_id in range(1, count + 1):
+        champion, spell1, spell2 = rng.choice(champions), 4, rng.choice(spells)
+        items = [rng.choice(ITEM_IDS) for _ in ITEMS]
+        row = dict(id=row_id, game_id=row_id // 10 + 1, participant_id=row_id % 10 + 1,
+                   name='player{}'.format(rng.randint(0, 200000)), current_rank='unranked',
+                   champion_level=rng.randint(6, 18), win=row_id % 2 == 0,
+                   team_id=100 if row_id % 10 < 5 else 200,
+                   kills=rng.randint(0, 15), deaths=rng.randint(0, 12), assists=rng.randint(0, 20),
+                   gold_earned=rng.randint(5000, 20000), gold_spent=rng.randint(5000, 20000))
+        if legacy:
+            row.update(champion_played=CHAMPIONS[champion], spell1=SUMMONER_SPELLS[spell1],
+                       spell2=SUMMONER_SPELLS[spell2])
+            row.update(zip(ITEMS, map(str, items)))
+        else:
+            row.update(champion_id=champion, spell1_id=spell1, spell2_id=spell2)
+            row.update(zip(ITEMS, items))
+        yield row
+
+
+def seed(path, rows, legacy, chunk=20000):
+    engine = create_engine('sqlite:///' + path)
+    table = player_table(legacy)
+    table.metadata.create_all(engine)
+    generated = make_rows(random.Random(16), rows, legacy)
+    with engine.begin() as conn:
+        while True:
+            batch = [row for _, row in zip(range(chunk), generated)]
+            if not batch:
+                break
+            conn.execute(table.insert(), batch)
+    with engine.connect() as conn:
+        conn.execute('VACUUM')
+    return engine, table
+
+
+def scan_time(engine, query, repeat=3):
+    best = None
+    for _ in range(repeat):
+        with engine.connect() as conn:
+            start = time.perf_counter()
+            conn.execute(query).fetchall()
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(rows=1000000):
+    with tempfile.TemporaryDirectory() as directory:
+        results = []
+        for label, legacy in (('text(old)', True), ('ids', False)):
+            path = os.path.join(directory, label + '.db')
+            engine, table = seed(path, rows, legacy)
+            champion = table.c.champion_played if legacy else table.c.champion_id
+            per_champion = select([champion, func.count(), func.sum(table.c.win)]).group_by(champion)
+            boots = '3006' if legacy else 3006
+            with_item = select([func.count()]).where(table.c.item2 == boots)
+            results.append((label, os.path.getsize(path),
+                            scan_time(engine, per_champion), scan_time(engine, with_item)))
+            engine.dispose()
+
+    print('player table, {} rows'.format(rows))
+    for label, size, group_time, filter_time in results:
+        print('  {:<10} {:>8.1f} MB {:>6.1f} bytes/row   group by champion {:>8.1f} ms'
+              '   filter on item {:>8.1f} ms'.format(label, size / 2 ** 20, size / rows,
+                                                   group_time * 1000, filter_time * 1000))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
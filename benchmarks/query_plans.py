@@ -0,0 +1,119 @@
+'''
+query plan check of the summoner page's hot lookups.
+
+renders the summoner page for every combination of its filters,
+follows its next and previous page links, opens a match and asks sqlite how it plans to run each select that went to the database.
+fails(exit status 1) when one of them reads a whole table or sorts
+a whole match history instead of going through an index.
+
+    python -m benchmarks.query_plans [games]
+'''
+import sys
+from urllib.parse import urlsplit, parse_qsl
+
+from sqlalchemy import event
+
+from ogpp import db
+from ogpp.helpers.content import (generate_summoner_page_context, get_match_detail,
+                                  last_recently_played)
+from ogpp.models import ByReferenceMatch
+
+from ._common import make_app
+from .ranked_stats import seed
+
+# the filters of the summoner page(page, champion, queue)
+PAGE_FILTERS = [
+    (1, 'all', 'all'),
+    (2, 'all', 'RANKED_SOLO'),
+    (1, '{champion}', 'all'),
+    (1, '{champion}', 'RANKED_SOLO'),
+]
+
+
+class StatementRecorder:
+    '''keeps every distinct select sent to the database while active'''
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = {}
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            self.statements.setdefault(statement, parameters)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+
+def follow(summoner_name, url):
+    '''render the summoner page a page link points to'''
+    args = dict(parse_qsl(urlsplit(url).query))
+    return generate_summoner_page_context(summoner_name, int(args.pop('page', 1)),
+                                          args.pop('champion', 'all'),
+                                          args.pop('queue', 'all'), **args)
+
+
+def explain(statement, parameters):
+    '''sqlite's EXPLAIN QUERY PLAN of a statement as a list of its steps'''
+    conn = db.engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return [row[-1] for row in cursor.fetchall()]
+    finally:
+        conn.close()
+
+
+def problems(plan, tables):
+    '''steps of a plan that go through a whole table or sort a whole result'''
+    out = []
+    for step in plan:
+        words = step.split()
+        if words[0] == 'SCAN':
+            # 'SCAN TABLE player' on older sqlite versions, 'SCAN player' on newer ones
+            table = words[2] if words[1] == 'TABLE' else words[1]
+            if table in tables:
+                out.append(step)
+        elif step.startswith('USE TEMP B-TREE FOR ORDER BY'):
+            out.append(step)
+    return out
+
+
+def main(games=60):
+    app = make_app()
+    with app.app_context(), app.test_request_context():
+        summoner = seed(games)
+        newest = summoner.match_history.order_by(ByReferenceMatch.timestamp.desc()).first()
+        champion = newest.champion_played
+
+        with StatementRecorder(db.engine) as recorder:
+            for page, champion_filter, queue in PAGE_FILTERS:
+                page_items = generate_summoner_page_context(
+                    summoner.name, page, champion_filter.format(champion=champion), queue)
+                # the cursor queries behind the arrows
+                if page_items.page_urls.next:
+                    page_items = follow(summoner.name, page_items.page_urls.next)
+                if page_items.page_urls.prev:
+                    follow(summoner.name, page_items.page_urls.prev)
+            get_match_detail(summoner.name, newest.match_id)
+            last_recently_played(summoner, champion)
+
+        tables = set(db.metadata.tables)
+        failed = 0
+        for statement, parameters in recorder.statements.items():
+            plan = explain(statement, parameters)
+            bad = problems(plan, tables)
+            failed += bool(bad)
+            print('FAIL' if bad else 'ok  ', ' '.join(statement.split())[:110])
+            for step in plan:
+                print('      ', '!' if step in bad else ' ', step)
+
+        print('{} statements, {} without a usable index'.format(len(recorder.statements), failed))
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main(*map(int, sys.argv[1:])) else 0)
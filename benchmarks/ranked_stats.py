@@ -0,0 +1,116 @@
+'''
+get_ranked_stats: the old per champion/per match loops versus one grouped query
+over the stored matches(what `flask stats rebuild` runs) and the read of the
+champion statistics table, for a summoner with 500 ranked games.
+
+    python -m benchmarks.ranked_stats [games]
+'''
+import random
+import sys
+from types import SimpleNamespace
+
+from ogpp import db
+from ogpp.game import CHAMPIONS, _QUEUE_TYPE
+from ogpp.helpers.content import get_ranked_stats, make_exportable_top_champ
+from ogpp.helpers.stats import rebuild_champion_stats
+from ogpp.models import Summoner, ByReferenceMatch, Match, Player
+
+from ._common import make_app, measure, report
+
+
+def seed(games):
+    rng = random.Random(500)
+    champions = rng.sample(sorted(CHAMPIONS), 20)
+    queues = [_QUEUE_TYPE['RANKED_SOLO'], _QUEUE_TYPE['RANKED_FLEX']]
+
+    summoner = Summoner(name='benchmark', indexed_name='benchmark', level='100',
+                        highest_rank='gold', rank_division='II', wins=0, losses=0)
+    db.session.add(summoner)
+    db.session.flush()
+
+    for game in range(games):
+        match_id = 3000000000 + game
+        champion = rng.choice(champions)
+        queue = rng.choice(queues)
+        timestamp = 1555000000 - game * 3600
+        db.session.add(ByReferenceMatch(summoner_id=summoner.id, match_id=match_id,
+                                        champion_played=CHAMPIONS[champion], game_mode=queue,
+                                        timestamp=timestamp, lane_played='MID'))
+        match = Match(match_id=match_id, game_mode=queue, timestamp=timestamp)
+        db.session.add(match)
+        for slot in range(10):
+            name = 'benchmark' if slot == 0 else 'player{}'.format(rng.randint(0, 10000))
+            db.session.add(Player(
+                game_context=match, name=name, indexed_name=name,
+                champion_id=champion if slot == 0 else rng.choice(champions),
+                team_id=100 if slot < 5 else 200, win=(slot < 5) == (game % 2 == 0),
+                kills=rng.randint(0, 15), deaths=rng.randint(0, 12), assists=rng.randint(0, 20)
+            ))
+    db.session.commit()
+    return summoner
+
+
+def legacy_get_ranked_stats(summoner):
+    '''get_ranked_stats as it was before the grouped query'''
+    games = summoner.ranked_games
+    champions_played = set(match.champion_played for match in games)
+    ranked_champions = []
+
+    def match_query(m):
+        return Match.query.filter_by(match_id=m.match_id).first()
+
+    total_wins = 0
+    games_total = 0
+
+    for champ in champions_played:
+        all_played_matches = [match for match in games if match.champion_played == champ]
+        queried_matches = [
+            match_query(match)
+            for match in all_played_matches
+            if match_query(match) is not None
+        ]
+        total_played = len(queried_matches)
+        total_avg_kdas = 0
+        wins = 0
+        for match in queried_matches:
+            player_instance = match.participants.filter_by(name=summoner.name).first()
+            total_avg_kdas += player_instance.avg_kda
+            if player_instance.win:
+                total_wins += 1
+                wins += 1
+        effective_kda = total_avg_kdas / total_played if total_played else total_avg_kdas
+        win_rate = wins / total_played if total_played else 0
+        ranked_champions.append(
+            make_exportable_top_champ(champ, win_rate, effective_kda, total_played))
+        games_total += total_played
+
+    ranked_champions.sort(key=lambda c: c.total_played)
+    ranked_champions.reverse()
+    ranked_items = SimpleNamespace()
+    ranked_items.champions = ranked_champions[:5]
+    ranked_items.win_loss = '{}W/{}L'.format(total_wins, games_total - total_wins)
+    return ranked_items
+
+
+def main(games=500):
+    app = make_app()
+    with app.app_context():
+        summoner = seed(games)
+
+        old, old_statements, old_time = measure(legacy_get_ranked_stats, summoner, repeat=1)
+        _, rebuild_statements, rebuild_time = measure(rebuild_champion_stats, summoner)
+        new, new_statements, new_time = measure(get_ranked_stats, summoner)
+
+        report('get_ranked_stats, {} ranked games'.format(games), [
+            ('per match queries(old)', old_statements, old_time),
+            ('grouped query(rebuild)', rebuild_statements, rebuild_time),
+            ('champion stats table', new_statements, new_time),
+        ])
+
+        # champions with the same amount of games may come out in another order
+        assert old.win_loss == new.win_loss
+        assert [c.total_played for c in old.champions] == [c.total_played for c in new.champions]
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,183 @@
+'''
+budgets of sql statements, riot api calls and wall time for every page.
+
+builds a small season with benchmarks/dataset.py in a throwaway sqlite
+database, points the app's RiotAPI at an in-process benchmarks/fake_riot.py
+and requests every route through flask's test client, in order:
+
+    python -m benchmarks.routes
+    python -m benchmarks.routes --time-slack 3     # on a slow machine
+
+a case over any of its budgets is marked OVER and the run exits with 1,
+so an N+1 sneaking back into content.py/storage.py fails loudly. the
+statement and call budgets are exact counts with a little headroom, wall
+time budgets are loose and only catch something going badly wrong.
+after a fix lowers a count, lower its budget here along with it.
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+from flask import url_for
+from sqlalchemy import event, func
+
+from ogpp import db, game
+from ogpp.models import ByReferenceMatch, Summoner
+
+from . import dataset
+from ._common import make_app
+from .fake_riot import FakeRiot, FakeRiotServer
+
+SUMMONERS = 40
+MATCHES = 3000
+SEED = 0
+
+# label, flask endpoint, url arguments, budgets: (statements, api calls, ms).
+# {name} is the summoner with the longest history, {new} one that isn't stored yet,
+# {champion} the champion played most by {name}.
+# requests are made in this order, earlier ones fill the database for later ones
+Case = namedtuple('Case', 'label endpoint arguments statements calls ms')
+
+CASES = [
+    Case('home', 'home.index', {}, 0, 0, 100),
+    Case('summoner, first visit', 'summoner.summoner', {'name': '{new}'}, 50, 13, 2000),
+    Case('summoner, new visitor again', 'summoner.summoner', {'name': '{new}'}, 4, 0, 250),
+    # a third of its page is referenced but not stored yet, and the dataset's
+    # summoners were synced a while ago so it queues a refresh(see revalidate)
+    Case('summoner', 'summoner.summoner', {'name': '{name}'}, 40, 4, 1000),
+    Case('summoner, stored page', 'summoner.summoner', {'name': '{name}'}, 5, 0, 250),
+    Case('summoner, page 3', 'summoner.summoner', {'name': '{name}', 'page': 3}, 35, 3, 1000),
+    Case('summoner, ranked solo', 'summoner.summoner',
+         {'name': '{name}', 'queue': 'RANKED_SOLO'}, 33, 1, 1500),
+    Case('summoner, champion', 'summoner.summoner',
+         {'name': '{name}', 'champion': '{champion}'}, 6, 0, 250),
+    Case('summoner, champion page 2', 'summoner.summoner',
+         {'name': '{name}', 'champion': '{champion}', 'page': 2}, 5, 0, 250),
+    # a query per champion mastery for when it was last played
+    Case('masteries', 'summoner.masteries', {'name': '{name}'}, 42, 1, 500),
+    Case('leaderboard', 'leaderboard.leaderboard', {'group': 'masters'}, 0, 1, 250),
+    Case('leaderboard, challengers', 'leaderboard.leaderboard',
+         {'group': 'challengers', 'queue': 'RANKED_FLEX_SR'}, 0, 1, 250),
+    # nobody works on refreshes here, this finds the one the page view queued
+    Case('refresh', 'summoner.refresh', {'name': '{name}'}, 3, 0, 100),
+    Case('refresh again', 'summoner.refresh', {'name': '{name}'}, 3, 0, 100),
+    Case('refresh status', 'summoner.refresh_status', {'name': '{name}'}, 3, 0, 100),
+]
+
+Result = namedtuple('Result', 'case url status statements calls ms')
+
+
+class Tally:
+    '''sql statements and api calls made while requests are handled'''
+    def __init__(self):
+        self.statements = 0
+        # cache and archive hits included, see RiotAPI.on_call
+        self.calls = 0
+
+    def statement(self, *args):
+        self.statements += 1
+
+    def call(self, endpoint, source, seconds):
+        self.calls += 1
+
+    def reset(self):
+        self.statements = 0
+        self.calls = 0
+
+
+def seed(summoners, matches):
+    '''fill the database, returns the url placeholders of the cases'''
+    dataset.generate(summoners, matches, seed=SEED, chunk=matches, progress=lambda *args: None)
+
+    name, summoner_id = db.session.query(
+        Summoner.name, ByReferenceMatch.summoner_id
+    ).join(ByReferenceMatch).group_by(
+        ByReferenceMatch.summoner_id, Summoner.name
+    ).order_by(func.count().desc()).first()
+    champion, = db.session.query(ByReferenceMatch.champion_played).filter_by(
+        summoner_id=summoner_id
+    ).group_by(ByReferenceMatch.champion_played).order_by(func.count().desc()).first()
+    return {'name': name, 'new': 'summoner{}'.format(summoners + 1), 'champion': champion}
+
+
+def run(cases, placeholders, client, tally):
+    results = []
+    for case in cases:
+        arguments = {key: value.format(**placeholders) if isinstance(value, str) else value
+                     for key, value in case.arguments.items()}
+        url = url_for(case.endpoint, **arguments)
+
+        tally.reset()
+        started = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter() - started
+        results.append(Result(case, url, response.status_code, tally.statements,
+                              tally.calls, elapsed * 1000))
+    return results
+
+
+def over_budget(result, time_slack):
+    '''the budgets a result went over'''
+    case = result.case
+    over = []
+    if result.status >= 400:
+        over.append('status {}'.format(result.status))
+    if result.statements > case.statements:
+        over.append('statements')
+    if result.calls > case.calls:
+        over.append('calls')
+    if result.ms > case.ms * time_slack:
+        over.append('time')
+    return over
+
+
+def report(results, time_slack):
+    print('{:<30} {:>12} {:>12} {:>16}'.format('', 'statements', 'api calls', 'ms'))
+    failed = 0
+    for result in results:
+        over = over_budget(result, time_slack)
+        failed += bool(over)
+        print('{:<30} {:>5} / {:<4} {:>5} / {:<4} {:>7.1f} / {:<6} {}'.format(
+            result.case.label, result.statements, result.case.statements,
+            result.calls, result.case.calls, result.ms, result.case.ms * time_slack,
+            'OVER: ' + ', '.join(over) if over else ''))
+    print('{} of {} cases over budget'.format(failed, len(results)))
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--summoners', type=int, default=SUMMONERS)
+    parser.add_argument('--matches', type=int, default=MATCHES)
+    parser.add_argument('--time-slack', type=float, default=1.0,
+                        help='multiplies the time budgets')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = make_app('sqlite:///' + os.path.join(directory, 'routes.db'))
+        # refreshes would run on threads of their own and count towards whatever's next
+        app.config['REFRESH_WORKERS'] = 0
+        riot = FakeRiot(SEED)
+        with app.app_context():
+            placeholders = seed(args.summoners, args.matches)
+        # their histories serve the matches the dataset left unfetched
+        riot.register('summoner{}'.format(n) for n in range(1, args.summoners + 1))
+
+        tally = Tally()
+        with FakeRiotServer('127.0.0.1', 0, riot).start() as server, app.app_context():
+            for api in (game.api, game.aio_api):
+                api.base_url = server.base_url
+                api.on_call = tally.call
+            event.listen(db.engine, 'before_cursor_execute', tally.statement)
+            with app.test_request_context():
+                results = run(CASES, placeholders, app.test_client(), tally)
+
+    failed = report(results, args.time_slack)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,49 @@ class Config:
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
-    POSTS_PER_PAGE = os.environ.get('POSTS_PER_PAGE', 10)
+    POSTS_PER_PAGE = int(os.environ.get('POSTS_PER_PAGE', 10))
+    # seconds a summoner's match history count behind the page links is reused
+    HISTORY_COUNT_TTL = int(os.environ.get('HISTORY_COUNT_TTL', 60))
+    # upper bound of concurrent api calls made for a single page of matches
+    MATCH_FETCH_WORKERS = int(os.environ.get('MATCH_FETCH_WORKERS', 10))
+    # make the api calls of a summoner page on an event loop instead of threads
+    ASYNC_RIOT_API = bool(os.environ.get('ASYNC_RIOT_API'))
+
+    # seconds a summoner's profile, ranks and match list are shown as stored
+    # before they are fetched from the api again
+    SUMMONER_PROFILE_TTL = int(os.environ.get('SUMMONER_PROFILE_TTL', 3600))
+    SUMMONER_RANKS_TTL = int(os.environ.get('SUMMONER_RANKS_TTL', 600))
+    SUMMONER_MATCHES_TTL = int(os.environ.get('SUMMONER_MATCHES_TTL', 300))
+    # a page view of a stale summoner queues a refresh, the page is drawn as stored
+    SUMMONER_REVALIDATE = os.environ.get('SUMMONER_REVALIDATE', '1') != '0'
+
+    # summoner refreshes run in the background, see ogpp/idle/refresh.py.
+    # worker threads per web process, 0 leaves the jobs to `flask refresh work`
+    REFRESH_WORKERS = int(os.environ.get('REFRESH_WORKERS', 2))
+    # seconds after a refresh before the summoner can be refreshed again
+    REFRESH_MIN_INTERVAL = int(os.environ.get('REFRESH_MIN_INTERVAL', 120))
+    # seconds an idle worker waits before looking for queued jobs again
+    REFRESH_POLL_INTERVAL = float(os.environ.get('REFRESH_POLL_INTERVAL', 2))
+    # seconds before a job still running is taken for abandoned and failed
+    REFRESH_JOB_TIMEOUT = int(os.environ.get('REFRESH_JOB_TIMEOUT', 300))
+
+    # per request timings and counts on /metrics, see ogpp/metrics.py
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+    # when set /metrics wants an 'Authorization: Bearer <token>' header
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # profiles of requests, see ogpp/profiling.py.
+    # the fraction of requests profiled at random, i.e. 0.001
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    # requests sending it in an X-Profile header are profiled
+    PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+    # 'cprofile' or 'sample'(stack samples every PROFILE_INTERVAL seconds)
+    PROFILE_MODE = os.environ.get('PROFILE_MODE', 'cprofile')
+    PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+    # defaults to the instance folder's profiles/
+    PROFILE_DIR = os.environ.get('PROFILE_DIR')
+    # the newest this many profiles are kept
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))
 
     SECRET_KEY = os.environ.get('SECRET KEY', os.urandom(16).hex())
 
@@ -0,0 +1,44 @@
+"""indexes for summoner page lookups
+
+Revision ID: 092a5467a198
+Revises: 8ddf2e1d0ed5
+Create Date: 2026-10-18 13:02:41.274519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '092a5467a198'
+down_revision = '8ddf2e1d0ed5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # match history pages, one per combination of the queue/champion filters.
+    # all of them end in timestamp so the newest games are read straight off the index.
+    op.create_index('ix_by_reference_match_summoner_timestamp', 'by_reference_match',
+                    ['summoner_id', 'timestamp'], unique=False)
+    op.create_index('ix_by_reference_match_summoner_mode_timestamp', 'by_reference_match',
+                    ['summoner_id', 'game_mode', 'timestamp'], unique=False)
+    op.create_index('ix_by_reference_match_summoner_champion_timestamp', 'by_reference_match',
+                    ['summoner_id', 'champion_played', 'timestamp'], unique=False)
+    op.create_index('ix_by_reference_match_summoner_mode_champion_timestamp', 'by_reference_match',
+                    ['summoner_id', 'game_mode', 'champion_played', 'timestamp'], unique=False)
+    # win or loss of the page's summoner in a match, and all their games for stats rebuilds
+    op.create_index('ix_player_game_id_name', 'player', ['game_id', 'name'], unique=False)
+    op.create_index('ix_player_name', 'player', ['name'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_player_name', table_name='player')
+    op.drop_index('ix_player_game_id_name', table_name='player')
+    op.drop_index('ix_by_reference_match_summoner_mode_champion_timestamp',
+                  table_name='by_reference_match')
+    op.drop_index('ix_by_reference_match_summoner_champion_timestamp',
+                  table_name='by_reference_match')
+    op.drop_index('ix_by_reference_match_summoner_mode_timestamp',
+                  table_name='by_reference_match')
+    op.drop_index('ix_by_reference_match_summoner_timestamp', table_name='by_reference_match')
@@ -0,0 +1,39 @@
+"""add summoner champion stats table
+
+Revision ID: 28f0ab78d9b5
+Revises: 041ae0cf5a38
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '28f0ab78d9b5'
+down_revision = '041ae0cf5a38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('summoner_champion_stats',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('summoner_id', sa.Integer(), nullable=False),
+    sa.Column('champion_played', sa.String(length=20), nullable=False),
+    sa.Column('game_mode', sa.Integer(), nullable=False),
+    sa.Column('games', sa.Integer(), nullable=True),
+    sa.Column('wins', sa.Integer(), nullable=True),
+    sa.Column('kills', sa.Integer(), nullable=True),
+    sa.Column('deaths', sa.Integer(), nullable=True),
+    sa.Column('assists', sa.Integer(), nullable=True),
+    sa.Column('kda_total', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['summoner_id'], ['summoner.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('summoner_id', 'champion_played', 'game_mode')
+    )
+    # existing summoners are backfilled with `flask stats rebuild`
+
+
+def downgrade():
+    op.drop_table('summoner_champion_stats')
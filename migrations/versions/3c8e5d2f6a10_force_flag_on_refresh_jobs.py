@@ -0,0 +1,25 @@
+"""force flag on refresh jobs
+
+Revision ID: 3c8e5d2f6a10
+Revises: e7a04c5b9f21
+Create Date: 2026-10-18 17:04:52.310876
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8e5d2f6a10'
+down_revision = 'e7a04c5b9f21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('refresh_job', sa.Column('force', sa.Boolean(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('refresh_job') as batch_op:
+        batch_op.drop_column('force')
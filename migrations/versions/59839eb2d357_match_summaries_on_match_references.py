@@ -0,0 +1,86 @@
+"""match summaries on match references
+
+Revision ID: 59839eb2d357
+Revises: d58d98865341
+Create Date: 2026-10-18 15:07:52.118406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '59839eb2d357'
+down_revision = 'd58d98865341'
+branch_labels = None
+depends_on = None
+
+SUMMARY_COLUMNS = [
+    ('win', sa.Boolean()),
+    ('champion_level', sa.Integer()),
+    ('kills', sa.Integer()),
+    ('deaths', sa.Integer()),
+    ('assists', sa.Integer()),
+    ('spell1', sa.String(length=10)),
+    ('spell2', sa.String(length=10)),
+] + [
+    ('item%d' % slot, sa.String(length=5)) for slot in range(1, 8)
+] + [
+    ('duration', sa.Integer()),
+]
+# copied over from the summoner's Player entry, the duration comes from the match
+SUMMARY_FIELDS = [name for name, _ in SUMMARY_COLUMNS if name != 'duration']
+
+
+def upgrade():
+    with op.batch_alter_table('by_reference_match') as batch_op:
+        for name, type_ in SUMMARY_COLUMNS:
+            batch_op.add_column(sa.Column(name, type_, nullable=True))
+    op.add_column('match', sa.Column('duration', sa.Integer(), nullable=True))
+    summarize_stored_matches()
+    # (durations of matches stored before this are unknown)
+
+
+def summarize_stored_matches():
+    '''
+    summarize the existing references of matches already stored, same as
+    fill_match_summaries does. references of matches that aren't stored yet
+    are summarized once they show up on a summoner page
+    '''
+    player = sa.table('player', sa.column('game_id', sa.Integer), sa.column('name', sa.String),
+                      *[sa.column(field) for field in SUMMARY_FIELDS])
+    match = sa.table('match', sa.column('id', sa.Integer), sa.column('match_id', sa.BigInteger))
+    summoner = sa.table('summoner', sa.column('id', sa.Integer), sa.column('name', sa.String))
+    by_reference_match = sa.table('by_reference_match', sa.column('summoner_id', sa.Integer),
+                                  sa.column('match_id', sa.BigInteger),
+                                  *[sa.column(field) for field in SUMMARY_FIELDS])
+    # the reference's own Player entry
+    own_player = sa.and_(
+        match.c.match_id == by_reference_match.c.match_id,
+        player.c.game_id == match.c.id,
+        summoner.c.id == by_reference_match.c.summoner_id,
+        player.c.name == summoner.c.name
+    )
+
+    if op.get_bind().dialect.name == 'postgresql':
+        # UPDATE ... FROM player, match, summoner
+        op.execute(by_reference_match.update().where(own_player).values({
+            field: player.c[field] for field in SUMMARY_FIELDS
+        }))
+        return
+
+    # a subquery per column where there's no UPDATE ... FROM
+    def own(column):
+        return sa.select([column]).where(own_player).limit(1).as_scalar()
+
+    op.execute(by_reference_match.update().where(
+        sa.exists(sa.select([player.c.game_id]).where(own_player))
+    ).values({field: own(player.c[field]) for field in SUMMARY_FIELDS}))
+
+
+def downgrade():
+    with op.batch_alter_table('match') as batch_op:
+        batch_op.drop_column('duration')
+    with op.batch_alter_table('by_reference_match') as batch_op:
+        for name, _ in reversed(SUMMARY_COLUMNS):
+            batch_op.drop_column(name)
@@ -0,0 +1,113 @@
+"""store champions, spells and items as ids
+
+Revision ID: 5d973d0f1177
+Revises: 59839eb2d357
+Create Date: 2026-10-18 16:12:30.661824
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from ogpp.game.consts import CHAMPION_BY_ID, SUMMONER_SPELLS
+
+
+# revision identifiers, used by Alembic.
+revision = '5d973d0f1177'
+down_revision = '59839eb2d357'
+branch_labels = None
+depends_on = None
+
+ITEMS = ['item%d' % slot for slot in range(1, 8)]
+SPELL_BY_NAME = {name: spell_id for spell_id, name in SUMMONER_SPELLS.items()}
+
+
+def lookup(column, values, else_=None):
+    '''CASE expression mapping every key of values to its value'''
+    return sa.case([(column == key, value) for key, value in values.items()], else_=else_)
+
+
+def upgrade():
+    player = sa.table('player', sa.column('champion_played', sa.String),
+                      sa.column('champion_id', sa.SmallInteger),
+                      sa.column('spell1', sa.String), sa.column('spell1_id', sa.SmallInteger),
+                      sa.column('spell2', sa.String), sa.column('spell2_id', sa.SmallInteger))
+    by_reference_match = sa.table('by_reference_match',
+                                  sa.column('spell1', sa.String),
+                                  sa.column('spell1_id', sa.SmallInteger),
+                                  sa.column('spell2', sa.String),
+                                  sa.column('spell2_id', sa.SmallInteger))
+
+    with op.batch_alter_table('player') as batch_op:
+        batch_op.add_column(sa.Column('champion_id', sa.SmallInteger(), nullable=True))
+        batch_op.add_column(sa.Column('spell1_id', sa.SmallInteger(), nullable=True))
+        batch_op.add_column(sa.Column('spell2_id', sa.SmallInteger(), nullable=True))
+    with op.batch_alter_table('by_reference_match') as batch_op:
+        batch_op.add_column(sa.Column('spell1_id', sa.SmallInteger(), nullable=True))
+        batch_op.add_column(sa.Column('spell2_id', sa.SmallInteger(), nullable=True))
+
+    # names back to the ids they were looked up from
+    op.execute(player.update().values(
+        champion_id=lookup(player.c.champion_played, CHAMPION_BY_ID),
+        spell1_id=lookup(player.c.spell1, SPELL_BY_NAME),
+        spell2_id=lookup(player.c.spell2, SPELL_BY_NAME)
+    ))
+    # champions we had no name for were stored as their id
+    op.execute(player.update().where(sa.and_(
+        player.c.champion_id.is_(None), player.c.champion_played.isnot(None)
+    )).values(champion_id=sa.cast(player.c.champion_played, sa.SmallInteger)))
+    op.execute(by_reference_match.update().values(
+        spell1_id=lookup(by_reference_match.c.spell1, SPELL_BY_NAME),
+        spell2_id=lookup(by_reference_match.c.spell2, SPELL_BY_NAME)
+    ))
+
+    # items always were ids, just kept as text
+    for table, dropped in (('player', ['champion_played', 'spell1', 'spell2']),
+                           ('by_reference_match', ['spell1', 'spell2'])):
+        with op.batch_alter_table(table) as batch_op:
+            for column in dropped:
+                batch_op.drop_column(column)
+            for item in ITEMS:
+                batch_op.alter_column(item, existing_type=sa.String(length=5),
+                                      type_=sa.SmallInteger(),
+                                      postgresql_using='{}::smallint'.format(item))
+
+
+def downgrade():
+    player = sa.table('player', sa.column('champion_played', sa.String),
+                      sa.column('champion_id', sa.SmallInteger),
+                      sa.column('spell1', sa.String), sa.column('spell1_id', sa.SmallInteger),
+                      sa.column('spell2', sa.String), sa.column('spell2_id', sa.SmallInteger))
+    by_reference_match = sa.table('by_reference_match',
+                                  sa.column('spell1', sa.String),
+                                  sa.column('spell1_id', sa.SmallInteger),
+                                  sa.column('spell2', sa.String),
+                                  sa.column('spell2_id', sa.SmallInteger))
+    champion_names = {champion_id: name for name, champion_id in CHAMPION_BY_ID.items()}
+
+    for table, added in (('player', [('champion_played', 20), ('spell1', 10), ('spell2', 10)]),
+                         ('by_reference_match', [('spell1', 10), ('spell2', 10)])):
+        with op.batch_alter_table(table) as batch_op:
+            for column, length in added:
+                batch_op.add_column(sa.Column(column, sa.String(length=length), nullable=True))
+            for item in ITEMS:
+                batch_op.alter_column(item, existing_type=sa.SmallInteger(),
+                                      type_=sa.String(length=5))
+
+    op.execute(player.update().values(
+        champion_played=lookup(player.c.champion_id, champion_names,
+                               else_=sa.cast(player.c.champion_id, sa.String)),
+        spell1=lookup(player.c.spell1_id, SUMMONER_SPELLS, else_=SUMMONER_SPELLS[0]),
+        spell2=lookup(player.c.spell2_id, SUMMONER_SPELLS, else_=SUMMONER_SPELLS[0])
+    ))
+    op.execute(by_reference_match.update().values(
+        spell1=lookup(by_reference_match.c.spell1_id, SUMMONER_SPELLS),
+        spell2=lookup(by_reference_match.c.spell2_id, SUMMONER_SPELLS)
+    ))
+
+    with op.batch_alter_table('by_reference_match') as batch_op:
+        batch_op.drop_column('spell2_id')
+        batch_op.drop_column('spell1_id')
+    with op.batch_alter_table('player') as batch_op:
+        batch_op.drop_column('spell2_id')
+        batch_op.drop_column('spell1_id')
+        batch_op.drop_column('champion_id')
@@ -0,0 +1,50 @@
+"""unique match references, matches and players
+
+Revision ID: 8ddf2e1d0ed5
+Revises: 28f0ab78d9b5
+Create Date: 2026-10-18 11:40:05.918273
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8ddf2e1d0ed5'
+down_revision = '28f0ab78d9b5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # drop the duplicates concurrent refreshes and crawler runs left behind,
+    # keeping the oldest row of each. players of duplicate matches go with them.
+    op.execute(
+        'DELETE FROM by_reference_match WHERE id NOT IN ('
+        'SELECT MIN(id) FROM by_reference_match GROUP BY summoner_id, match_id)'
+    )
+    op.execute(
+        'DELETE FROM player WHERE game_id IN ('
+        'SELECT id FROM match WHERE id NOT IN (SELECT MIN(id) FROM match GROUP BY match_id))'
+    )
+    op.execute(
+        'DELETE FROM match WHERE id NOT IN (SELECT MIN(id) FROM match GROUP BY match_id)'
+    )
+
+    op.create_index(op.f('ix_match_match_id'), 'match', ['match_id'], unique=True)
+    with op.batch_alter_table('by_reference_match') as batch_op:
+        batch_op.create_unique_constraint('uq_by_reference_match_summoner_id_match_id',
+                                          ['summoner_id', 'match_id'])
+    # participant_id was never filled in before, NULLs don't collide
+    with op.batch_alter_table('player') as batch_op:
+        batch_op.create_unique_constraint('uq_player_game_id_participant_id',
+                                          ['game_id', 'participant_id'])
+    # champion stats counted the duplicates, recount with `flask stats rebuild`
+
+
+def downgrade():
+    with op.batch_alter_table('player') as batch_op:
+        batch_op.drop_constraint('uq_player_game_id_participant_id', type_='unique')
+    with op.batch_alter_table('by_reference_match') as batch_op:
+        batch_op.drop_constraint('uq_by_reference_match_summoner_id_match_id', type_='unique')
+    op.drop_index(op.f('ix_match_match_id'), table_name='match')
@@ -0,0 +1,40 @@
+"""add refresh job table
+
+Revision ID: b3f1c2a9d7e4
+Revises: 5d973d0f1177
+Create Date: 2026-10-18 14:02:11.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f1c2a9d7e4'
+down_revision = '5d973d0f1177'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('refresh_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('summoner_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=True),
+    sa.Column('active_summoner_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('error', sa.String(length=200), nullable=True),
+    sa.ForeignKeyConstraint(['summoner_id'], ['summoner.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('active_summoner_id')
+    )
+    op.create_index('ix_refresh_job_summoner_id_id', 'refresh_job', ['summoner_id', 'id'], unique=False)
+    op.create_index(op.f('ix_refresh_job_status'), 'refresh_job', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_refresh_job_status'), table_name='refresh_job')
+    op.drop_index('ix_refresh_job_summoner_id_id', table_name='refresh_job')
+    op.drop_table('refresh_job')
@@ -0,0 +1,38 @@
+"""match history indexes end in id
+
+Revision ID: d58d98865341
+Revises: 092a5467a198
+Create Date: 2026-10-18 14:21:09.530127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd58d98865341'
+down_revision = '092a5467a198'
+branch_labels = None
+depends_on = None
+
+# index name -> columns in front of the page order
+INDEXES = {
+    'ix_by_reference_match_summoner_timestamp': ['summoner_id'],
+    'ix_by_reference_match_summoner_mode_timestamp': ['summoner_id', 'game_mode'],
+    'ix_by_reference_match_summoner_champion_timestamp': ['summoner_id', 'champion_played'],
+    'ix_by_reference_match_summoner_mode_champion_timestamp': ['summoner_id', 'game_mode',
+                                                               'champion_played'],
+}
+
+
+def upgrade():
+    # match history pages are ordered by (timestamp, id) for their cursors
+    for name, columns in INDEXES.items():
+        op.drop_index(name, table_name='by_reference_match')
+        op.create_index(name, 'by_reference_match', columns + ['timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    for name, columns in INDEXES.items():
+        op.drop_index(name, table_name='by_reference_match')
+        op.create_index(name, 'by_reference_match', columns + ['timestamp'], unique=False)
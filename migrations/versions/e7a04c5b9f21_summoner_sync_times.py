@@ -0,0 +1,30 @@
+"""summoner sync times
+
+Revision ID: e7a04c5b9f21
+Revises: b3f1c2a9d7e4
+Create Date: 2026-10-18 15:21:47.093412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a04c5b9f21'
+down_revision = 'b3f1c2a9d7e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NULL for the summoners stored so far, they count as stale
+    op.add_column('summoner', sa.Column('profile_synced_at', sa.DateTime(), nullable=True))
+    op.add_column('summoner', sa.Column('ranks_synced_at', sa.DateTime(), nullable=True))
+    op.add_column('summoner', sa.Column('matches_synced_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('summoner') as batch_op:
+        batch_op.drop_column('matches_synced_at')
+        batch_op.drop_column('ranks_synced_at')
+        batch_op.drop_column('profile_synced_at')
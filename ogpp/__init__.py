@@ -38,4 +38,15 @@ def create_app(config=Config):
     app.register_blueprint(routes.summoner_bp)
     app.register_blueprint(routes.leaderboard_bp)
 
+    from . import metrics
+    metrics.init_app(app)
+    from . import profiling
+    profiling.init_app(app)
+
+    from . import commands
+    app.cli.add_command(commands.stats_cli)
+    app.cli.add_command(commands.archive_cli)
+    app.cli.add_command(commands.profile_cli)
+    app.cli.add_command(commands.refresh_cli)
+
     return app
@@ -0,0 +1,137 @@
+'''
+command line tools, run through flask's cli i.e.
+
+    flask stats rebuild
+    flask stats rebuild "some summoner" "another summoner"
+    flask archive reprocess --column damage_dealt --column damage_healed
+    flask profile list
+    flask refresh work
+'''
+import os
+import pstats
+from collections import Counter
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from . import profiling
+from .game import archive
+from .helpers import reprocess
+from .helpers.stats import rebuild_champion_stats, fill_match_summaries
+from .helpers.storage import sanitize_name
+from .idle import refresh
+from .models import Summoner
+
+stats_cli = AppGroup('stats', help='Upkeep of the per summoner champion statistics '
+                                    'and match summaries.')
+archive_cli = AppGroup('archive', help='Work with the archived match payloads '
+                                        '(RIOT_MATCH_ARCHIVE).')
+refresh_cli = AppGroup('refresh', help='Run the queued summoner refreshes.')
+profile_cli = AppGroup('profile', help='Look at the profiles of requests (PROFILE_DIR).')
+
+
+@stats_cli.command('rebuild')
+@click.argument('names', nargs=-1)
+def rebuild_stats(names):
+    '''Recount champion statistics and match summaries of the given summoners, or of everyone.'''
+    summoners = Summoner.query
+    if names:
+        indexed_names = [sanitize_name(name) for name in names]
+        summoners = summoners.filter(Summoner.indexed_name.in_(indexed_names))
+
+    summoners = summoners.order_by(Summoner.id).all()
+    with click.progressbar(summoners, label='Rebuilding champion stats') as bar:
+        for summoner in bar:
+            fill_match_summaries(summoner)
+            # commits the summaries along with the stats
+            rebuild_champion_stats(summoner)
+
+    click.echo('Rebuilt champion stats of {} summoners'.format(len(summoners)))
+
+
+@archive_cli.command('reprocess')
+@click.option('--column', '-c', 'columns', multiple=True,
+              type=click.Choice(reprocess.match_fields() + reprocess.player_fields()),
+              help='Column to write, can be given several times. Defaults to all of them.')
+@click.option('--workers', '-w', type=int, default=None,
+              help='Processes decoding payloads, defaults to the amount of cpus.')
+@click.option('--batch-size', '-b', type=int, default=200, show_default=True,
+              help='Matches per batch and UPDATE.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=None,
+              help='Where to keep track of progress, defaults to the archive directory.')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint of an earlier run.')
+def reprocess_archive(columns, workers, batch_size, checkpoint, restart):
+    '''Write Match and Player columns anew from every archived match payload.'''
+    if archive is None:
+        raise click.ClickException('RIOT_MATCH_ARCHIVE is not set, there is no archive')
+
+    columns = list(columns) or reprocess.match_fields() + reprocess.player_fields()
+    if checkpoint is None:
+        checkpoint = os.path.join(archive.directory, 'reprocess.checkpoint')
+    if restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    progress = None
+    try:
+        for progress in reprocess.reprocess_archive(archive, columns, checkpoint,
+                                                    workers=workers, batch_size=batch_size):
+            click.echo('\r{0.read}/{1} matches read, {0.matches} matches and {0.players} '
+                       'players written, {0.rate:.0f} matches/s'.format(progress, len(archive)),
+                       nl=False)
+    except ValueError as e:
+        raise click.ClickException('{}, run again with --restart'.format(e))
+
+    if progress is None:
+        click.echo('Nothing left to reprocess, see --restart')
+        return
+    click.echo('\nReprocessed {0.read} matches in {0.elapsed:.1f}s, '
+               '{0.skipped} of them are archived but not stored'.format(progress))
+
+
+@profile_cli.command('list')
+def list_profiles():
+    '''List the profiles taken, oldest first.'''
+    directory = profiling.profile_dir()
+    names = profiling.profiles(directory)
+    for name in names:
+        click.echo(name)
+    click.echo('{} profiles in {}'.format(len(names), directory))
+
+
+@profile_cli.command('show')
+@click.argument('name')
+@click.option('--sort', '-s', default='cumulative', show_default=True,
+              help='pstats sort key of .pstats profiles.')
+@click.option('--limit', '-n', type=int, default=30, show_default=True,
+              help='Functions to show.')
+def show_profile(name, sort, limit):
+    '''Print the functions a profile spent its time in.'''
+    path = os.path.join(profiling.profile_dir(), os.path.basename(name))
+    if not os.path.exists(path):
+        raise click.ClickException('no profile named {}, see flask profile list'.format(name))
+
+    if path.endswith('.pstats'):
+        pstats.Stats(path).strip_dirs().sort_stats(sort).print_stats(limit)
+        return
+
+    # collapsed stacks, the innermost frame of a sample is where the time went
+    samples = Counter()
+    with open(path) as f:
+        for line in f:
+            stack, count = line.rsplit(' ', 1)
+            samples[stack.rsplit(';', 1)[-1]] += int(count)
+    total = sum(samples.values())
+    click.echo('{} samples'.format(total))
+    for frame, count in samples.most_common(limit):
+        click.echo('{:6.1%} {:6} {}'.format(count / total, count, frame))
+
+
+@refresh_cli.command('work')
+def refresh_work():
+    '''Run queued summoner refreshes until interrupted.'''
+    click.echo('Working on refresh jobs, ctrl-c to stop')
+    try:
+        refresh.work(current_app._get_current_object())
+    except KeyboardInterrupt:
+        pass
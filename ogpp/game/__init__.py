@@ -1,7 +1,45 @@
 import os
 
 from .consts import (QUEUE_TYPE, _QUEUE_TYPE, CHAMPIONS,
-                     RANK_DIVISIONS, RANK_TIERS, SUMMONER_SPELLS, _TEAMS)
-from .api import RiotAPI
+                     RANK_DIVISIONS, RANK_TIERS, SUMMONER_SPELLS, _TEAMS,
+                     champion_name, spell_name)
+from .api import RiotAPI, AsyncRiotAPI, EventLoop
+from .ratelimit import RateLimiter, MemoryStore, SQLiteStore, INTERACTIVE, BACKGROUND
+from .cache import ResponseCache, MemoryBackend, SQLiteBackend
+from .archive import MatchArchive
 
-api = RiotAPI(os.environ.get('RIOT_API_KEY'))
+# point this at a file to share the rate limit buckets between processes
+_rate_limit_store = os.environ.get('RIOT_RATE_LIMIT_STORE')
+
+limiter = RateLimiter(
+    os.environ.get('RIOT_APP_RATE_LIMIT', '20:1,100:120'),
+    store=SQLiteStore(_rate_limit_store) if _rate_limit_store else MemoryStore()
+)
+
+# same as above, a file lets every worker process share cached responses
+_cache_file = os.environ.get('RIOT_API_CACHE')
+_cache_size = int(os.environ.get('RIOT_API_CACHE_SIZE', 2048))
+
+cache = ResponseCache(
+    SQLiteBackend(_cache_file, _cache_size) if _cache_file else MemoryBackend(_cache_size)
+)
+
+# a directory to keep every fetched match payload in, see archive.py
+_archive_dir = os.environ.get('RIOT_MATCH_ARCHIVE')
+archive = MatchArchive(_archive_dir) if _archive_dir else None
+
+_api_kwargs = dict(
+    pool_size=int(os.environ.get('RIOT_API_POOL_SIZE', 10)),
+    max_retries=int(os.environ.get('RIOT_API_MAX_RETRIES', 2)),
+    limiter=limiter,
+    cache=cache,
+    archive=archive,
+    # another server speaking riot's api, i.e. http://127.0.0.1:8001/lol/{api_url}
+    base_url=os.environ.get('RIOT_API_BASE_URL')
+)
+
+api = RiotAPI(os.environ.get('RIOT_API_KEY'), **_api_kwargs)
+
+# used when ASYNC_RIOT_API is turned on, all of its calls run on aio_loop
+aio_api = AsyncRiotAPI(os.environ.get('RIOT_API_KEY'), **_api_kwargs)
+aio_loop = EventLoop()
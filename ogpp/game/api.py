@@ -1,6 +1,16 @@
+import asyncio
+import contextvars
+import copy
+import threading
+import time
+
 from .consts import CHAMPION_BY_ID
+from .ratelimit import RateLimiter, INTERACTIVE
+from .cache import MISSING, MemoryBackend, ResponseCache
+from .singleflight import SingleFlight, AsyncSingleFlight
 
 import requests
+from requests.adapters import HTTPAdapter
 
 '''
 riot api module
@@ -45,28 +55,145 @@ REGIONS = {
     'north_america': 'na1'
 }
 
+# (connect, read) timeouts in seconds, keyed the same way as API_VERSION.
+# leaderboards are by far the largest payloads so they get the most room.
+TIMEOUTS = {
+    'default': (3.05, 10),
+    'summoner': (3.05, 5),
+    'champion_mastery': (3.05, 5),
+    'match_history': (3.05, 10),
+    'match_by_id': (3.05, 10),
+    'summoner_rank': (3.05, 5),
+    'masters': (3.05, 20),
+    'grandmasters': (3.05, 20),
+    'challengers': (3.05, 20)
+}
+
+# rate limited or the server is having a bad time, worth another try.
+# anything else(400, 401, 403, 404, 415...) won't change by asking again.
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
 
 class BadResponse(BaseException):
-    '''Raised exception when we get a bad response code from the server'''
-    pass
+    '''
+    Raised exception when we get a bad response code from the server.
+    status_code is None when the request never got a response at all
+    (timeouts, refused connections, etc.)
+    '''
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(status_code)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.status_code is None or self.status_code in RETRYABLE_STATUS_CODES
 
 
 # The main api.
 class RiotAPI:
-    def __init__(self, api_key, region=REGIONS['north_america']):
+    def __init__(self, api_key, region=REGIONS['north_america'],
+                 pool_size=10, max_retries=2, backoff=0.5,
+                 max_retry_wait=10, timeouts=None,
+                 limiter=None, priority=INTERACTIVE, cache=None, archive=None,
+                 base_url=None):
         # api key expires daily. need to generate one from developers.riotgames.com
         self.api_key = api_key
         self.region = region
+        # where requests go, formatted like URL['base_url'].
+        # i.e. 'http://127.0.0.1:8001/lol/{api_url}' for benchmarks/fake_riot.py
+        self.base_url = base_url or URL['base_url']
+        # optional ResponseCache, responses are only fetched when it misses
+        self.cache = cache
+        # optional MatchArchive, every match fetched is kept in it for good
+        # and read back from it instead of asking riot again
+        self.archive = archive
+        # identical calls made at the same time are only sent once
+        self.inflight = SingleFlight()
+        # optional on_call(endpoint, source, seconds) called after every call,
+        # source is where the data came from: 'archive', 'cache' or 'riot'
+        self.on_call = None
+
+        # every caller sharing this limiter draws from the same buckets,
+        # priority decides how much of those buckets this instance may use
+        self.limiter = limiter or RateLimiter()
+        self.priority = priority
+
+        self.max_retries = max_retries
+        self.backoff = backoff
+        # don't pin a web thread on a long Retry-After, just fail instead
+        self.max_retry_wait = max_retry_wait
+        self.timeouts = dict(TIMEOUTS, **(timeouts or {}))
+
+        # pool_size is the amount of connections kept open per host, it
+        # should be at least the amount of threads making api calls.
+        self.pool_size = pool_size
+        self.session = self._open_session()
 
     def __repr__(self):
         return "RiotAPI<key: {0.api_key}>".format(self)
 
-    def get(self, api_url, params=None):
+    def _open_session(self):
+        # keep-alive connections to the region host are reused between calls
+        # so we only pay for the tcp + tls handshake once per connection.
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(REGIONS), pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def with_priority(self, priority):
+        '''
+        the same api(session, limiter) making its calls with another priority.
+        background jobs should use api.with_priority(BACKGROUND)
+        so they back off before page views do.
+        calls aren't coalesced with the original's, a page view shouldn't
+        end up waiting on a background call held back by the limiter.
+        '''
+        api = copy.copy(self)
+        api.priority = priority
+        api.inflight = type(self.inflight)()
+        return api
+
+    def get(self, api_url, params=None, endpoint='default', archive_id=None):
         '''
         send out a prepared api request.
         params should be a dictionary.
-        returns a response object.
+        endpoint is the key used to look up the timeouts for the request.
+        archive_id is the match id of match requests, which go through the archive.
+        returns the decoded json body of the response.
+
+        429s and 5xx responses are retried up to max_retries times,
+        everything else raises BadResponse straight away.
         '''
+        started = time.perf_counter()
+        full_url, args, timeout = self._prepare(api_url, params, endpoint)
+
+        data, source = self._archived(archive_id), 'archive'
+        if data is MISSING:
+            data, source = self._cached(endpoint, full_url, args), 'cache'
+        if data is MISSING:
+            key = ResponseCache.make_key(endpoint, full_url, args)
+            data = self.inflight.do(key, self._fetch, full_url, args, timeout, endpoint)
+            source = 'riot'
+        self._archive(archive_id, data)
+        self._called(endpoint, source, started)
+        return data
+
+    def _fetch(self, full_url, args, timeout, endpoint):
+        attempt = 0
+        while True:
+            self._acquire(endpoint)
+            try:
+                data = self._send(full_url, args, timeout, endpoint)
+                self._store(endpoint, full_url, args, data)
+                return data
+            except BadResponse as e:
+                delay = self._retry_delay(attempt, e)
+            time.sleep(delay)
+            attempt += 1
+
+    def _prepare(self, api_url, params, endpoint):
         args = {
             'api_key': self.api_key
         }
@@ -75,12 +202,72 @@ class RiotAPI:
                 if key not in args:
                     args[key] = value
 
-        full_url = URL['base_url'].format(region=self.region, api_url=api_url)
-        response = requests.get(full_url, params=args)
-        if response.status_code != 200:
-            raise BadResponse(response.status_code)
+        full_url = self.base_url.format(region=self.region, api_url=api_url)
+        timeout = self.timeouts.get(endpoint, self.timeouts['default'])
+        return full_url, args, timeout
+
+    def _cached(self, endpoint, full_url, args):
+        if self.cache is None:
+            return MISSING
+        return self.cache.get(endpoint, full_url, args)
+
+    def _store(self, endpoint, full_url, args, data):
+        if self.cache is not None:
+            self.cache.set(endpoint, full_url, args, data)
+
+    def _archived(self, archive_id):
+        if self.archive is None or archive_id is None:
+            return MISSING
+        data = self.archive.get(archive_id)
+        return MISSING if data is None else data
+
+    def _archive(self, archive_id, data):
+        # a no-op for matches that are archived already
+        if self.archive is not None and archive_id is not None:
+            self.archive.put(archive_id, data)
+
+    def _called(self, endpoint, source, started):
+        if self.on_call is not None:
+            self.on_call(endpoint, source, time.perf_counter() - started)
+
+    def _acquire(self, endpoint):
+        if not self.limiter.acquire(endpoint, self.priority, timeout=self.max_retry_wait):
+            # we'd wait longer for a free slot than we'd wait on a Retry-After
+            raise BadResponse(429)
+
+    def _send(self, full_url, args, timeout, endpoint):
+        try:
+            response = self.session.get(full_url, params=args, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise BadResponse(None) from e
+
+        self._check_response(endpoint, response.status_code, response.headers)
         return response.json()
 
+    def _check_response(self, endpoint, status_code, headers):
+        self.limiter.update(endpoint, headers)
+        if status_code == 429:
+            self.limiter.backoff(endpoint, headers)
+        if status_code != 200:
+            retry_after = headers.get('Retry-After')
+            if retry_after is not None:
+                retry_after = float(retry_after)
+            raise BadResponse(status_code, retry_after)
+
+    def _retry_delay(self, attempt, error):
+        '''
+        honor Retry-After if riot sent one, otherwise back off exponentially.
+        reraises the error if it isn't worth another try.
+        '''
+        if error.retry_after is not None:
+            delay = error.retry_after
+        else:
+            delay = self.backoff * (2 ** attempt)
+
+        if not error.retryable or attempt >= self.max_retries or delay > self.max_retry_wait:
+            raise error
+        return delay
+
     # api calls
     def grab_summoner(self, arg, method='by_name'):
         '''
@@ -93,7 +280,7 @@ class RiotAPI:
         '''
         api_url = URL['summoner'][method].format(version=API_VERSION['summoner'],
                                                  arg=arg)
-        summoner_data = self.get(api_url)
+        summoner_data = self.get(api_url, endpoint='summoner')
 
         return summoner_data
 
@@ -131,7 +318,7 @@ class RiotAPI:
         api_url = URL['match']['history'].format(version=API_VERSION['match_history'],
                                                  encrypted_account_id=account_id)
 
-        match_history = self.get(api_url, params)
+        match_history = self.get(api_url, params, endpoint='match_history')
         return match_history
 
     def get_match_stats(self, match_id):
@@ -141,7 +328,7 @@ class RiotAPI:
             match_id=match_id
         )
 
-        match_data = self.get(api_url)
+        match_data = self.get(api_url, endpoint='match_by_id', archive_id=int(match_id))
         return match_data
 
     def get_summoner_ranks(self, summoner_id):
@@ -151,7 +338,7 @@ class RiotAPI:
             encrypted_summoner_id=summoner_id
         )
 
-        summoner_rank_data = self.get(api_url)
+        summoner_rank_data = self.get(api_url, endpoint='summoner_rank')
         return summoner_rank_data
 
     def get_summoner_mastery(self, summoner_id):
@@ -160,7 +347,7 @@ class RiotAPI:
             encrypted_summoner_id=summoner_id
         )
 
-        mastery_list = self.get(api_url)
+        mastery_list = self.get(api_url, endpoint='champion_mastery')
         return mastery_list
 
     def get_leaderboard(self, leaderboard_type='masters', queue='RANKED_SOLO_5x5'):
@@ -170,9 +357,170 @@ class RiotAPI:
         default choices provided are from masters and ranked solor
         '''
         api_url = URL['league'][leaderboard_type].format(
-            version=API_VERSION['masters'],
+            version=API_VERSION[leaderboard_type],
             queue=queue
         )
 
-        leaderboard = self.get(api_url)
+        leaderboard = self.get(api_url, endpoint=leaderboard_type)
         return leaderboard
+
+
+class AsyncRiotAPI(RiotAPI):
+    '''
+    asyncio flavor of RiotAPI, every api call returns an awaitable instead.
+
+    the api call methods are shared with RiotAPI as they only build
+    the request and hand back whatever get() returns, which here is a coroutine.
+
+        summoner = await aio_api.grab_summoner(name)
+        ranks, history = await asyncio.gather(
+            aio_api.get_summoner_ranks(summoner['id']),
+            aio_api.get_match_history_list(summoner['accountId'])
+        )
+
+    the aiohttp session is bound to the event loop it was first used on,
+    so keep an instance to a single loop(see EventLoop below).
+
+    the archive and a cache backend other than MemoryBackend(i.e. SQLiteBackend)
+    read and write files, those calls run in the loop's default executor so
+    they don't hold up the other coroutines on the loop.
+    '''
+    def __repr__(self):
+        return "AsyncRiotAPI<key: {0.api_key}>".format(self)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.inflight = AsyncSingleFlight()
+
+    def _open_session(self):
+        # aiohttp sessions have to be made inside the loop, see _send_async
+        return None
+
+    async def get(self, api_url, params=None, endpoint='default', archive_id=None):
+        started = time.perf_counter()
+        full_url, args, timeout = self._prepare(api_url, params, endpoint)
+
+        data, source = await self._archived_async(archive_id), 'archive'
+        if data is MISSING:
+            data, source = await self._cached_async(endpoint, full_url, args), 'cache'
+        if data is MISSING:
+            key = ResponseCache.make_key(endpoint, full_url, args)
+            data = await self.inflight.do(key, self._fetch_async, full_url, args, timeout, endpoint)
+            source = 'riot'
+        await self._archive_async(archive_id, data)
+        self._called(endpoint, source, started)
+        return data
+
+    # the archive and cache calls, off the loop when they go to disk
+    async def _archived_async(self, archive_id):
+        if self.archive is None or archive_id is None:
+            return MISSING
+        return await self._in_executor(self._archived, archive_id)
+
+    async def _archive_async(self, archive_id, data):
+        if self.archive is not None and archive_id is not None:
+            await self._in_executor(self._archive, archive_id, data)
+
+    async def _cached_async(self, endpoint, full_url, args):
+        if not self._cache_on_disk():
+            return self._cached(endpoint, full_url, args)
+        return await self._in_executor(self._cached, endpoint, full_url, args)
+
+    async def _store_async(self, endpoint, full_url, args, data):
+        if not self._cache_on_disk():
+            self._store(endpoint, full_url, args, data)
+        else:
+            await self._in_executor(self._store, endpoint, full_url, args, data)
+
+    def _cache_on_disk(self):
+        return self.cache is not None and not isinstance(self.cache.backend, MemoryBackend)
+
+    @staticmethod
+    async def _in_executor(fn, *args):
+        return await asyncio.get_event_loop().run_in_executor(None, fn, *args)
+
+    async def _fetch_async(self, full_url, args, timeout, endpoint):
+        attempt = 0
+        while True:
+            await self._acquire_async(endpoint)
+            try:
+                data = await self._send_async(full_url, args, timeout, endpoint)
+                await self._store_async(endpoint, full_url, args, data)
+                return data
+            except BadResponse as e:
+                delay = self._retry_delay(attempt, e)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _acquire_async(self, endpoint):
+        deadline = time.time() + self.max_retry_wait
+        while True:
+            wait = self.limiter.reserve(endpoint, self.priority)
+            if not wait:
+                return
+            if time.time() + wait > deadline:
+                raise BadResponse(429)
+            await asyncio.sleep(wait)
+
+    async def _send_async(self, full_url, args, timeout, endpoint):
+        import aiohttp
+
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit_per_host=self.pool_size)
+            self.session = aiohttp.ClientSession(connector=connector)
+
+        connect_timeout, read_timeout = timeout
+        client_timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout,
+                                               sock_read=read_timeout)
+        # aiohttp only takes strings as query values
+        args = {key: str(value) for key, value in args.items()}
+        try:
+            async with self.session.get(full_url, params=args, timeout=client_timeout) as response:
+                self._check_response(endpoint, response.status, response.headers)
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise BadResponse(None) from e
+
+
+class EventLoop:
+    '''
+    an event loop running forever in a daemon thread so that
+    synchronous code(flask views) can hand it coroutines and wait for the result.
+    one loop per process means the AsyncRiotAPI connection pool outlives requests.
+    '''
+    def __init__(self):
+        self.loop = None
+        self._lock = threading.Lock()
+
+    def run(self, coro, timeout=None):
+        '''
+        run coro on the loop and wait for its result.
+        it sees the context variables of the calling thread(i.e. ogpp.metrics' tally)
+        '''
+        if self.loop is None:
+            self._start()
+        context = contextvars.copy_context()
+        future = asyncio.run_coroutine_threadsafe(_in_context(context, coro), self.loop)
+        return future.result(timeout)
+
+    def _start(self):
+        with self._lock:
+            if self.loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, daemon=True,
+                                      name='riot-api-event-loop')
+            thread.start()
+            self.loop = loop
+
+
+async def _in_context(context, coro):
+    # the task running this has a context of its own, tasks it starts copy it
+    for var, value in context.items():
+        var.set(value)
+    return await coro
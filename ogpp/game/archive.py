@@ -0,0 +1,259 @@
+'''
+archive of the raw match payloads fetched from the riot api.
+
+we only keep part of a match in the database. everything the api sent is
+kept here too so that new columns and stats can be filled in later
+without spending api quota on matches we already fetched once.
+
+the archive is a directory of append-only segment files plus an index:
+
+    segment-000001.z    [header][zlib compressed json][header][...]...
+    segment-000002.z    a new segment is started once the last one is full
+    index               (match id, segment, offset, length) per payload
+
+records are never rewritten, a match is stored once and read back by
+its match id through the index(from memory mapped segments by default).
+several processes may share an archive, appends are serialized
+through a lock file and readers pick up each other's index entries.
+'''
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    # no locking between processes on windows, one writer process only
+    fcntl = None
+
+# match id, length of the compressed payload that follows
+RECORD_HEADER = struct.Struct('<qI')
+# match id, segment, offset of the compressed payload, its length
+INDEX_ENTRY = struct.Struct('<qIQI')
+
+SEGMENT_NAME = 'segment-{:06d}.z'
+SEGMENT_PATTERN = re.compile(r'^segment-(\d{6})\.z$')
+
+
+def encode(payload, level=6):
+    return zlib.compress(json.dumps(payload, separators=(',', ':')).encode(), level)
+
+
+def decode(raw):
+    '''a payload from its archived bytes, see MatchArchive.raw_items()'''
+    return json.loads(zlib.decompress(raw).decode())
+
+
+class MatchArchive:
+    '''
+    archive = MatchArchive('/var/lib/ogpp/matches')
+    archive.put(match['gameId'], match)
+    match = archive.get(3000000000)   # None if it was never archived
+    '''
+    def __init__(self, directory, segment_size=64 * 2 ** 20, level=6, use_mmap=True):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.level = level
+        self.use_mmap = use_mmap
+        os.makedirs(directory, exist_ok=True)
+
+        # match id -> (segment, offset, length)
+        self._index = {}
+        # how much of the index file has been read into _index so far
+        self._index_read = 0
+        self._maps = {}
+        # reentrant, put() refreshes the index while holding it
+        self._lock = threading.RLock()
+        self._refresh_index()
+
+    def __repr__(self):
+        return "MatchArchive<{0.directory}, matches: {1}>".format(self, len(self))
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, match_id):
+        return self._lookup(match_id) is not None
+
+    def get(self, match_id):
+        '''the archived payload of a match, None if it isn't archived'''
+        entry = self._lookup(match_id)
+        if entry is None:
+            return None
+        return decode(self._read(*entry))
+
+    def put(self, match_id, payload):
+        '''archive a payload unless the match already is, returns whether it was written'''
+        if match_id in self._index:
+            return False
+
+        raw = encode(payload, self.level)
+        with self._lock, _FileLock(self._path('lock')):
+            # another process may have archived it in the meantime
+            self._refresh_index()
+            if match_id in self._index:
+                return False
+
+            segment = self._writable_segment(len(raw))
+            with open(self._path(SEGMENT_NAME.format(segment)), 'ab') as f:
+                offset = f.tell() + RECORD_HEADER.size
+                f.write(RECORD_HEADER.pack(match_id, len(raw)) + raw)
+            # the payload is written before it is indexed, so readers
+            # never find an entry pointing past the end of a segment
+            entry = INDEX_ENTRY.pack(match_id, segment, offset, len(raw))
+            with open(self._path('index'), 'ab') as f:
+                f.write(entry)
+            # picked up from the index file again on the next refresh, harmlessly
+            self._index[match_id] = (segment, offset, len(raw))
+        return True
+
+    def match_ids(self):
+        self._refresh_index()
+        return list(self._index)
+
+    def position(self, match_id):
+        '''
+        (segment, offset) of a match's payload, None if it isn't archived.
+        payloads are only ever appended so positions grow in the order
+        matches were written, see raw_items(after=...)
+        '''
+        entry = self._lookup(match_id)
+        return None if entry is None else entry[:2]
+
+    def raw_items(self, after=None):
+        '''
+        (match id, compressed payload) of every archived match in the order
+        they were written, which reads the segments front to back.
+        after is a position(), only matches written after it are read.
+        leaves decoding to the caller(i.e. a process pool, see decode())
+        '''
+        self._refresh_index()
+        entries = sorted(self._index.items(), key=lambda item: item[1])
+        for match_id, entry in entries:
+            if after is not None and entry[:2] <= tuple(after):
+                continue
+            yield match_id, self._read(*entry)
+
+    def items(self):
+        for match_id, raw in self.raw_items():
+            yield match_id, decode(raw)
+
+    def rebuild_index(self):
+        '''
+        write the index anew from the record headers of every segment,
+        i.e. after losing the index file or a crash between a payload and its entry
+        '''
+        with self._lock, _FileLock(self._path('lock')):
+            entries = []
+            for segment in self._segments():
+                with open(self._path(SEGMENT_NAME.format(segment)), 'rb') as f:
+                    offset = 0
+                    while True:
+                        header = f.read(RECORD_HEADER.size)
+                        if len(header) < RECORD_HEADER.size:
+                            break
+                        match_id, length = RECORD_HEADER.unpack(header)
+                        offset += RECORD_HEADER.size
+                        if len(f.read(length)) < length:
+                            # torn write at the end of the segment
+                            break
+                        entries.append((match_id, segment, offset, length))
+                        offset += length
+
+            index = {}
+            for match_id, segment, offset, length in entries:
+                index.setdefault(match_id, (segment, offset, length))
+            with open(self._path('index'), 'wb') as f:
+                for match_id, (segment, offset, length) in index.items():
+                    f.write(INDEX_ENTRY.pack(match_id, segment, offset, length))
+            self._index = index
+            self._index_read = len(index) * INDEX_ENTRY.size
+        return len(index)
+
+    def close(self):
+        for segment_map in self._maps.values():
+            segment_map.close()
+        self._maps.clear()
+
+    def _lookup(self, match_id):
+        entry = self._index.get(match_id)
+        if entry is None:
+            # written by another process since we last looked
+            self._refresh_index()
+            entry = self._index.get(match_id)
+        return entry
+
+    def _refresh_index(self):
+        path = self._path('index')
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        # only whole entries, one may be half way through being appended
+        size -= size % INDEX_ENTRY.size
+        if size <= self._index_read:
+            return
+
+        with self._lock:
+            if size <= self._index_read:
+                return
+            with open(path, 'rb') as f:
+                f.seek(self._index_read)
+                data = f.read(size - self._index_read)
+            for match_id, segment, offset, length in INDEX_ENTRY.iter_unpack(data):
+                self._index.setdefault(match_id, (segment, offset, length))
+            self._index_read = size
+
+    def _read(self, segment, offset, length):
+        path = self._path(SEGMENT_NAME.format(segment))
+        if not self.use_mmap:
+            with open(path, 'rb') as f:
+                f.seek(offset)
+                return f.read(length)
+
+        segment_map = self._maps.get(segment)
+        if segment_map is None or offset + length > len(segment_map):
+            # first read of the segment, or it grew since it was mapped
+            with open(path, 'rb') as f:
+                segment_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = segment_map
+        return segment_map[offset:offset + length]
+
+    def _segments(self):
+        found = (SEGMENT_PATTERN.match(name) for name in os.listdir(self.directory))
+        return sorted(int(match.group(1)) for match in found if match)
+
+    def _writable_segment(self, length):
+        segments = self._segments()
+        if not segments:
+            return 1
+        last = segments[-1]
+        size = os.path.getsize(self._path(SEGMENT_NAME.format(last)))
+        if size and size + RECORD_HEADER.size + length > self.segment_size:
+            return last + 1
+        return last
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+
+class _FileLock:
+    '''exclusive lock between processes appending to the same archive'''
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
@@ -0,0 +1,192 @@
+'''
+caching of riot api responses.
+
+every endpoint gets its own time to live:
+    None -> cache forever(until evicted), matches never change once played
+    0    -> never cache, i.e. match lists and ranks that a refresh has to see
+    n    -> seconds the response stays valid
+
+entries are kept in a backend bounded in size which evicts
+the least recently used entry when it gets full.
+MemoryBackend lives in a single process, SQLiteBackend is a local file
+that every worker process on the machine can share.
+'''
+import itertools
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from urllib.parse import urlencode
+
+# keyed the same way as API_VERSION/TIMEOUTS in api.py
+DEFAULT_TTLS = {
+    'default': 0,
+    'summoner': 30,
+    'summoner_rank': 0,
+    'match_history': 0,
+    'match_by_id': None,
+    'champion_mastery': 60 * 60,
+    'masters': 5 * 60,
+    'grandmasters': 5 * 60,
+    'challengers': 5 * 60
+}
+
+# returned on a miss since None can be a perfectly fine cached response
+MISSING = object()
+
+
+class MemoryBackend:
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires, value = entry
+            if expires is not None and now >= expires:
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires):
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteBackend:
+    '''
+    responses are stored as json in a sqlite file shared between processes.
+    counting the entries goes through the whole table, so it's trimmed down to
+    max_entries every evict_every sets of a process rather than on every one
+    and may hold a few more in between.
+    '''
+    def __init__(self, path, max_entries=50000, evict_every=100):
+        self.path = path
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        # numbers this process' sets, next() on it is atomic
+        self._sets = itertools.count(1)
+        self._local = threading.local()
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS response_cache ('
+            'key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)'
+        )
+        self._connection().execute(
+            'CREATE INDEX IF NOT EXISTS ix_response_cache_accessed ON response_cache (accessed)'
+        )
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+    def get(self, key, now):
+        conn = self._connection()
+        row = conn.execute(
+            'SELECT value, expires FROM response_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return MISSING
+        value, expires = row
+        if expires is not None and now >= expires:
+            conn.execute('DELETE FROM response_cache WHERE key = ?', (key,))
+            return MISSING
+        conn.execute('UPDATE response_cache SET accessed = ? WHERE key = ?', (now, key))
+        return json.loads(value)
+
+    def set(self, key, value, expires):
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO response_cache (key, value, expires, accessed) '
+            'VALUES (?, ?, ?, ?)',
+            (key, json.dumps(value), expires, time.time())
+        )
+        if next(self._sets) % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        '''drop the least recently used entries over max_entries'''
+        overflow = len(self) - self.max_entries
+        if overflow > 0:
+            self._connection().execute(
+                'DELETE FROM response_cache WHERE key IN ('
+                'SELECT key FROM response_cache ORDER BY accessed LIMIT ?)',
+                (overflow,)
+            )
+
+    def clear(self):
+        self._connection().execute('DELETE FROM response_cache')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            # readers don't block the writer and the other way around
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+
+class ResponseCache:
+    '''
+    cache = ResponseCache(MemoryBackend())
+    data = cache.get('match_by_id', url, params)
+    if data is MISSING:
+        data = ...
+        cache.set('match_by_id', url, params, data)
+    '''
+    def __init__(self, backend=None, ttls=None):
+        self.backend = MemoryBackend() if backend is None else backend
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def __repr__(self):
+        return "ResponseCache<{}, entries: {}>".format(type(self.backend).__name__,
+                                                       len(self.backend))
+
+    def ttl(self, endpoint):
+        return self.ttls.get(endpoint, self.ttls['default'])
+
+    def get(self, endpoint, url, params=None):
+        if self.ttl(endpoint) == 0:
+            return MISSING
+
+        value = self.backend.get(self.make_key(endpoint, url, params), time.time())
+        if value is MISSING:
+            self.misses[endpoint] += 1
+        else:
+            self.hits[endpoint] += 1
+        return value
+
+    def set(self, endpoint, url, params, value):
+        ttl = self.ttl(endpoint)
+        if ttl == 0:
+            return
+        expires = None if ttl is None else time.time() + ttl
+        self.backend.set(self.make_key(endpoint, url, params), value, expires)
+
+    def stats(self):
+        '''endpoint -> (hits, misses)'''
+        endpoints = set(self.hits) | set(self.misses)
+        return {e: (self.hits[e], self.misses[e]) for e in endpoints}
+
+    @staticmethod
+    def make_key(endpoint, url, params=None):
+        # the api key changes daily and has nothing to do with the response
+        query = urlencode(sorted((k, v) for k, v in (params or {}).items() if k != 'api_key'))
+        return '{} {}?{}'.format(endpoint, url, query)
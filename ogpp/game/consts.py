@@ -168,6 +168,15 @@ SUMMONER_SPELLS = {
 }
 
 
+def champion_name(champion_id):
+    '''name of a champion from its id, the id itself for champions newer than this file'''
+    return CHAMPIONS.get(champion_id, str(champion_id))
+
+
+def spell_name(spell_id):
+    return SUMMONER_SPELLS.get(spell_id, SUMMONER_SPELLS[0])
+
+
 _TEAMS = {
     "blue": 100,
     "red": 200
@@ -0,0 +1,269 @@
+'''
+rate limiting for the riot api.
+
+riot enforces its limits as a list of "count:seconds" windows, once for the
+whole application(X-App-Rate-Limit) and once per api method(X-Method-Rate-Limit).
+every response tells us what the limits are and how much of each window
+we already used(X-App-Rate-Limit-Count, X-Method-Rate-Limit-Count),
+so we start out with the development key defaults and learn the rest as we go.
+
+buckets are kept in a store. the in-memory store is shared by every thread
+of a process, the sqlite store is a file that several processes
+(i.e. waitress workers and the crawler) can share.
+'''
+import sqlite3
+import threading
+import time
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+# share of every bucket a priority is allowed to use.
+# background work(crawling) stops short so page views always have some room left.
+PRIORITY_SHARE = {
+    INTERACTIVE: 1.0,
+    BACKGROUND: 0.7
+}
+
+# development key limits, replaced as soon as riot tells us otherwise
+DEFAULT_APP_LIMITS = '20:1,100:120'
+
+APP_KEY = 'app'
+
+
+def parse_limits(header):
+    '''
+    turn a rate limit header value into a list of (count, seconds) pairs
+
+    '20:1,100:120' -> [(20, 1), (100, 120)]
+    '''
+    limits = []
+    for pair in header.split(','):
+        count, window = pair.split(':')
+        limits.append((int(count), int(window)))
+    return limits
+
+
+class MemoryStore:
+    '''fixed window counters shared by all threads of a single process'''
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (key, window) -> [window start, count]
+        self._windows = {}
+        # key -> timestamp until which nothing may be sent
+        self._blocked = {}
+
+    def acquire(self, buckets, now):
+        '''
+        take one slot from every bucket, or none at all.
+        buckets is a list of (key, limit, window) tuples.
+        returns 0 on success, otherwise the seconds to wait before trying again.
+        '''
+        with self._lock:
+            wait = 0
+            for key, limit, window in buckets:
+                wait = max(wait, self._blocked.get(key, 0) - now)
+                start, count = self._window(key, window, now)
+                if count >= limit:
+                    wait = max(wait, start + window - now)
+            if wait > 0:
+                return wait
+
+            for key, limit, window in buckets:
+                self._windows[key, window][1] += 1
+            return 0
+
+    def sync(self, key, window, count, now):
+        '''trust the server's count if it saw more requests than we did'''
+        with self._lock:
+            counter = self._window(key, window, now)
+            counter[1] = max(counter[1], count)
+
+    def block(self, key, until):
+        with self._lock:
+            self._blocked[key] = max(self._blocked.get(key, 0), until)
+
+    def _window(self, key, window, now):
+        counter = self._windows.get((key, window))
+        if counter is None or now >= counter[0] + window:
+            counter = self._windows[key, window] = [now, 0]
+        return counter
+
+
+class SQLiteStore:
+    '''
+    same as MemoryStore but kept in a local sqlite file so that
+    every process on the machine draws from the same buckets.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_window ('
+                'key TEXT, window INTEGER, start REAL, count INTEGER, '
+                'PRIMARY KEY (key, window))'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS rate_block (key TEXT PRIMARY KEY, until REAL)'
+            )
+
+    def acquire(self, buckets, now):
+        with self._transaction() as conn:
+            wait = 0
+            counters = []
+            for key, limit, window in buckets:
+                row = conn.execute('SELECT until FROM rate_block WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    wait = max(wait, row[0] - now)
+                start, count = self._window(conn, key, window, now)
+                if count >= limit:
+                    wait = max(wait, start + window - now)
+                counters.append((key, window))
+            if wait > 0:
+                return wait
+
+            conn.executemany(
+                'UPDATE rate_window SET count = count + 1 WHERE key = ? AND window = ?',
+                counters
+            )
+            return 0
+
+    def sync(self, key, window, count, now):
+        with self._transaction() as conn:
+            self._window(conn, key, window, now)
+            conn.execute(
+                'UPDATE rate_window SET count = MAX(count, ?) WHERE key = ? AND window = ?',
+                (count, key, window)
+            )
+
+    def block(self, key, until):
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO rate_block (key, until) VALUES (?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET until = MAX(until, excluded.until)',
+                (key, until)
+            )
+
+    def _window(self, conn, key, window, now):
+        row = conn.execute(
+            'SELECT start, count FROM rate_window WHERE key = ? AND window = ?',
+            (key, window)
+        ).fetchone()
+        if row is None or now >= row[0] + window:
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_window (key, window, start, count) VALUES (?, ?, ?, 0)',
+                (key, window, now)
+            )
+            return now, 0
+        return row
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # autocommit mode, transactions are handled by hand below
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._connection())
+
+
+class _ImmediateTransaction:
+    '''take the write lock up front so two processes can't both read the same count'''
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+class RateLimiter:
+    '''
+    application and method level buckets for every caller of the api.
+
+    limiter = RateLimiter()
+    limiter.acquire('match_by_id')          # blocks until a slot is free
+    response = ...
+    limiter.update('match_by_id', response.headers)
+    '''
+    def __init__(self, app_limits=DEFAULT_APP_LIMITS, store=None):
+        self.app_limits = parse_limits(app_limits)
+        # method -> [(count, seconds), ...], only known after the first response
+        self.method_limits = {}
+        self.store = store or MemoryStore()
+
+    def __repr__(self):
+        return "RateLimiter<app: {0.app_limits}, store: {1}>".format(
+            self, type(self.store).__name__)
+
+    def reserve(self, method, priority=INTERACTIVE):
+        '''
+        try to take a slot without blocking.
+        returns 0 if we may send the request, otherwise seconds to wait.
+        '''
+        return self.store.acquire(self._buckets(method, priority), time.time())
+
+    def acquire(self, method, priority=INTERACTIVE, timeout=None):
+        '''
+        block until a request may be sent.
+        returns False if that would take longer than timeout seconds.
+        '''
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            wait = self.reserve(method, priority)
+            if not wait:
+                return True
+            if deadline is not None and time.time() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def update(self, method, headers):
+        '''learn the real limits and usage from a response's headers'''
+        now = time.time()
+        if 'X-App-Rate-Limit' in headers:
+            self.app_limits = parse_limits(headers['X-App-Rate-Limit'])
+        if 'X-Method-Rate-Limit' in headers:
+            self.method_limits[method] = parse_limits(headers['X-Method-Rate-Limit'])
+
+        for header, key in (('X-App-Rate-Limit-Count', APP_KEY),
+                            ('X-Method-Rate-Limit-Count', self._method_key(method))):
+            if header in headers:
+                for count, window in parse_limits(headers[header]):
+                    self.store.sync(key, window, count, now)
+
+    def backoff(self, method, headers):
+        '''
+        after a 429 stop sending anything to whatever riot says
+        went over its limit for as long as Retry-After says.
+        '''
+        retry_after = headers.get('Retry-After')
+        if retry_after is None:
+            return
+        until = time.time() + float(retry_after)
+        if headers.get('X-Rate-Limit-Type') == 'application':
+            self.store.block(APP_KEY, until)
+        else:
+            # method or underlying service limit
+            self.store.block(self._method_key(method), until)
+
+    def _buckets(self, method, priority):
+        share = PRIORITY_SHARE[priority]
+        buckets = [
+            (APP_KEY, max(1, int(count * share)), window)
+            for count, window in self.app_limits
+        ]
+        buckets += [
+            (self._method_key(method), max(1, int(count * share)), window)
+            for count, window in self.method_limits.get(method, [])
+        ]
+        return buckets
+
+    @staticmethod
+    def _method_key(method):
+        return 'method:' + method
@@ -0,0 +1,76 @@
+'''
+request coalescing for the riot api.
+
+when ten visitors open the same uncached summoner at once, only the first
+one actually calls the api. the other nine wait on that call and share its
+result(or its error) instead of spending their own quota on the same data.
+'''
+import asyncio
+import threading
+from collections import Counter
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    '''thread flavor, shared by every thread of a process'''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        # key's endpoint -> amount of callers that got a shared result
+        self.shared = Counter()
+
+    def do(self, key, fn, *args):
+        '''call fn(*args) unless a call for key is already in flight, then wait on it'''
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            self.shared[key.split(' ', 1)[0]] += 1
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class AsyncSingleFlight:
+    '''asyncio flavor, only to be used from a single event loop'''
+    def __init__(self):
+        self._calls = {}
+        self.shared = Counter()
+
+    async def do(self, key, fn, *args):
+        '''await fn(*args) unless a call for key is already in flight, then await that one'''
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared[key.split(' ', 1)[0]] += 1
+            # shielded so a cancelled follower doesn't cancel everyone else
+            return await asyncio.shield(future)
+
+        future = self._calls[key] = asyncio.ensure_future(fn(*args))
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                del self._calls[key]
+            else:
+                future.add_done_callback(lambda f: self._calls.pop(key, None))
@@ -1,5 +1,5 @@
 from .storage import update_summoner_page
-from .content import (generate_summoner_page_context,
+from .content import (generate_summoner_page_context, get_match_detail,
                       get_leaderboard_data, get_champion_masteries)
 from .email import send_email
 from .slug import SlugAdapter
@@ -5,26 +5,47 @@
 from types import SimpleNamespace
 
 from flask import url_for, current_app
+from sqlalchemy import func
 
-from .storage import grab_summoner, get_match_stats
-from ..models import Match, ByReferenceMatch
+from .storage import grab_summoner, load_matches, get_ranks
+from .stats import fill_match_summaries
+from .pagination import KeysetPage, count_history, paginate_history
+from ..models import ByReferenceMatch, Match, SummonerChampionStats
 from ..game import CHAMPIONS, _TEAMS
 from ..game import _QUEUE_TYPE as REVERSE_QUEUE_LOOKUP
 from ..game import api as riot_api
+# idle/refresh.py imports this package too, only look into the module once it's called
+from ..idle import refresh
+from .. import db
 
 # blacklist certain properties in the model object's __dict__
 BLACKLIST = ['_sa_instace_state']
 
+# what the match tables need to know about a player
+PLAYER_FIELDS = ['name', 'champion_played', 'champion_level', 'team_id', 'win',
+                 'spell1', 'spell2', 'items', 'kda', 'avg_kda']
 
-def generate_summoner_page_context(summoner_name, page, champion, queue):
+
+def generate_summoner_page_context(summoner_name, page, champion, queue, after=None, before=None):
     '''
     page is the current counter in a pagination sequence
     champion & queue are args obtained as url query keywords(default: 'all')
+    after & before are the cursors of the next/previous page links, if any
+
+    matches are listed from the summaries on the summoner's match references,
+    the players of a match are only loaded once its row is expanded(get_match_detail).
+
+    with ASYNC_RIOT_API turned on the api calls for a new summoner and
+    for the page's missing matches are made concurrently on an event loop.
+
+    a stored summoner that went stale is drawn as stored while a refresh
+    is queued for them, page_items.refreshing is whether one is on its way.
     '''
     view = 'summoner.summoner'
     paginate_kwargs = {'name': summoner_name}
 
     summoner = grab_summoner(summoner_name)
+    refresh_job = refresh.revalidate(summoner)
 
     match_refs = summoner.match_history
     if queue != 'all':
@@ -34,14 +55,13 @@ def generate_summoner_page_context(summoner_name, page, champion, queue):
         match_refs = match_refs.filter_by(champion_played=champion)
         paginate_kwargs['champion'] = champion
 
-    match_refs = match_refs.order_by(
-        ByReferenceMatch.timestamp.desc()
-    ).paginate(
-        page, current_app.config['POSTS_PER_PAGE']
-    )
+    total = count_history(match_refs, (summoner.id, queue, champion))
+    match_refs = paginate_history(match_refs, page, current_app.config['POSTS_PER_PAGE'],
+                                  total, after=after, before=before)
 
-    matches = get_match_stats(match_refs, page)
-    matches = make_matches_exportable(matches, summoner.name)
+    summarize_match_refs(summoner, match_refs.items)
+    matches = [make_match_ref_exportable(match_ref, summoner.name)
+               for match_ref in match_refs.items]
 
     title = "Profile Page of %s" % summoner.name
 
@@ -52,6 +72,7 @@ def generate_summoner_page_context(summoner_name, page, champion, queue):
     page_items.matches = matches
     page_items.page_urls = make_paginate(match_refs, view, **paginate_kwargs)
     page_items.title = title
+    page_items.refreshing = refresh_job is not None
 
     return page_items
 
@@ -67,8 +88,9 @@ def make_paginate(paginatable, view, **kwargs):
         : flask's url_for() function i.e. url_for(<view_name>).
     page -> int
         : the current page of the paginatable's sequence.
-    paginatable -> SQLAlchemy pagination object
+    paginatable -> SQLAlchemy pagination object or KeysetPage
         : a pagination object generated from sqlalchemy.
+        : a KeysetPage links its neighbours through cursors.
     kwargs -> dict
         : extra keywords needed for the page context.
     '''
@@ -96,9 +118,15 @@ def make_paginate(paginatable, view, **kwargs):
         paginate_list.append(page)
         k += 1
 
-    prev = url_for(view, page=paginatable.prev_num, **kwargs) \
+    prev_kwargs = dict(kwargs, page=paginatable.prev_num)
+    next_kwargs = dict(kwargs, page=paginatable.next_num)
+    if isinstance(paginatable, KeysetPage):
+        prev_kwargs['before'] = paginatable.prev_cursor
+        next_kwargs['after'] = paginatable.next_cursor
+
+    prev = url_for(view, **prev_kwargs) \
         if paginatable.has_prev else None
-    nxt = url_for(view, page=paginatable.next_num, **kwargs) \
+    nxt = url_for(view, **next_kwargs) \
         if paginatable.has_next else None
 
     pages = SimpleNamespace()
@@ -129,13 +157,91 @@ def make_summoner_exportable(s):
     return summoner
 
 
+def summarize_match_refs(summoner, match_refs):
+    '''
+    fill in the summaries missing from a page of match references
+    whose matches we haven't stored yet, storing them first.
+    '''
+    unsummarized = [match_ref for match_ref in match_refs if not match_ref.summarized]
+    if not unsummarized:
+        return
+
+    # a reference is summarized when it or its match is stored, a stored match that's
+    # still missing its summary doesn't have the summoner in it(i.e. after a name change)
+    # and would be tried again on every view
+    stored = set(
+        match_id for match_id, in
+        db.session.query(Match.match_id).filter(
+            Match.match_id.in_([match_ref.match_id for match_ref in unsummarized])
+        )
+    )
+    unstored = {match_ref.id: match_ref for match_ref in unsummarized
+                if match_ref.match_id not in stored}
+    if not unstored:
+        return
+
+    load_matches(list(unstored.values()))
+    # in case another request stored one of them in the meantime
+    fill_match_summaries(summoner, [match_ref.match_id for match_ref in unstored.values()])
+    db.session.commit()
+    # the summaries were written around the orm, read them back in
+    ByReferenceMatch.query.filter(
+        ByReferenceMatch.id.in_(list(unstored))
+    ).populate_existing().all()
+
+
+def get_match_detail(summoner_name, match_id):
+    '''both teams of one of a summoner's matches, shown once its row is expanded'''
+    summoner = grab_summoner(summoner_name)
+    match_ref = summoner.match_history.filter_by(match_id=match_id).first_or_404()
+    match, = load_matches([match_ref])
+    return make_matches_exportable([match], summoner.name)[0]
+
+
+def make_match_ref_exportable(match_ref, summoner_name):
+    m = SimpleNamespace()
+    m.match_id = match_ref.match_id
+    m.date = match_ref.date
+    m.queue_type = match_ref.queue_type
+    # the summoner's own entry may be missing from a stored match(i.e. after a name change)
+    m.summarized = match_ref.summarized
+    m.champion_played = match_ref.champion_played
+    if m.summarized:
+        m.champion_level = match_ref.champion_level
+        m.spell1 = match_ref.spell1
+        m.spell2 = match_ref.spell2
+        m.items = match_ref.items
+        m.kda = match_ref.kda
+        m.avg_kda = match_ref.avg_kda
+        m.win = 'Victory' if match_ref.win else 'Defeat'
+    else:
+        # nothing to show but the champion, see the summoner template
+        m.champion_level = m.spell1 = m.spell2 = m.kda = m.avg_kda = None
+        m.items = []
+        m.win = ''
+    if match_ref.duration is None:
+        m.duration = ''
+    else:
+        m.duration = '{}m {}s'.format(*divmod(match_ref.duration, 60))
+    m.detail_url = url_for('summoner.match_detail', name=summoner_name,
+                           match_id=match_ref.match_id)
+    return m
+
+
 def make_matches_exportable(matches, summoner_name):
     out = []
 
+    # players were loaded along with the matches, the only query left is for
+    # the ranks, which are looked up as they are right now for everyone on the page at once
+    ranks = get_ranks(p.name for match in matches for p in match.players)
+
     for match in matches:
         m = SimpleNamespace(**{k: v for k, v in match.__dict__.items() if k not in BLACKLIST})
         # get properties that __dict__ didn't pick up
-        m.players = match.players
+        m.players = [
+            make_player_exportable(p, ranks.get(p.name, 'unranked'))
+            for p in match.players
+        ]
         m.date = match.date
         # get team sides
         m.blue_side = get_team(m.players, side_id=_TEAMS['blue'])
@@ -148,6 +254,12 @@ def make_matches_exportable(matches, summoner_name):
     return out
 
 
+def make_player_exportable(p, rank):
+    player = SimpleNamespace(**{field: getattr(p, field) for field in PLAYER_FIELDS})
+    player.current_rank = rank
+    return player
+
+
 def make_exportable_top_champ(champ_name, win_rate, avg_kda, amt_played):
     num_fmt = '{:.2f}'
     champ = SimpleNamespace()
@@ -166,7 +278,7 @@ def get_team(players, side_id):
 
 
 def is_win_or_loss(match, summoner_name):
-    player = match.participants.filter_by(name=summoner_name).first()
+    player = match.get_player(summoner_name)
     if not player.win:
         return 'Defeat'
     else:
@@ -177,63 +289,38 @@ def get_ranked_stats(summoner):
     '''
     get a summoner's 5 most played ranked champions, if any.
     returns data to be displayed on the summoner page side bar.
-    '''
-    games = summoner.ranked_games
-    champions_played = set(match.champion_played for match in games)
-    ranked_champions = []
 
-    def match_query(m):
-        return Match.query.filter_by(match_id=m.match_id).first()
+    reads the running totals of the summoner's champion statistics.
+    '''
+    ranked_queues = [REVERSE_QUEUE_LOOKUP['RANKED_SOLO'], REVERSE_QUEUE_LOOKUP['RANKED_FLEX']]
+
+    # solo and flex totals of a champion are added together
+    per_champion = db.session.query(
+        SummonerChampionStats.champion_played,
+        func.sum(SummonerChampionStats.games),
+        func.sum(SummonerChampionStats.wins),
+        func.sum(SummonerChampionStats.kda_total)
+    ).filter(
+        SummonerChampionStats.summoner_id == summoner.id,
+        SummonerChampionStats.game_mode.in_(ranked_queues)
+    ).group_by(
+        SummonerChampionStats.champion_played
+    ).all()
 
+    ranked_champions = []
     total_wins = 0
     games_total = 0
 
-    for champ in champions_played:
-        # match references
-        all_played_matches = [
-            match
-            for match in games
-            if match.champion_played == champ
-        ]
-        # query-able rows from Match table
-        queried_matches = [
-            match_query(match)
-            for match in all_played_matches
-            if match_query(match) is not None
-        ]
-
-        total_played = len(queried_matches)
-
-        total_avg_kdas = 0
-        wins = 0
-
-        for match in queried_matches:
-            player_instance = match.participants.filter_by(
-                name=summoner.name).first()
-            total_avg_kdas += player_instance.avg_kda
-
-            if player_instance.win:
-                total_wins += 1
-                wins += 1
-
-        try:
-            effective_kda = total_avg_kdas / total_played
-        except ZeroDivisionError:
-            effective_kda = total_avg_kdas
-        try:
-            win_rate = wins / total_played
-        except ZeroDivisionError:
-            win_rate = 0
-
+    for champ, total_played, wins, kda_total in per_champion:
         exportable_champion = make_exportable_top_champ(
             champ,
-            win_rate,
-            effective_kda,
+            wins / total_played,
+            kda_total / total_played,
             total_played
         )
-
         ranked_champions.append(exportable_champion)
 
+        total_wins += wins
         games_total += total_played
 
     ranked_champions.sort(key=lambda c: c.total_played)
@@ -0,0 +1,133 @@
+'''
+keyset pagination of a summoner's match history.
+
+pages are ordered newest first by (timestamp, id). moving to the next or
+previous page carries a cursor, the (timestamp, id) of the last or first
+match of the current page, so the database seeks straight to it through
+the match history indexes instead of counting its way past every game
+before it like an OFFSET does.
+
+    ?page=3&after=1555000000.0_1234   -> the page of games older than that one
+    ?page=2&before=1554000000.0_987   -> the page of games newer than that one
+    ?page=3                           -> plain offset, for the numbered page links
+
+the total amount of games behind the page list is counted once and cached
+for a short while, it is only used to draw the links and may lag behind.
+'''
+import math
+import time
+
+from flask import abort, current_app
+from sqlalchemy import tuple_
+
+from ..game.cache import MemoryBackend, MISSING
+from ..models import ByReferenceMatch
+
+# (summoner id, queue, champion) -> amount of games in that history
+_history_counts = MemoryBackend(max_entries=4096)
+
+
+def format_cursor(match_ref):
+    return '{!r}_{}'.format(match_ref.timestamp, match_ref.id)
+
+
+def parse_cursor(cursor):
+    '''(timestamp, id) from a cursor, None if it isn't one'''
+    try:
+        timestamp, ref_id = cursor.rsplit('_', 1)
+        return float(timestamp), int(ref_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def count_history(match_refs, key):
+    '''amount of match references in the query, cached for HISTORY_COUNT_TTL seconds'''
+    now = time.time()
+    total = _history_counts.get(key, now)
+    if total is MISSING:
+        total = match_refs.order_by(None).count()
+        _history_counts.set(key, total, now + current_app.config['HISTORY_COUNT_TTL'])
+    return total
+
+
+class KeysetPage:
+    '''
+    a page of a summoner's match history, goes wherever
+    flask-sqlalchemy's Pagination went(make_paginate, summarize_match_refs)
+    '''
+    def __init__(self, items, page, per_page, total, has_prev, has_next):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.has_prev = has_prev
+        self.has_next = has_next
+        # the cached total may be off, what we just read is not
+        if has_next:
+            self.pages = max(math.ceil(total / per_page), page + 1)
+        else:
+            self.pages = page
+
+    def __repr__(self):
+        return "KeysetPage<page {0.page} of {0.pages}, {1} items>".format(self, len(self.items))
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+    @property
+    def prev_cursor(self):
+        return format_cursor(self.items[0]) if self.has_prev and self.items else None
+
+    @property
+    def next_cursor(self):
+        return format_cursor(self.items[-1]) if self.has_next and self.items else None
+
+
+def paginate_history(match_refs, page, per_page, total, after=None, before=None):
+    '''
+    a KeysetPage of the (filtered) match history query match_refs.
+    after/before are cursors taken from the url, without either of them
+    page is used as a plain offset.
+    '''
+    if page < 1:
+        abort(404)
+
+    timestamp, ref_id = ByReferenceMatch.timestamp, ByReferenceMatch.id
+    newest_first = (timestamp.desc(), ref_id.desc())
+    # compared as a row value, an OR of the two columns can't seek the index
+    position = tuple_(timestamp, ref_id)
+    after, before = parse_cursor(after), parse_cursor(before)
+
+    if after is not None:
+        items = match_refs.filter(
+            position < tuple_(*after)
+        ).order_by(*newest_first).limit(per_page + 1).all()
+        has_prev = True
+        has_next = len(items) > per_page
+        items = items[:per_page]
+    elif before is not None:
+        # walk up from the cursor, then flip the page back around
+        items = match_refs.filter(
+            position > tuple_(*before)
+        ).order_by(timestamp.asc(), ref_id.asc()).limit(per_page + 1).all()
+        has_prev = len(items) > per_page
+        has_next = True
+        items = items[:per_page][::-1]
+        if not has_prev:
+            page = 1
+    else:
+        items = match_refs.order_by(*newest_first).offset(
+            (page - 1) * per_page
+        ).limit(per_page + 1).all()
+        has_prev = page > 1
+        has_next = len(items) > per_page
+        items = items[:per_page]
+
+    if not items and page != 1:
+        abort(404)
+
+    return KeysetPage(items, page, per_page, total, has_prev, has_next)
@@ -0,0 +1,238 @@
+'''
+re-deriving Match and Player columns from the archived match payloads
+(see game/archive.py), i.e. after adding a column to Player:
+
+    flask archive reprocess --column damage_dealt --column damage_healed
+
+payloads are read from the archive in the order they were written, decoded
+and mapped to columns by a pool of processes through the same player_columns()
+the web ingest uses, and written back with one batched UPDATE per table and batch.
+
+the summaries on the match references and the champion stats of tracked
+summoners are copies of Player and Match columns(see helpers/stats.py).
+when one of those columns is written, the summaries of the batch's matches
+and the champion stats of the tracked summoners playing in them are redone
+along with the batch, no `flask stats rebuild` needed afterwards.
+
+after every written batch the archive position of its last match goes
+into a checkpoint file, an interrupted run picks up right after it.
+matches that were archived but never stored are skipped.
+'''
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+from sqlalchemy import and_, bindparam, or_
+
+from .. import db
+from ..game.archive import decode
+from ..models import Match, Player
+from .stats import SUMMARY_FIELDS, fill_match_summaries, rebuild_champion_stats
+from .storage import get_tracked_summoners, match_participants, player_columns
+
+# what a stored row is found by, never written themselves.
+# players are found by participant id, or by name in rows stored before we kept one
+PLAYER_KEY = ('id', 'game_id', 'name')
+# not part of a match's payload
+PLAYER_SKIPPED = ('current_rank',)
+
+# Match column -> field of the api's match data
+MATCH_FIELDS = {
+    'game_mode': 'queueId',
+    'duration': 'gameDuration'
+}
+
+# columns copied onto the match references and counted into the champion stats
+SUMMARY_COLUMNS = set(SUMMARY_FIELDS + ['duration'])
+STATS_COLUMNS = {'champion_id', 'win', 'kills', 'deaths', 'assists', 'game_mode'}
+
+
+def player_fields():
+    '''every Player column that can be re-derived from a payload'''
+    return [
+        column.name for column in Player.__table__.columns
+        if column.name not in PLAYER_KEY + PLAYER_SKIPPED
+    ]
+
+
+def match_fields():
+    return list(MATCH_FIELDS)
+
+
+def transform(batch):
+    '''
+    runs in a worker process.
+    batch is a list of (match id, compressed payload) from the archive,
+    returns a list of (match id, match columns, [player columns, ...])
+    '''
+    results = []
+    for match_id, raw in batch:
+        match = decode(raw)
+        match_row = {column: match.get(field) for column, field in MATCH_FIELDS.items()}
+        player_rows = [player_columns(player) for player in match_participants(match)]
+        results.append((match_id, match_row, player_rows))
+    return results
+
+
+def match_update(columns):
+    table = Match.__table__
+    # bound parameters may not share their names with the table's columns
+    return table.update().where(
+        table.c.id == bindparam('m_id')
+    ).values({column: bindparam('v_' + column) for column in columns})
+
+
+def player_update(columns):
+    table = Player.__table__
+    return table.update().where(and_(
+        table.c.game_id == bindparam('p_game_id'),
+        or_(table.c.participant_id == bindparam('p_participant_id'),
+            and_(table.c.participant_id.is_(None), table.c.name == bindparam('p_name')))
+    )).values({column: bindparam('v_' + column) for column in columns})
+
+
+def write_batch(results, columns):
+    '''
+    UPDATE the stored matches and players of a transformed batch, then commit.
+    returns (matches written, players written)
+    '''
+    on_match = [column for column in columns if column in MATCH_FIELDS]
+    on_player = [column for column in columns if column not in MATCH_FIELDS]
+
+    game_ids = dict(
+        db.session.query(Match.match_id, Match.id).filter(
+            Match.match_id.in_([match_id for match_id, _, _ in results])
+        )
+    )
+
+    match_rows = []
+    player_rows = []
+    for match_id, match_row, players in results:
+        game_id = game_ids.get(match_id)
+        if game_id is None:
+            continue
+        match_rows.append(dict(
+            {'v_' + column: match_row[column] for column in on_match}, m_id=game_id
+        ))
+        for player in players:
+            player_rows.append(dict(
+                {'v_' + column: player[column] for column in on_player},
+                p_game_id=game_id, p_participant_id=player['participant_id'],
+                p_name=player['name']
+            ))
+
+    if on_match and match_rows:
+        db.session.execute(match_update(on_match), match_rows)
+    if on_player and player_rows:
+        db.session.execute(player_update(on_player), player_rows)
+    update_tracked(results, game_ids, columns)
+    db.session.commit()
+    return len(match_rows), len(player_rows)
+
+
+def update_tracked(results, game_ids, columns):
+    '''
+    redo the summaries and champion stats of the tracked summoners
+    in a transformed batch, if the columns written are part of them
+    '''
+    summaries = SUMMARY_COLUMNS.intersection(columns)
+    stats = STATS_COLUMNS.intersection(columns)
+    if not (summaries or stats):
+        return
+
+    # player name -> ids of the batch's stored matches they played
+    played = {}
+    for match_id, _, players in results:
+        if match_id in game_ids:
+            for player in players:
+                played.setdefault(player['name'], []).append(match_id)
+
+    for name, summoner in get_tracked_summoners(played).items():
+        if summaries:
+            fill_match_summaries(summoner, played[name])
+        if stats:
+            # recounted from every game of theirs, commits
+            rebuild_champion_stats(summoner)
+
+
+def load_checkpoint(path):
+    '''the checkpoint of an earlier run, None if there's none'''
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path, checkpoint):
+    # written aside and moved over so a crash never leaves half a checkpoint
+    partial = path + '.partial'
+    with open(partial, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(partial, path)
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def reprocess_archive(archive, columns, checkpoint_path, workers=None, batch_size=200):
+    '''
+    write columns of every stored match and player anew from the archive,
+    resuming from the checkpoint at checkpoint_path if there is one.
+
+    a generator, yields the progress after every written batch:
+        SimpleNamespace(read=, matches=, players=, skipped=, elapsed=, rate=)
+    matches/players are the rows written, skipped the archived matches we don't store.
+    elapsed and rate(matches read per second) only count this run, the rest all of them.
+    '''
+    checkpoint = load_checkpoint(checkpoint_path) or {}
+    if checkpoint and checkpoint['columns'] != sorted(columns):
+        raise ValueError('the checkpoint at {} is of a run over {}'.format(
+            checkpoint_path, ', '.join(checkpoint['columns'])))
+
+    progress = SimpleNamespace(read=checkpoint.get('read', 0),
+                               matches=checkpoint.get('matches', 0),
+                               players=checkpoint.get('players', 0),
+                               skipped=checkpoint.get('skipped', 0),
+                               elapsed=0, rate=0)
+    started, resumed_at = time.perf_counter(), progress.read
+    workers = workers or os.cpu_count() or 1
+    items = archive.raw_items(after=checkpoint.get('after'))
+
+    def written(results):
+        matches, players = write_batch(results, columns)
+        progress.read += len(results)
+        progress.matches += matches
+        progress.players += players
+        progress.skipped += len(results) - matches
+        progress.elapsed = time.perf_counter() - started
+        progress.rate = (progress.read - resumed_at) / max(progress.elapsed, 1e-9)
+        save_checkpoint(checkpoint_path, dict(
+            columns=sorted(columns), after=archive.position(results[-1][0]),
+            read=progress.read, matches=progress.matches,
+            players=progress.players, skipped=progress.skipped
+        ))
+        return progress
+
+    # a couple of batches in flight per worker, reading the whole
+    # archive ahead of the database would only fill up memory.
+    # batches are written in archive order so the checkpoint never skips one
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for batch in _batches(items, batch_size):
+            pending.append(pool.submit(transform, batch))
+            if len(pending) >= workers * 2:
+                yield written(pending.popleft().result())
+        while pending:
+            yield written(pending.popleft().result())
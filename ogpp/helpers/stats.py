@@ -0,0 +1,181 @@
+'''
+upkeep of what we keep about tracked summoners on top of the stored matches:
+the per summoner champion statistics table and the summaries of their games
+on their match references.
+
+both are filled in whenever a match of a summoner we track is stored,
+and can be rebuilt from the stored matches at any time(`flask stats rebuild`).
+'''
+from sqlalchemy import Float, Integer, and_, bindparam, case, cast, func, text
+from sqlalchemy.dialects import postgresql
+
+from ..game import champion_name
+from ..models import ByReferenceMatch, Match, Player, SummonerChampionStats
+from .. import db
+
+# columns a match reference shares with the summoner's Player entry
+SUMMARY_FIELDS = ['win', 'champion_level', 'kills', 'deaths', 'assists', 'spell1_id', 'spell2_id',
+                  'item1', 'item2', 'item3', 'item4', 'item5', 'item6', 'item7']
+
+# SummonerChampionStats' unique key and the totals a game adds to
+STATS_KEY = ['summoner_id', 'champion_played', 'game_mode']
+STATS_TOTALS = ['games', 'wins', 'kills', 'deaths', 'assists', 'kda_total']
+
+
+def kda(kills, deaths, assists):
+    '''a single game's kda, same as Player.avg_kda without the rounding'''
+    if deaths == 0:
+        return float(kills + assists)
+    return (kills + assists) / deaths
+
+
+def kda_expression():
+    '''kda() as a sql expression over the Player table'''
+    takedowns = cast(Player.kills + Player.assists, Float)
+    return case(
+        [(Player.deaths == 0, takedowns)],
+        else_=takedowns / Player.deaths
+    )
+
+
+def record_champion_stats(games):
+    '''
+    add freshly stored games of tracked summoners to their totals, games
+    are (summoner, player, game_mode) with player the summoner's Player row
+    (as a dict) of that game. doesn't commit.
+    '''
+    totals = {}
+    for summoner, player, game_mode in games:
+        key = (summoner.id, champion_name(player['champion_id']), game_mode)
+        row = totals.get(key)
+        if row is None:
+            row = totals[key] = dict(zip(STATS_KEY, key), **dict.fromkeys(STATS_TOTALS, 0))
+        row['games'] += 1
+        row['wins'] += int(bool(player['win']))
+        row['kills'] += player['kills']
+        row['deaths'] += player['deaths']
+        row['assists'] += player['assists']
+        row['kda_total'] += kda(player['kills'], player['deaths'], player['assists'])
+
+    if not totals:
+        return
+    upsert = champion_stats_upsert()
+    if upsert is not None:
+        # one statement per row, the database adds to the totals so concurrent ingests
+        # neither lose games nor trip over the unique constraint
+        db.session.execute(upsert, list(totals.values()))
+        return
+
+    for row in totals.values():
+        stats = SummonerChampionStats.query.filter_by(
+            **{column: row[column] for column in STATS_KEY}
+        ).first()
+        if stats is None:
+            db.session.add(SummonerChampionStats(**row))
+        else:
+            for column in STATS_TOTALS:
+                setattr(stats, column, getattr(SummonerChampionStats, column) + row[column])
+
+
+def champion_stats_upsert():
+    '''
+    an INSERT of SummonerChampionStats rows which adds to the totals of the row
+    already there instead, executed with a list of rows.
+    None where the database can't do that in one statement.
+    '''
+    table = SummonerChampionStats.__table__
+    dialect = db.engine.dialect
+    if dialect.name == 'postgresql':
+        insert = postgresql.insert(table)
+        return insert.on_conflict_do_update(index_elements=STATS_KEY, set_={
+            column: table.c[column] + insert.excluded[column] for column in STATS_TOTALS
+        })
+    if dialect.name == 'sqlite' and dialect.dbapi.sqlite_version_info >= (3, 24):
+        # same syntax as postgres', sqlalchemy only learns to write it for sqlite in 1.4
+        columns = STATS_KEY + STATS_TOTALS
+        return text(
+            'INSERT INTO {table} ({columns}) VALUES ({values}) '
+            'ON CONFLICT ({key}) DO UPDATE SET {totals}'.format(
+                table=table.name, columns=', '.join(columns),
+                values=', '.join(':' + column for column in columns),
+                key=', '.join(STATS_KEY),
+                totals=', '.join('{0} = {1}.{0} + excluded.{0}'.format(column, table.name)
+                                 for column in STATS_TOTALS)
+            )
+        )
+    return None
+
+
+def rebuild_champion_stats(summoner):
+    '''recount a summoner's totals from every stored game they played in'''
+    SummonerChampionStats.query.filter_by(summoner_id=summoner.id).delete()
+
+    totals = db.session.query(
+        Player.champion_id,
+        Match.game_mode,
+        func.count(Player.id),
+        func.sum(cast(Player.win, Integer)),
+        func.sum(Player.kills),
+        func.sum(Player.deaths),
+        func.sum(Player.assists),
+        func.sum(kda_expression())
+    ).join(
+        Match, Player.game_id == Match.id
+    ).filter(
+        Player.name == summoner.name
+    ).group_by(
+        Player.champion_id, Match.game_mode
+    )
+
+    db.session.bulk_insert_mappings(SummonerChampionStats, [
+        dict(summoner_id=summoner.id, champion_played=champion_name(champion), game_mode=game_mode,
+             games=games, wins=wins or 0, kills=kills or 0, deaths=deaths or 0,
+             assists=assists or 0, kda_total=kda_total or 0)
+        for champion, game_mode, games, wins, kills, deaths, assists, kda_total in totals
+    ])
+    db.session.commit()
+
+
+def summary_row(summoner_id, match_id, player, duration):
+    '''parameters of match_summary_update() from a Player row(as a dict)'''
+    row = {'s_' + field: player[field] for field in SUMMARY_FIELDS}
+    row.update(s_duration=duration, ref_summoner_id=summoner_id, ref_match_id=match_id)
+    return row
+
+
+def match_summary_update():
+    '''an UPDATE of a summoner's match reference, executed with a list of summary_row()s'''
+    table = ByReferenceMatch.__table__
+    # bound parameters may not share their names with the table's columns
+    return table.update().where(and_(
+        table.c.summoner_id == bindparam('ref_summoner_id'),
+        table.c.match_id == bindparam('ref_match_id')
+    )).values({
+        field: bindparam('s_' + field) for field in SUMMARY_FIELDS + ['duration']
+    })
+
+
+def fill_match_summaries(summoner, match_ids=None):
+    '''
+    summarize a summoner's match references from the matches we already stored,
+    only the ones of the given match ids if any.
+    doesn't commit.
+    '''
+    games = db.session.query(
+        Match.match_id, Match.duration, *[getattr(Player, field) for field in SUMMARY_FIELDS]
+    ).join(
+        Player, Player.game_id == Match.id
+    ).filter(
+        Player.name == summoner.name
+    )
+    if match_ids is not None:
+        if not match_ids:
+            return
+        games = games.filter(Match.match_id.in_(match_ids))
+
+    rows = [
+        summary_row(summoner.id, match_id, dict(zip(SUMMARY_FIELDS, player)), duration)
+        for match_id, duration, *player in games
+    ]
+    if rows:
+        db.session.execute(match_summary_update(), rows)
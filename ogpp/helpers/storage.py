@@ -5,11 +5,36 @@
     TODO: make page that shows avg win percentage of champion played by all players in db
 
 '''
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from types import SimpleNamespace
+
+from flask import current_app
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+
 from ..models import Summoner, ByReferenceMatch, Match, Player
-from ..game import CHAMPIONS, RANK_DIVISIONS, RANK_TIERS, SUMMONER_SPELLS
+from ..game import CHAMPIONS, RANK_DIVISIONS, RANK_TIERS
 from ..game import api as riot_api
+from ..game import aio_api, aio_loop
 from .. import db
+from .stats import (record_champion_stats, rebuild_champion_stats,
+                    fill_match_summaries, match_summary_update, summary_row)
+
+# matches are checked for and inserted under this lock so that two requests
+# showing the same match don't both store it
+_match_insert_lock = threading.Lock()
+
+# part of a summoner -> Summoner column of when it was last fetched.
+# every part is fetched again once it's older than its SUMMONER_<PART>_TTL
+SYNCED_AT = {
+    'profile': 'profile_synced_at',
+    'ranks': 'ranks_synced_at',
+    'matches': 'matches_synced_at'
+}
 
 
 def sanitize_name(name):
@@ -26,30 +51,66 @@ def grab_summoner(name):
     indexed_name = sanitize_name(name)
     summoner = Summoner.query.filter_by(indexed_name=indexed_name).first()
     if summoner is None:
-        s = riot_api.grab_summoner(name)
-        summoner = serialize_summoner_to_db(s, indexed_name)
-        add_summoner_to_db(summoner)
+        s, ranks, match_history = fetch_new_summoner(name)
+        summoner = serialize_summoner_to_db(s, indexed_name, ranks)
+        stored = add_summoner_to_db(summoner)
         summoner = Summoner.query.filter_by(indexed_name=indexed_name).first()
-        populate_match_history(summoner)
+        # whoever stored the summoner first also stores their match history
+        if stored:
+            populate_match_history(summoner, match_history['matches'])
+            # games of theirs we already stored through other summoners' pages
+            rebuild_champion_stats(summoner)
 
     return summoner
 
 
+def fetch_new_summoner(name):
+    '''
+    everything the api has to tell us about a summoner we haven't seen before.
+    returns the summoner's account info, ranks and match history list.
+    '''
+    if current_app.config['ASYNC_RIOT_API']:
+        return aio_loop.run(fetch_new_summoner_async(name))
+
+    s = riot_api.grab_summoner(name)
+    ranks = riot_api.get_summoner_ranks(s['id'])
+    match_history = riot_api.get_match_history_list(s['accountId'])
+    return s, ranks, match_history
+
+
+async def fetch_new_summoner_async(name):
+    s = await aio_api.grab_summoner(name)
+    # ranks and match history only depend on the account info
+    ranks, match_history = await asyncio.gather(
+        aio_api.get_summoner_ranks(s['id']),
+        aio_api.get_match_history_list(s['accountId'])
+    )
+    return s, ranks, match_history
+
+
 def add_summoner_to_db(summoner):
+    '''returns False if another request already stored the same summoner'''
     db.session.add(summoner)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
 
 
-def get_highest_rank(summoner_id):
+def get_highest_rank(summoner_id, ranks=None):
     '''Note: Riot just permanently retired position rankings.
        Since they have reverted back to single ranks,
        this function will be reworked in the future as well.
 
        obtain the highest positional rank out of a list of positions from the api call
        Param summoner takes a SimpleNamespace object representing the summoner obtained by the api.
+       Param ranks can be passed in if they were already fetched from the api.
        Returns a SimpleNamespace object representing the highest rank calculated
     '''
-    ranks = riot_api.get_summoner_ranks(summoner_id)
+    if ranks is None:
+        ranks = riot_api.get_summoner_ranks(summoner_id)
     if not ranks:
         rank = SimpleNamespace()
         rank.tier = 'unranked'
@@ -68,9 +129,26 @@ def get_highest_rank(summoner_id):
     return highest_rank
 
 
-def serialize_summoner_to_db(summoner, indexed_name):
+def is_fresh(summoner, part, now=None):
+    '''whether a part of the summoner(see SYNCED_AT) was fetched less than its ttl ago'''
+    synced_at = getattr(summoner, SYNCED_AT[part])
+    if synced_at is None:
+        return False
+    ttl = timedelta(seconds=current_app.config['SUMMONER_{}_TTL'.format(part.upper())])
+    return (now or datetime.utcnow()) - synced_at < ttl
+
+
+def stale_parts(summoner):
+    '''the parts of the summoner due to be fetched again'''
+    now = datetime.utcnow()
+    return [part for part in SYNCED_AT if not is_fresh(summoner, part, now)]
+
+
+def serialize_summoner_to_db(summoner, indexed_name, ranks=None):
     summoner = SimpleNamespace(**summoner)
-    rank = get_highest_rank(summoner.id)
+    rank = get_highest_rank(summoner.id, ranks)
+    # the match history is fetched along with them, see grab_summoner
+    now = datetime.utcnow()
     summoner = Summoner(
         name=summoner.name, indexed_name=indexed_name,
         level=summoner.summonerLevel,
@@ -82,159 +160,307 @@ def serialize_summoner_to_db(summoner, indexed_name):
         points=rank.leaguePoints,
         wins=rank.wins, losses=rank.losses,
         ranked_mode=rank.queueType,
-        position=rank.position
+        position=rank.position,
+        profile_synced_at=now, ranks_synced_at=now, matches_synced_at=now
     )
     return summoner
 
 
-def populate_match_history(summoner):
-    match_history = riot_api.get_match_history_list(summoner.account_id)['matches']
-    for match in match_history:
-        m = serialize_matchref_to_db(match, summoner)
-        add_matchref_to_db(m)
+def populate_match_history(summoner, match_history=None):
+    if match_history is None:
+        match_history = riot_api.get_match_history_list(summoner.account_id)['matches']
+    add_matchrefs_to_db(summoner, match_history)
 
 
-def add_matchref_to_db(match_ref):
-    db.session.add(match_ref)
+def add_matchrefs_to_db(summoner, match_references):
+    '''
+    store a list of match references from the api in a single transaction.
+    references the summoner already has are skipped by the database.
+    references to matches we already stored are summarized right away.
+    '''
+    rows = [matchref_row(match, summoner.id) for match in match_references]
+    if rows:
+        db.session.execute(insert_ignoring_duplicates(ByReferenceMatch), rows)
+        fill_match_summaries(summoner, [row['match_id'] for row in rows])
     db.session.commit()
 
 
-def update_match_history(summoner):
+def insert_ignoring_duplicates(model):
     '''
-    this will be used when we implement a refresh button on the webpage
-    which when clicked will signal the app to call the game api and grab
-    the latest games from riots database.
+    an INSERT for the model's table which skips rows that would break
+    a unique constraint instead of failing the whole transaction.
     '''
+    table = model.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        return table.insert().prefix_with('OR IGNORE')
+    if dialect == 'mysql':
+        return table.insert().prefix_with('IGNORE')
+    return table.insert()
+
+
+def update_match_history(summoner, force=False):
+    '''
+    add the games the summoner played since their match list was last fetched.
+    skipped while the match list is fresh, unless forced.
+    '''
+    if not force and is_fresh(summoner, 'matches'):
+        return
     match_references = riot_api.get_match_history_list(summoner.account_id)['matches']
-    for match in match_references:
-        # once we come across a match that is already in the database
-        # we know we're up to date so break from the iteration
-        m = ByReferenceMatch.query.filter_by(summoner_context=summoner,
-                                             match_id=match['gameId']).first()
-        if m:
-            break
-        else:
-            m = serialize_matchref_to_db(match, summoner)
-            db.session.add(m)
-    db.session.commit()
+    known = set(
+        match_id for match_id, in
+        db.session.query(ByReferenceMatch.match_id).filter(
+            ByReferenceMatch.summoner_id == summoner.id,
+            ByReferenceMatch.match_id.in_([match['gameId'] for match in match_references])
+        )
+    )
+    new_references = [match for match in match_references if match['gameId'] not in known]
+    summoner.matches_synced_at = datetime.utcnow()
+    # commits the sync time along with the references
+    add_matchrefs_to_db(summoner, new_references)
 
 
-def update_summoner_info(summoner):
+def update_summoner_info(summoner, force=False):
     '''
-    this will be called when we implement a refresh button on the webpage
-    which will update the summoner's general info such as current profile icon,
-    rank, level, etc.
+    update the summoner's general info such as current profile icon,
+    rank, level, etc. the profile and ranks are only fetched once
+    they're stale, unless forced.
     '''
-    updated_info = riot_api.grab_summoner(summoner.name)
-    # if summoner.account_id != updated_info:
-    # name change
-    # get summoner by encrypted id
-    # riot_api.grab_summoner(summoner.account_id)
-    # update the database entry's old name to the new name
-    s = SimpleNamespace(**updated_info)
-    # update their level and displayed icon
-    summoner.level = s.summonerLevel
-    summoner.profile_icon = s.profileIconId
-
-    # update their rank progress
-    updated_rank = get_highest_rank(s.id)
-    summoner.highest_rank = updated_rank.tier
-    summoner.rank_division = updated_rank.rank
-    summoner.points = updated_rank.leaguePoints
-    summoner.wins = updated_rank.wins
-    summoner.losses = updated_rank.losses
+    now = datetime.utcnow()
+    if force or not is_fresh(summoner, 'profile', now):
+        updated_info = riot_api.grab_summoner(summoner.name)
+        # if summoner.account_id != updated_info:
+        # name change
+        # get summoner by encrypted id
+        # riot_api.grab_summoner(summoner.account_id)
+        # update the database entry's old name to the new name
+        s = SimpleNamespace(**updated_info)
+        # update their level and displayed icon
+        summoner.level = s.summonerLevel
+        summoner.profile_icon = s.profileIconId
+        summoner.profile_synced_at = now
+
+    if force or not is_fresh(summoner, 'ranks', now):
+        # update their rank progress
+        updated_rank = get_highest_rank(summoner.summoner_id)
+        summoner.highest_rank = updated_rank.tier
+        summoner.rank_division = updated_rank.rank
+        summoner.points = updated_rank.leaguePoints
+        summoner.wins = updated_rank.wins
+        summoner.losses = updated_rank.losses
+        summoner.ranks_synced_at = now
 
     db.session.commit()
 
 
-def update_summoner_page(summoner_name):
+def update_summoner_page(summoner_name, force=False):
+    '''
+    fetch whatever went stale of a summoner, or all of it when forced.
+    refresh button clicks force it, page views don't(see idle/refresh.py)
+    '''
     indexed_name = sanitize_name(summoner_name)
     summoner = Summoner.query.filter_by(indexed_name=indexed_name).first()
-    update_match_history(summoner)
-    update_summoner_info(summoner)
+    update_match_history(summoner, force)
+    update_summoner_info(summoner, force)
 
 
 def serialize_matchref_to_db(match, summoner):
+    return ByReferenceMatch(**matchref_row(match, summoner.id))
+
+
+def matchref_row(match, summoner_id):
+    '''column values of a ByReferenceMatch from an entry of the api's match list'''
     match = SimpleNamespace(**match)
     time_converted_from_milliseconds = match.timestamp / 1000
-    m = ByReferenceMatch(summoner_context=summoner, match_id=match.gameId,
-                         lane_played=match.lane, game_mode=match.queue,
-                         timestamp=time_converted_from_milliseconds,
-                         champion_played=CHAMPIONS[match.champion])
-    return m
+    return dict(summoner_id=summoner_id, match_id=match.gameId,
+                lane_played=match.lane, game_mode=match.queue,
+                timestamp=time_converted_from_milliseconds,
+                champion_played=CHAMPIONS[match.champion])
 
 
-def get_match_stats(matches, page_num=1):
+def load_matches(match_refs):
     '''
-    attempt to get a match and it's participants in detail from the database.
-    if it doesn't exist we call the game's api and then store it in the databse.
-
-    args:
-    summoner: Summoner database object which has a match_history attribute.
-    page_num: int, used for pagination of query results
+    the Match of every match reference, with its players loaded.
+    the ones we haven't stored yet are fetched from the api and stored.
+    '''
+    if not match_refs:
+        return []
+
+    stored = {
+        match.match_id: match
+        for match in Match.with_players([match_ref.match_id for match_ref in match_refs])
+    }
+    missing = {
+        match_ref.match_id: match_ref
+        for match_ref in match_refs
+        if match_ref.match_id not in stored
+    }
+
+    # fetch whatever we don't have yet all at once, then store it in one go
+    matches_from_api = fetch_match_stats(list(missing))
+    with _match_insert_lock:
+        ingested = add_matches_to_db([
+            (matches_from_api[match_id], match_ref.timestamp)
+            for match_id, match_ref in missing.items()
+        ])
+    stored.update(zip(missing, ingested))
+
+    return [stored[match_ref.match_id] for match_ref in match_refs]
+
+
+def fetch_match_stats(match_ids):
     '''
-    match_with_stats = []
+    call the api for several matches concurrently.
+    calls still go through the api's rate limiter,
+    this only overlaps the time spent waiting on riot.
 
-    for match_ref in matches.items:
-        match = Match.query.filter_by(match_id=match_ref.match_id).first()
-        if not match:
-            match_from_api = riot_api.get_match_stats(match_ref.match_id)
-            match = add_match_to_db(match_from_api, match_ref.timestamp)
-        else:
-            for player in match.players:
-                rank = get_rank(player)
-                player.current_rank = rank
-                db.session.commit()
+    returns a dictionary of match id -> match data from the api
+    '''
+    if not match_ids:
+        return {}
 
-        match_with_stats.append(match)
+    if current_app.config['ASYNC_RIOT_API']:
+        return aio_loop.run(fetch_match_stats_async(match_ids))
 
-    return match_with_stats
+    workers = min(len(match_ids), current_app.config['MATCH_FETCH_WORKERS'])
+    # every call runs in a copy of this thread's context variables,
+    # so whatever it records(see metrics.py) lands on this request
+    contexts = [contextvars.copy_context() for _ in match_ids]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        stats = pool.map(lambda context, match_id: context.run(riot_api.get_match_stats, match_id),
+                         contexts, match_ids)
+        return dict(zip(match_ids, stats))
 
 
-def add_match_to_db(match, match_timestamp):
-    match = SimpleNamespace(**match)
-    m = Match(match_id=match.gameId, game_mode=match.queueId,
-              timestamp=match_timestamp)
+async def fetch_match_stats_async(match_ids):
+    matches = await asyncio.gather(*(aio_api.get_match_stats(match_id) for match_id in match_ids))
+    return dict(zip(match_ids, matches))
 
-    db.session.add(m)
 
-    for player, player_id in zip(match.participants, match.participantIdentities):
-        player.update(player_id['player'])
-        player = serialize_player_to_db(player, m)
-        db.session.add(player)
+def add_match_to_db(match, match_timestamp, commit=True):
+    '''
+    store a match from the api with all of its players.
+    if the match was stored in the meantime, the stored one is returned instead.
+    '''
+    return add_matches_to_db([(match, match_timestamp)], commit)[0]
 
-    db.session.commit()
 
-    return m
+def add_matches_to_db(matches, commit=True):
+    '''
+    store a batch of matches from the api along with all of their players.
+    every match is its own INSERT that skips duplicates, its rowcount tells
+    whether we stored it. their players then go in with a single executemany,
+    the champion stats with one upsert and the summaries of the tracked
+    summoners' match references with one batched UPDATE.
+
+    matches is a list of (match data, timestamp) pairs.
+    matches that are already stored are skipped, including the ones
+    another request or process stores while this one is running.
+    the match references of tracked summoners who played in them get summarized.
+    returns the Match objects in the same order.
+    '''
+    if not matches:
+        return []
 
+    match_ids = [match['gameId'] for match, _ in matches]
+    existing = set(
+        match_id for match_id, in
+        db.session.query(Match.match_id).filter(Match.match_id.in_(match_ids))
+    )
 
-def serialize_player_to_db(player, match):
+    new_matches = {}
+    for match, match_timestamp in matches:
+        if match['gameId'] not in existing:
+            new_matches.setdefault(match['gameId'], (match, match_timestamp))
+
+    # one row per statement so that the rowcount tells us whether we
+    # or someone else stored a match, only our matches count towards stats
+    insert_match = insert_ignoring_duplicates(Match)
+    for match_id, (match, match_timestamp) in list(new_matches.items()):
+        inserted = db.session.execute(insert_match, dict(
+            match_id=match_id, game_mode=match['queueId'], timestamp=match_timestamp,
+            duration=match.get('gameDuration')
+        ))
+        if not inserted.rowcount:
+            del new_matches[match_id]
+
+    if new_matches:
+        game_ids = dict(
+            db.session.query(Match.match_id, Match.id).filter(Match.match_id.in_(list(new_matches)))
+        )
+
+        tracked = get_tracked_summoners(
+            player_id['player']['summonerName']
+            for match, _ in new_matches.values()
+            for player_id in match['participantIdentities']
+        )
+
+        player_rows = []
+        summaries = []
+        tracked_games = []
+        for match_id, (match, _) in new_matches.items():
+            for player in match_participants(match):
+                summoner = tracked.get(player['summonerName'])
+                rank = summoner.rank if summoner is not None else 'unranked'
+                row = player_row(player, rank)
+                row['game_id'] = game_ids[match_id]
+                player_rows.append(row)
+
+                if summoner is not None:
+                    tracked_games.append((summoner, row, match['queueId']))
+                    summaries.append(summary_row(summoner.id, match_id, row,
+                                                 match.get('gameDuration')))
+
+        db.session.execute(insert_ignoring_duplicates(Player), player_rows)
+        record_champion_stats(tracked_games)
+        if summaries:
+            db.session.execute(match_summary_update(), summaries)
+
+    if commit:
+        db.session.commit()
+
+    stored = {m.match_id: m for m in Match.with_players(match_ids)}
+    return [stored[match_id] for match_id in match_ids]
+
+
+def match_participants(match):
+    '''the players of a match from the api with their summoner info merged in'''
+    for player, player_id in zip(match['participants'], match['participantIdentities']):
+        # don't touch the payload itself, it may be shared through the api cache
+        yield dict(player, **player_id['player'])
+
+
+def serialize_player_to_db(player, match, rank=None):
+    return Player(game_context=match, **player_row(player, rank))
+
+
+def player_row(player, rank=None):
+    '''column values of a Player from a participant of the api's match data'''
+    if rank is None:
+        rank = get_rank(SimpleNamespace(**player))
+
+    row = player_columns(player)
+    row['current_rank'] = rank
+    return row
+
+
+def player_columns(player):
+    '''
+    every Player column that comes straight out of a participant of the api's
+    match data, nothing is looked up. shared by ingest and the archive reprocessing
+    (see reprocess.py) so both derive a column the same way.
+    '''
     player = SimpleNamespace(**player)
     stats = SimpleNamespace(**player.stats)
-    indexed_name = sanitize_name(player.summonerName)
-
-    rank = get_rank(player)
-
-    try:
-        champion_played = CHAMPIONS[player.championId]
-    except KeyError:
-        champion_played = player.championId
 
-    try:
-        spell1 = SUMMONER_SPELLS[player.spell1Id]
-    except KeyError:
-        spell1 = SUMMONER_SPELLS[0]
-
-    try:
-        spell2 = SUMMONER_SPELLS[player.spell2Id]
-    except KeyError:
-        spell2 = SUMMONER_SPELLS[0]
-
-    player = Player(
-        game_context=match, name=player.summonerName,
-        indexed_name=indexed_name,
-        current_rank=rank,
-        champion_played=champion_played,
+    # champions, spells and items are stored as ids, names are looked up when shown
+    return dict(
+        participant_id=player.participantId,
+        name=player.summonerName,
+        indexed_name=sanitize_name(player.summonerName),
+        champion_id=player.championId,
         champion_level=stats.champLevel,
         win=stats.win, team_id=player.teamId,
         item1=stats.item0, item2=stats.item1, item3=stats.item2,
@@ -242,9 +468,10 @@ def serialize_player_to_db(player, match):
         item7=stats.item6,
         kills=stats.kills, deaths=stats.deaths, assists=stats.assists,
         gold_earned=stats.goldEarned, gold_spent=stats.goldSpent,
-        spell1=spell1, spell2=spell2
+        damage_dealt=getattr(stats, 'totalDamageDealtToChampions', None),
+        damage_healed=getattr(stats, 'totalHeal', None),
+        spell1_id=player.spell1Id, spell2_id=player.spell2Id
     )
-    return player
 
 
 def get_rank(player):
@@ -260,10 +487,32 @@ def get_rank(player):
     else:
         name = player.name
 
-    summoner = Summoner.query.filter_by(name=name).first()
-    if summoner is not None:
-        rank = summoner.highest_rank + ' ' + summoner.rank_division
-    else:
-        rank = 'unranked'
+    return get_ranks([name]).get(name, 'unranked')
+
+
+def get_tracked_summoners(names):
+    '''returns a dictionary of name -> Summoner for the names we have a summoner of'''
+    names = set(names)
+    if not names:
+        return {}
+    return {s.name: s for s in Summoner.query.filter(Summoner.name.in_(names))}
 
-    return rank
+
+def get_ranks(names):
+    '''
+    get_rank() for a whole bunch of players in a single query.
+    returns a dictionary of name -> rank for the names we have a summoner of,
+    anyone missing is unranked as far as we know.
+    '''
+    names = set(names)
+    if not names:
+        return {}
+
+    summoners = db.session.query(
+        Summoner.name, Summoner.highest_rank, Summoner.rank_division
+    ).filter(Summoner.name.in_(names))
+
+    return {
+        name: tier + ' ' + division
+        for name, tier, division in summoners
+    }
@@ -3,11 +3,19 @@ background work to help with how player ranked stats are displayed
 '''
 import time
 
-from ..helpers import add_match_to_db
+from sqlalchemy import exists
+
+from ..helpers.storage import add_matches_to_db
 from ..models import ByReferenceMatch, Match
-from ..game import api
+from ..game import api, BACKGROUND
+
+# crawling shares the web app's rate limiter but leaves room for page views
+crawler_api = api.with_priority(BACKGROUND)
+# nobody is waiting on the crawler, it can sit out a whole rate limit window
+crawler_api.max_retry_wait = 120
 
-RATE_LIMIT = 7
+# matches stored per transaction
+BATCH_SIZE = 20
 
 
 class Interrupt(BaseException):
@@ -18,32 +26,32 @@ def populate_match_table():
     '''
     populate match table with ranked games to stabilize player ranked stats
     '''
-    all_references = ByReferenceMatch.query.filter(
-        ByReferenceMatch.game_mode.in_([440, 420])
+    # references to ranked games that aren't in the match table yet
+    missing_references = ByReferenceMatch.query.filter(
+        ByReferenceMatch.game_mode.in_([440, 420]),
+        ~exists().where(Match.match_id == ByReferenceMatch.match_id)
     ).order_by(
         ByReferenceMatch.timestamp.desc()
     ).all()
 
+    # several summoners can reference the same game
+    to_fetch = {}
+    for match in missing_references:
+        to_fetch.setdefault(match.match_id, match.timestamp)
+    to_fetch = list(to_fetch.items())
+
     total = 0
-    count = 0
 
     start = time.time()
     try:
-        for match in all_references:
-            existing_entry = Match.query.filter_by(match_id=match.match_id).first()
-            if existing_entry is not None:
-                print("Skipping %r" % existing_entry)
-                continue
-            else:
-                match_from_api = api.get_match_stats(match.match_id)
-                m = add_match_to_db(match_from_api, match.timestamp)
-                print("Added %r..." % m)
-                total = total + 1
-                count += 1
-                if count == RATE_LIMIT:
-                    print("Rate limit reached, sleeping...")
-                    time.sleep(5)
-                    count = 0
+        for i in range(0, len(to_fetch), BATCH_SIZE):
+            batch = [
+                (crawler_api.get_match_stats(match_id), timestamp)
+                for match_id, timestamp in to_fetch[i:i + BATCH_SIZE]
+            ]
+            stored = add_matches_to_db(batch)
+            print("Added %r..." % stored)
+            total = total + len(stored)
     except Exception as e:
         raise Interrupt(str(e))
     finally:
@@ -0,0 +1,237 @@
+'''
+summoner refreshes, run in the background instead of the web request.
+
+the refresh button queues a RefreshJob and returns straight away, the
+page polls the job's status until it's over and reloads. a summoner has
+at most one job queued or running, clicking again hands back that job.
+a summoner refreshed less than REFRESH_MIN_INTERVAL seconds ago gets that
+finished job back instead of a new one. clicks force their job to fetch
+everything, fresh or not. jobs queued by page views only fetch the parts
+of a summoner that went stale, see update_summoner_page.
+
+page views queue a job of their own when what's stored of the summoner
+went stale(revalidate), the page is drawn from the database right away
+and picks up the update once the job is done.
+
+jobs live in the database so any process can run them. the web processes
+run REFRESH_WORKERS threads of their own(started with the first job they
+queue), with REFRESH_WORKERS=0 they only queue and a separate process works:
+
+    flask refresh work
+
+a job is taken by flipping it from queued to running in a single UPDATE,
+so two workers never run the same one. jobs left running longer than
+REFRESH_JOB_TIMEOUT(a worker that died mid job) are failed, and so are jobs
+queued for that long. the workers look for those once every REFRESH_JOB_TIMEOUT,
+a summoner's own are failed as soon as their newest job is looked up.
+'''
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from .. import db
+from ..game.api import BadResponse
+from ..helpers.storage import stale_parts, update_summoner_page
+from ..models import RefreshJob
+
+# woken up whenever a job is queued, so the local workers don't sit out the poll interval
+_queued = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+# time.monotonic() of when this process' workers last looked for abandoned jobs
+_abandoned_checked = None
+_abandoned_lock = threading.Lock()
+
+
+def latest_job(summoner):
+    '''the newest refresh job of a summoner, None if they were never refreshed'''
+    job = RefreshJob.query.filter_by(
+        summoner_id=summoner.id
+    ).order_by(RefreshJob.id.desc()).first()
+    if job is not None and abandoned(job):
+        # without workers around nobody else fails it, and it'd block the summoner's next one
+        fail_abandoned()
+    return job
+
+
+def enqueue_refresh(summoner, force=False, throttle_failed=False):
+    '''
+    queue a refresh of the summoner's page, returns its RefreshJob.
+    that's an already queued/running job or a recently finished one if
+    there is one, nothing new is queued then.
+    force fetches every part of the summoner(see RefreshJob.force), a queued
+    job is forced along with it and only recently finished forced jobs count.
+    recently failed jobs only count with throttle_failed, a click retries them.
+    '''
+    finished = ('done', 'failed') if throttle_failed else ('done',)
+    job = latest_job(summoner)
+    if job is not None and job.active:
+        if force and not job.force:
+            # a job a page view queued, still waiting for a worker
+            RefreshJob.query.filter_by(id=job.id, status='queued').update(
+                {'force': True}, synchronize_session=False)
+            db.session.commit()
+        return job
+    if job is not None and _recently_finished(job, finished) and (job.force or not force):
+        return job
+
+    job = RefreshJob(summoner_id=summoner.id, active_summoner_id=summoner.id, force=force)
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # someone else queued one in the meantime
+        db.session.rollback()
+        return latest_job(summoner)
+
+    _start_workers(current_app._get_current_object())
+    _queued.set()
+    return job
+
+
+def _recently_finished(job, statuses):
+    min_interval = timedelta(seconds=current_app.config['REFRESH_MIN_INTERVAL'])
+    return job.status in statuses and job.finished_at > datetime.utcnow() - min_interval
+
+
+def revalidate(summoner):
+    '''
+    queue a refresh if any part of the summoner went stale and SUMMONER_REVALIDATE
+    is on, returns the job if one is queued or running, None otherwise
+    '''
+    if not current_app.config['SUMMONER_REVALIDATE'] or not stale_parts(summoner):
+        return None
+    # riot being down shouldn't queue a job per page view
+    job = enqueue_refresh(summoner, throttle_failed=True)
+    return job if job.active else None
+
+
+def claim():
+    '''take the oldest queued job, returns None if there's none left'''
+    queued = db.session.query(RefreshJob.id).filter_by(
+        status='queued'
+    ).order_by(RefreshJob.id).limit(10).all()
+
+    for job_id, in queued:
+        taken = RefreshJob.query.filter_by(id=job_id, status='queued').update(
+            {'status': 'running', 'started_at': datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.session.commit()
+        # another worker got to it first otherwise
+        if taken:
+            return RefreshJob.query.get(job_id)
+    return None
+
+
+def run_job(job):
+    '''refresh the job's summoner, the job ends up done or failed'''
+    try:
+        update_summoner_page(job.summoner.name, force=job.force)
+        job.status = 'done'
+    except (Exception, BadResponse) as e:
+        db.session.rollback()
+        current_app.logger.exception('refresh of %s failed', job.summoner_id)
+        job.status = 'failed'
+        job.error = repr(e)[:200]
+    job.finished_at = datetime.utcnow()
+    job.active_summoner_id = None
+    db.session.commit()
+    return job
+
+
+def fail_abandoned():
+    '''
+    fail the jobs running for longer than REFRESH_JOB_TIMEOUT seconds, and the ones
+    queued for that long(nobody works on refreshes, or the workers can't keep up)
+    '''
+    cutoff = _abandoned_cutoff()
+    failed = 0
+    for status, since, error in (('running', RefreshJob.started_at, 'abandoned by its worker'),
+                                 ('queued', RefreshJob.created_at, 'never picked up by a worker')):
+        failed += RefreshJob.query.filter(
+            RefreshJob.status == status, since < cutoff
+        ).update({'status': 'failed', 'error': error,
+                  'finished_at': datetime.utcnow(), 'active_summoner_id': None},
+                 synchronize_session=False)
+    db.session.commit()
+    return failed
+
+
+def abandoned(job):
+    '''whether the job is queued or running for longer than REFRESH_JOB_TIMEOUT seconds'''
+    since = job.started_at if job.status == 'running' else job.created_at
+    return job.active and since < _abandoned_cutoff()
+
+
+def _abandoned_cutoff():
+    return datetime.utcnow() - timedelta(seconds=current_app.config['REFRESH_JOB_TIMEOUT'])
+
+
+def _fail_abandoned_now_and_then(app):
+    '''
+    fail_abandoned, once every REFRESH_JOB_TIMEOUT seconds by one of the process'
+    workers rather than an UPDATE per poll. an abandoned job is failed at most
+    that much later than it would be otherwise
+    '''
+    global _abandoned_checked
+    now = time.monotonic()
+    with _abandoned_lock:
+        if _abandoned_checked is not None and \
+                now - _abandoned_checked < app.config['REFRESH_JOB_TIMEOUT']:
+            return
+        _abandoned_checked = now
+    fail_abandoned()
+
+
+def work(app, stop=None):
+    '''
+    run jobs until stop(a threading.Event) is set, checking
+    for new ones every REFRESH_POLL_INTERVAL seconds when idle
+    '''
+    stop = stop or threading.Event()
+    poll_interval = app.config['REFRESH_POLL_INTERVAL']
+    while not stop.is_set():
+        job = None
+        try:
+            # every job in an app context of its own, its session goes away with it
+            with app.app_context():
+                _fail_abandoned_now_and_then(app)
+                job = claim()
+                if job is not None:
+                    run_job(job)
+        except Exception:
+            # i.e. the database went away for a moment, keep the worker alive
+            app.logger.exception('refresh worker')
+        if job is None:
+            _queued.wait(poll_interval)
+            _queued.clear()
+
+
+def _start_workers(app):
+    if len(_workers) >= app.config['REFRESH_WORKERS']:
+        return
+    with _workers_lock:
+        while len(_workers) < app.config['REFRESH_WORKERS']:
+            worker = threading.Thread(target=work, args=(app,), daemon=True,
+                                      name='refresh-worker-{}'.format(len(_workers)))
+            worker.start()
+            _workers.append(worker)
+
+
+def exportable(job):
+    '''what the page polls for, see the summoner.refresh_status view'''
+    def timestamp(moment):
+        return moment.isoformat() + 'Z' if moment else None
+
+    return {
+        'id': job.id,
+        'status': job.status,
+        'created_at': timestamp(job.created_at),
+        'started_at': timestamp(job.started_at),
+        'finished_at': timestamp(job.finished_at),
+        'error': job.error
+    }
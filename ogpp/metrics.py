@@ -0,0 +1,253 @@
+'''
+per request instrumentation, served in prometheus' text format on /metrics.
+
+every request gets a tally which the hooks below add to while it runs:
+
+    sql statements    sqlalchemy's cursor execute events, count and time
+    riot api calls    RiotAPI.on_call, count and time per URL route(the call's endpoint)
+                      and where the data came from(riot, cache or archive)
+    templates         flask's template signals, time spent rendering
+
+once the request is done the tally goes into histograms labelled with the
+flask endpoint(summoner.summoner, leaderboard.leaderboard, ...) so a slow
+page can be pinned on the database, riot or jinja.
+
+api calls made on the match fetching threads and the event loop land on
+the request that made them, the tally is a context variable carried over
+to them(see fetch_match_stats, EventLoop.run).
+
+observing is a bisect and a couple of additions under a lock, cheap enough
+to leave on. numbers are kept per process, with several worker processes
+every one of them has to be scraped on its own.
+'''
+import bisect
+import contextvars
+import threading
+import time
+from types import SimpleNamespace
+
+from flask import Response, abort, current_app, request, template_rendered, \
+    before_render_template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# upper bounds of the histogram buckets
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNTS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# endpoints not worth keeping numbers of
+SKIPPED_ENDPOINTS = ('static', 'metrics')
+
+# the tally of the request being handled, None outside of one
+_tally = contextvars.ContextVar('ogpp_request_tally', default=None)
+
+
+class Histogram:
+    '''
+    a prometheus histogram with one series per combination of label values.
+
+    request_seconds = Histogram('ogpp_request_seconds', 'time per request', ('endpoint',))
+    request_seconds.observe(0.2, 'summoner.summoner')
+    '''
+    def __init__(self, name, documentation, labels=(), buckets=SECONDS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket..., count of +Inf, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "Histogram<{0.name}, series: {1}>".format(self, len(self._series))
+
+    def observe(self, value, *label_values):
+        # counts are kept per bucket and summed up into prometheus'
+        # cumulative buckets when rendered, observing only bumps one
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} histogram'.format(self.name)
+        ]
+        with self._lock:
+            series = sorted((key, list(value)) for key, value in self._series.items())
+
+        for label_values, counts in series:
+            labels = ['{}="{}"'.format(label, _escape(value))
+                      for label, value in zip(self.labels, label_values)]
+            total = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                total += count
+                bucket_labels = ','.join(labels + ['le="{}"'.format(_format(bound))])
+                lines.append('{}_bucket{{{}}} {}'.format(self.name, bucket_labels, total))
+            suffix = '{{{}}}'.format(','.join(labels)) if labels else ''
+            lines.append('{}_sum{} {}'.format(self.name, suffix, _format(counts[-1])))
+            lines.append('{}_count{} {}'.format(self.name, suffix, total))
+        return '\n'.join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+def _format(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+request_seconds = Histogram(
+    'ogpp_request_seconds', 'time spent handling a request', ('endpoint',))
+sql_statements = Histogram(
+    'ogpp_request_sql_statements', 'sql statements executed per request',
+    ('endpoint',), COUNTS)
+sql_seconds = Histogram(
+    'ogpp_request_sql_seconds', 'time spent executing sql per request', ('endpoint',))
+riot_calls = Histogram(
+    'ogpp_request_riot_calls', 'riot api calls made per request', ('endpoint',), COUNTS)
+riot_seconds = Histogram(
+    'ogpp_request_riot_seconds', 'time spent in riot api calls per request, '
+    'concurrent calls add up', ('endpoint',))
+riot_call_seconds = Histogram(
+    'ogpp_riot_call_seconds', 'time per riot api call by url route and where '
+    'the data came from', ('endpoint', 'route', 'source'))
+template_seconds = Histogram(
+    'ogpp_request_template_seconds', 'time spent rendering templates per request',
+    ('endpoint',))
+
+HISTOGRAMS = [request_seconds, sql_statements, sql_seconds, riot_calls,
+              riot_seconds, riot_call_seconds, template_seconds]
+
+
+def new_tally():
+    return SimpleNamespace(started=time.perf_counter(),
+                           sql_statements=0, sql_seconds=0.0,
+                           # (route, source, seconds) of every api call,
+                           # appended to from several threads
+                           riot=[],
+                           template_seconds=0.0, template_started=[])
+
+
+def current_tally():
+    '''the tally of the request being handled, None outside of one'''
+    return _tally.get()
+
+
+def render():
+    return '\n'.join(histogram.render() for histogram in HISTOGRAMS) + '\n'
+
+
+# hooks
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if _tally.get() is not None:
+        context._ogpp_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    tally = _tally.get()
+    started = getattr(context, '_ogpp_started', None)
+    if tally is not None and started is not None:
+        tally.sql_statements += 1
+        tally.sql_seconds += time.perf_counter() - started
+
+
+def api_call(route, source, seconds):
+    '''RiotAPI.on_call, see game/api.py'''
+    tally = _tally.get()
+    if tally is not None:
+        tally.riot.append((route, source, seconds))
+
+
+def _before_render(app, template, context):
+    tally = _tally.get()
+    if tally is not None:
+        tally.template_started.append(time.perf_counter())
+
+
+def _rendered(app, template, context):
+    tally = _tally.get()
+    if tally is not None and tally.template_started:
+        # a template rendered inside of another's only counts once
+        started = tally.template_started.pop()
+        if not tally.template_started:
+            tally.template_seconds += time.perf_counter() - started
+
+
+def _start_request():
+    _tally.set(new_tally())
+
+
+def _finish_request(response):
+    tally = _tally.get()
+    if tally is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    if endpoint not in SKIPPED_ENDPOINTS:
+        record(tally, endpoint)
+    return response
+
+
+def _end_request(error=None):
+    _tally.set(None)
+
+
+def record(tally, endpoint):
+    '''put a finished request's tally into the histograms'''
+    request_seconds.observe(time.perf_counter() - tally.started, endpoint)
+    sql_statements.observe(tally.sql_statements, endpoint)
+    sql_seconds.observe(tally.sql_seconds, endpoint)
+    calls = list(tally.riot)
+    riot_calls.observe(len(calls), endpoint)
+    riot_seconds.observe(sum(seconds for _, _, seconds in calls), endpoint)
+    for route, source, seconds in calls:
+        riot_call_seconds.observe(seconds, endpoint, route, source)
+    template_seconds.observe(tally.template_seconds, endpoint)
+
+
+def metrics():
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != 'Bearer ' + token:
+        abort(403)
+    return Response(render(), content_type=CONTENT_TYPE)
+
+
+_engine_hooked = False
+
+
+def init_app(app):
+    '''instrument the app's requests and serve /metrics, see create_app'''
+    global _engine_hooked
+
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    from .game import api, aio_api
+    api.on_call = aio_api.on_call = api_call
+
+    # on every engine, flask-sqlalchemy makes its own once it's first used
+    if not _engine_hooked:
+        event.listen(Engine, 'before_cursor_execute', _before_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_execute)
+        _engine_hooked = True
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+    app.add_url_rule('/metrics', 'metrics', metrics)
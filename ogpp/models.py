@@ -14,7 +14,7 @@ from datetime import datetime
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
-from .game import _QUEUE_TYPE, QUEUE_TYPE
+from .game import _QUEUE_TYPE, QUEUE_TYPE, champion_name, spell_name
 from . import db
 
 
@@ -74,9 +74,16 @@ class Summoner(db.Model):
     wins = db.Column(db.Integer)
     losses = db.Column(db.Integer)
     ranked_mode = db.Column(db.String(20))
+    # when each part was last fetched from the api, NULL if it never was.
+    # parts fetched less than their SUMMONER_*_TTL ago aren't fetched again(see helpers/storage.py)
+    profile_synced_at = db.Column(db.DateTime)
+    ranks_synced_at = db.Column(db.DateTime)
+    matches_synced_at = db.Column(db.DateTime)
 
     match_history = db.relationship('ByReferenceMatch',
                                     backref="summoner_context", lazy='dynamic')
+    champion_stats = db.relationship('SummonerChampionStats',
+                                     backref='summoner_context', lazy='dynamic')
 
     def __repr__(self):
         return "Summoner<{0.name}, Level:{0.level}>".format(self)
@@ -117,13 +124,103 @@ class Summoner(db.Model):
         return mh
 
 
-class ByReferenceMatch(db.Model):
+class RefreshJob(db.Model):
+    '''
+    A summoner's page being refreshed from the api in the background,
+    queued by the refresh button and run by a worker(see idle/refresh.py).
+    Finished jobs are kept around, the newest one of a summoner is what
+    the page polls and what throttles the next refresh.
+    '''
+    __table_args__ = (
+        # a summoner's newest job
+        db.Index('ix_refresh_job_summoner_id_id', 'summoner_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    summoner_id = db.Column(db.Integer, db.ForeignKey('summoner.id'), nullable=False)
+    # queued -> running -> done or failed
+    status = db.Column(db.String(10), index=True, default='queued')
+    # the summoner's id while the job is queued or running, NULL once it's over.
+    # unique, so a summoner never has two jobs waiting no matter who clicks
+    active_summoner_id = db.Column(db.Integer, unique=True)
+    # fetch every part of the summoner, fresh or not. set for refresh button clicks,
+    # jobs queued by page views(revalidate) only fetch what went stale
+    force = db.Column(db.Boolean, default=False)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    error = db.Column(db.String(200))
+
+    summoner = db.relationship('Summoner')
+
+    def __repr__(self):
+        return "RefreshJob<{0.id} of {0.summoner_id}: {0.status}>".format(self)
+
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+
+class InGameStats:
+    '''
+    display helpers of anything with a player's kda, spell and item columns.
+    spells and items are stored as riot's ids, their names(and image file names)
+    are looked up as they're shown.
+    '''
+    @property
+    def spell1(self):
+        return spell_name(self.spell1_id)
+
+    @property
+    def spell2(self):
+        return spell_name(self.spell2_id)
+
+    @property
+    def items(self):
+        items = [self.item1, self.item2, self.item3, self.item4, self.item5, self.item6, self.item7]
+        return [str(item) for item in items]
+
+    @property
+    def avg_kda(self):
+        try:
+            out = (self.kills + self.assists) / self.deaths
+        except ZeroDivisionError:
+            out = self.kills + self.assists
+
+        out = float('{:.2f}'.format(out))
+        return out
+
+    @property
+    def kda(self):
+        fmt = "{0}/{1}/{2}"
+        return fmt.format(self.kills, self.deaths, self.assists)
+
+
+class ByReferenceMatch(InGameStats, db.Model):
     '''
     Database model that holds light references to
     access matches in more detail using the api.
     It will be used to either query
     or, populate through the game api, the Match table.
     '''
+    __table_args__ = (
+        # a match shows up once in a summoner's history
+        db.UniqueConstraint('summoner_id', 'match_id',
+                            name='uq_by_reference_match_summoner_id_match_id'),
+        # one index per filter combination of the summoner page,
+        # each ending in the (timestamp, id) page order so pages come out
+        # of the index already sorted and cursors seek straight to their row
+        db.Index('ix_by_reference_match_summoner_timestamp',
+                 'summoner_id', 'timestamp', 'id'),
+        db.Index('ix_by_reference_match_summoner_mode_timestamp',
+                 'summoner_id', 'game_mode', 'timestamp', 'id'),
+        db.Index('ix_by_reference_match_summoner_champion_timestamp',
+                 'summoner_id', 'champion_played', 'timestamp', 'id'),
+        db.Index('ix_by_reference_match_summoner_mode_champion_timestamp',
+                 'summoner_id', 'game_mode', 'champion_played', 'timestamp', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     summoner_id = db.Column(db.Integer, db.ForeignKey('summoner.id'))
     lane_played = db.Column(db.String(20))
@@ -135,6 +232,26 @@ class ByReferenceMatch(db.Model):
     game_mode = db.Column(db.Integer)
     timestamp = db.Column(db.Float)
 
+    # summary of the summoner's own game, same as their Player entry.
+    # filled in once the match itself is stored, so the match history list
+    # can be drawn without going through the Match and Player tables.
+    win = db.Column(db.Boolean)
+    champion_level = db.Column(db.Integer)
+    kills = db.Column(db.Integer)
+    deaths = db.Column(db.Integer)
+    assists = db.Column(db.Integer)
+    spell1_id = db.Column(db.SmallInteger)
+    spell2_id = db.Column(db.SmallInteger)
+    item1 = db.Column(db.SmallInteger)
+    item2 = db.Column(db.SmallInteger)
+    item3 = db.Column(db.SmallInteger)
+    item4 = db.Column(db.SmallInteger)
+    item5 = db.Column(db.SmallInteger)
+    item6 = db.Column(db.SmallInteger)
+    item7 = db.Column(db.SmallInteger)
+    # seconds
+    duration = db.Column(db.Integer)
+
     def __repr__(self):
         return (
             "ByReferenceMatch<ID: {0.match_id} Type:{0.queue_type}, "
@@ -150,6 +267,45 @@ class ByReferenceMatch(db.Model):
     def queue_type(self):
         return QUEUE_TYPE[self.game_mode]
 
+    @property
+    def summarized(self):
+        return self.win is not None
+
+
+class SummonerChampionStats(db.Model):
+    '''
+    Running totals of a summoner's games on a champion in a queue.
+    Rows are bumped whenever a match of a summoner we track is stored,
+    so aggregates like the ranked side bar read a handful of rows
+    instead of going through the whole match history.
+    '''
+    __table_args__ = (
+        db.UniqueConstraint('summoner_id', 'champion_played', 'game_mode'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    summoner_id = db.Column(db.Integer, db.ForeignKey('summoner.id'), nullable=False)
+    champion_played = db.Column(db.String(20), nullable=False)
+    game_mode = db.Column(db.Integer, nullable=False)
+
+    games = db.Column(db.Integer, default=0)
+    wins = db.Column(db.Integer, default=0)
+    kills = db.Column(db.Integer, default=0)
+    deaths = db.Column(db.Integer, default=0)
+    assists = db.Column(db.Integer, default=0)
+    # sum of every game's kda, divided by games gives the average kda
+    kda_total = db.Column(db.Float, default=0)
+
+    def __repr__(self):
+        return (
+            "SummonerChampionStats<{0.summoner_context}, {0.champion_played} "
+            "in {0.queue_type}: {0.games} games>"
+        ).format(self)
+
+    @property
+    def queue_type(self):
+        return QUEUE_TYPE[self.game_mode]
+
 
 class Match(db.Model):
     '''
@@ -185,22 +341,37 @@ class Match(db.Model):
         they're tied to the summoner table as match history.
     '''
     id = db.Column(db.Integer, primary_key=True)
-    match_id = db.Column(db.BigInteger)
+    match_id = db.Column(db.BigInteger, index=True, unique=True)
     # consider storing the game_mode as a string representation
     game_mode = db.Column(db.Integer)
     timestamp = db.Column(db.Float)
+    # seconds
+    duration = db.Column(db.Integer)
     # this column should return a list of players from a game instance
     # i.e.
     #       match = Match.query.filter_by(match_id)
     #       print(match.participants) -> [<Player 1>, <Player 2>, ..., etc.]
     participants = db.relationship('Player', backref='game_context', lazy='dynamic')
+    # the same players as a plain list, so they can be loaded along with the match.
+    # read only, players are added through participants
+    roster = db.relationship('Player', viewonly=True)
 
     def __repr__(self):
         return "Match<ID: {0.match_id}, Mode: {0.queue_type}>".format(self)
 
+    @classmethod
+    def with_players(cls, match_ids):
+        '''
+        matches by their match ids, the players of all of them
+        are loaded in one more query instead of one per match
+        '''
+        return cls.query.options(
+            db.selectinload(cls.roster)
+        ).filter(cls.match_id.in_(match_ids))
+
     @property
     def players(self):
-        return self.participants.all()
+        return list(self.roster)
 
     @property
     def date(self):
@@ -216,11 +387,10 @@ class Match(db.Model):
         return any(p.name == player_name for p in self.players)
 
     def get_player(self, player_name):
-        if self.contains_player:
-            self.participants.filter_by(name=player_name).first()
+        return next((p for p in self.players if p.name == player_name), None)
 
 
-class Player(db.Model):
+class Player(InGameStats, db.Model):
     '''
     Database model that is distinct from a summoner in the sense
     that a summoner refers to general account information.
@@ -232,6 +402,15 @@ class Player(db.Model):
     This table will contain in-game related columns
     such as items as well as other in-game related stats.
     '''
+    __table_args__ = (
+        db.UniqueConstraint('game_id', 'participant_id',
+                            name='uq_player_game_id_participant_id'),
+        # a summoner's own entry in a match
+        db.Index('ix_player_game_id_name', 'game_id', 'name'),
+        # every game of a summoner, for champion stats rebuilds
+        db.Index('ix_player_name', 'name'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     game_id = db.Column(db.Integer, db.ForeignKey('match.id'))
 
@@ -239,26 +418,27 @@ class Player(db.Model):
     name = db.Column(db.String(32))
     indexed_name = db.Column(db.String(32))
     current_rank = db.Column(db.String(20))
-    # consider storing the champion as a string instead of it's id.
-    champion_played = db.Column(db.String(20))
+    # riot's ids, this is by far the largest table.
+    # see the champion_played, spell1, spell2 and items properties for their names
+    champion_id = db.Column(db.SmallInteger)
     champion_level = db.Column(db.Integer)
     win = db.Column(db.Boolean)
     team_id = db.Column(db.Integer)         # 100 - blue, 200 - red
     participant_id = db.Column(db.Integer)
 
     # summoner spells
-    spell1 = db.Column(db.String(10))
-    spell2 = db.Column(db.String(10))
-
-    # items
-    item1 = db.Column(db.String(5))
-    item2 = db.Column(db.String(5))
-    item3 = db.Column(db.String(5))
-    item4 = db.Column(db.String(5))
-    item5 = db.Column(db.String(5))
-    item6 = db.Column(db.String(5))
+    spell1_id = db.Column(db.SmallInteger)
+    spell2_id = db.Column(db.SmallInteger)
+
+    # items, 0 is an empty slot
+    item1 = db.Column(db.SmallInteger)
+    item2 = db.Column(db.SmallInteger)
+    item3 = db.Column(db.SmallInteger)
+    item4 = db.Column(db.SmallInteger)
+    item5 = db.Column(db.SmallInteger)
+    item6 = db.Column(db.SmallInteger)
     # ward slot
-    item7 = db.Column(db.String(5))
+    item7 = db.Column(db.SmallInteger)
 
     # kda
     kills = db.Column(db.Integer)
@@ -278,23 +458,8 @@ class Player(db.Model):
         ).format(self)
 
     @property
-    def items(self):
-        return [self.item1, self.item2, self.item3, self.item4, self.item5, self.item6, self.item7]
-
-    @property
-    def avg_kda(self):
-        try:
-            out = (self.kills + self.assists) / self.deaths
-        except ZeroDivisionError:
-            out = self.kills + self.assists
-
-        out = float('{:.2f}'.format(out))
-        return out
-
-    @property
-    def kda(self):
-        fmt = "{0}/{1}/{2}"
-        return fmt.format(self.kills, self.deaths, self.assists)
+    def champion_played(self):
+        return champion_name(self.champion_id)
 
     @property
     def game_mode(self):
@@ -0,0 +1,218 @@
+'''
+profiles of real requests, taken while the app serves them.
+
+a request is profiled when it is picked at random(PROFILE_SAMPLE_RATE, a
+fraction of requests) or when it asks for it with the PROFILE_TOKEN:
+
+    curl -H 'X-Profile: <token>' https://.../summoner/some-name
+    curl -H 'X-Profile: <token>' -H 'X-Profile-Mode: sample' https://...
+
+the whole request is profiled, views, generate_summoner_page_context and
+rendering included, and written to PROFILE_DIR once it's done:
+
+    cprofile    <time>-<endpoint>-<ms>ms.pstats, python -m pstats or snakeviz
+    sample      <time>-<endpoint>-<ms>ms.folded, the request thread's stack
+                every PROFILE_INTERVAL seconds as collapsed stacks for
+                flamegraph.pl or speedscope
+
+only the newest PROFILE_KEEP profiles are kept. a profiled request answers
+with the file name in its X-Profile-File header, see `flask profile show`.
+
+only one request per process is profiled at a time, the rest go by untouched.
+both kinds only see the request's own thread, match stats fetched on other
+threads or the event loop show up as the time spent waiting on them.
+'''
+import cProfile
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from hmac import compare_digest
+
+from flask import current_app, g, request
+
+MODES = ('cprofile', 'sample')
+EXTENSIONS = {'cprofile': '.pstats', 'sample': '.folded'}
+
+# one profile at a time, the profilers are per process
+_busy = threading.Lock()
+
+
+class StackSampler:
+    '''
+    looks at a thread's stack every interval seconds from a thread of its own,
+    counts how often every stack was seen.
+
+    sampler = StackSampler(threading.get_ident())
+    sampler.start()
+    ...
+    sampler.stop()
+    sampler.dump_stats('request.folded')
+    '''
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        # code object -> its frames' name in the stacks
+        self._labels = {}
+        self._prefixes = sorted((path for path in sys.path if path), key=len, reverse=True)
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return "StackSampler<thread: {0.thread_id}, samples: {1}>".format(
+            self, sum(self.stacks.values()))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name='stack-sampler')
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def dump_stats(self, path):
+        # collapsed stacks: outermost frame first, frames split by ';', then the count
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('{} {}\n'.format(';'.join(stack), count))
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = '{} ({}:{})'.format(
+                code.co_name, _short_path(code.co_filename, self._prefixes), code.co_firstlineno)
+        return label
+
+
+def _short_path(path, prefixes):
+    # drop the site-packages/stdlib prefix so stacks stay readable
+    for prefix in prefixes:
+        if path.startswith(prefix):
+            return os.path.relpath(path, prefix)
+    return path
+
+
+def requested_mode():
+    '''
+    the mode to profile the current request with, None if it isn't profiled.
+    an X-Profile header only counts with the right token
+    '''
+    config = current_app.config
+    token = config['PROFILE_TOKEN']
+    header = request.headers.get('X-Profile')
+    if token and header and compare_digest(header, token):
+        mode = request.headers.get('X-Profile-Mode', config['PROFILE_MODE'])
+        return mode if mode in MODES else config['PROFILE_MODE']
+    if config['PROFILE_SAMPLE_RATE'] and random.random() < config['PROFILE_SAMPLE_RATE']:
+        return config['PROFILE_MODE']
+    return None
+
+
+def _start_request():
+    mode = requested_mode()
+    if mode is None or not _busy.acquire(blocking=False):
+        return
+
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler(a debugger, coverage) holds the interpreter's hook
+            _busy.release()
+            return
+    else:
+        profiler = StackSampler(threading.get_ident(), current_app.config['PROFILE_INTERVAL'])
+        profiler.start()
+    g.profile = (mode, profiler, time.perf_counter())
+
+
+def _finish_request(response):
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+
+    mode, profiler, started = profile
+    try:
+        if mode == 'cprofile':
+            profiler.disable()
+        else:
+            profiler.stop()
+        elapsed = time.perf_counter() - started
+        name = save(profiler, mode, request.endpoint or 'unmatched', elapsed)
+    finally:
+        _busy.release()
+    response.headers['X-Profile-File'] = name
+    return response
+
+
+def _abandon_request(error=None):
+    # the request blew up before after_request, don't leave the profiler running
+    profile = g.pop('profile', None)
+    if profile is not None:
+        mode, profiler, _ = profile
+        if mode == 'cprofile':
+            profiler.disable()
+        else:
+            profiler.stop()
+        _busy.release()
+
+
+def profile_dir(app=None):
+    app = app or current_app
+    return app.config['PROFILE_DIR'] or os.path.join(app.instance_path, 'profiles')
+
+
+def save(profiler, mode, endpoint, elapsed):
+    '''write a profile to the profile directory, returns its file name'''
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    name = '{}-{}-{}ms{}'.format(datetime.utcnow().strftime('%Y%m%dT%H%M%S.%f'),
+                                 endpoint, int(elapsed * 1000), EXTENSIONS[mode])
+    profiler.dump_stats(os.path.join(directory, name))
+    rotate(directory, current_app.config['PROFILE_KEEP'])
+    return name
+
+
+def profiles(directory):
+    '''names of the profiles in directory, oldest first'''
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    # names start with the time they were taken
+    return sorted(name for name in names if name.endswith(tuple(EXTENSIONS.values())))
+
+
+def rotate(directory, keep):
+    for name in profiles(directory)[:-max(keep, 1)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            # another worker process rotated it away first
+            pass
+
+
+def init_app(app):
+    '''profile requests when the config asks for it, see create_app'''
+    config = app.config
+    if not (config['PROFILE_SAMPLE_RATE'] or config['PROFILE_TOKEN']):
+        return
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_abandon_request)
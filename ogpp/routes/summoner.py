@@ -2,12 +2,15 @@
 
 from functools import wraps
 
-from flask import Blueprint, redirect, url_for, request, render_template
+from flask import Blueprint, abort, jsonify, redirect, url_for, request, render_template
 
 from ..forms import SummonerSearchForm, SummonerSelectForm
 from ..helpers import generate_summoner_page_context, get_champion_masteries
-from ..helpers import update_summoner_page
+from ..helpers import get_match_detail
 from ..helpers import slug
+from ..helpers.storage import sanitize_name
+from ..idle.refresh import enqueue_refresh, latest_job, exportable
+from ..models import Summoner
 
 summoner_bp = Blueprint('summoner', __name__, url_prefix='/summoner')
 
@@ -56,6 +59,9 @@ def summoner(name, summoner_form):
     page = request.args.get('page', 1, type=int)
     queue_type = request.args.get('queue', 'all', type=str)
     champion = request.args.get('champion', 'all', type=str)
+    # cursors of the previous/next page links
+    after = request.args.get('after', type=str)
+    before = request.args.get('before', type=str)
     select_form = SummonerSelectForm(queues=queue_type, champions=champion)
     if select_form.validate_on_submit():
         queue_type = select_form.queues.data
@@ -64,7 +70,8 @@ def summoner(name, summoner_form):
                                 name=name, queue=queue_type,
                                 champion=champion))
 
-    page_items = generate_summoner_page_context(name, page, champion, queue_type)
+    page_items = generate_summoner_page_context(name, page, champion, queue_type,
+                                                after=after, before=before)
 
     return render_template('summoner.html',
                            summoner_form=summoner_form,
@@ -73,7 +80,16 @@ def summoner(name, summoner_form):
                            matches=page_items.matches,
                            page_urls=page_items.page_urls,
                            title=page_items.title,
-                           ranked_stats=page_items.ranked_stats)
+                           ranked_stats=page_items.ranked_stats,
+                           refreshing=page_items.refreshing)
+
+
+@summoner_bp.route('/<name>/match/<int:match_id>')
+@slug_summoner_url
+def match_detail(name, match_id):
+    '''both teams of a match, fetched by the summoner page when a match is expanded'''
+    match = get_match_detail(name, match_id)
+    return render_template('summoner/_match_detail.html', match=match)
 
 
 @summoner_bp.route('/<name>/masteries', methods=['GET', 'POST'])
@@ -86,8 +102,32 @@ def masteries(name, summoner_form):
     return render_template('masteries.html', masteries=masteries, summoner_form=summoner_form)
 
 
+def stored_summoner_or_404(name):
+    summoner = Summoner.query.filter_by(indexed_name=sanitize_name(name)).first()
+    if summoner is None:
+        abort(404)
+    return summoner
+
+
 @summoner_bp.route('/<name>/refresh')
 @slug_summoner_url
 def refresh(name):
-    update_summoner_page(name)
+    '''
+    queue the summoner's refresh and return straight away, see idle/refresh.py.
+    the page asks for json and polls refresh_status, without javascript
+    we're just sent back to the page.
+    '''
+    # a click fetches everything, not only what's past its ttl
+    job = enqueue_refresh(stored_summoner_or_404(name), force=True)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(exportable(job)), 202
     return redirect(url_for('summoner.summoner', name=name))
+
+
+@summoner_bp.route('/<name>/refresh/status')
+@slug_summoner_url
+def refresh_status(name):
+    job = latest_job(stored_summoner_or_404(name))
+    if job is None:
+        abort(404)
+    return jsonify(exportable(job))